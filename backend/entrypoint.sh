@@ -15,6 +15,14 @@ echo ""
 echo "PASO 0: Verificando conexion a base de datos..."
 python wait-for-db.py
 
+# ROL=worker: sólo la cola de reportes (python manage.py procesar_reportes),
+# para correrla como servicio aparte con la misma imagen
+if [ "${ROL:-web}" = "worker" ]; then
+  echo ""
+  echo "Iniciando worker de reportes..."
+  exec python manage.py procesar_reportes --hilos "${REPORTES_HILOS:-2}"
+fi
+
 echo ""
 echo "PASO 1: Recolectando archivos estáticos..."
 python manage.py collectstatic --noinput || true
@@ -35,7 +43,22 @@ else:
     print('   Superusuario ya existe')
 EOF
 
+# Sin un servicio worker aparte, los reportes en segundo plano y los
+# refrescos pendientes de ResumenDiario los procesa un worker en este mismo
+# contenedor (se reinicia si termina). REPORTES_WORKER=0 lo desactiva.
+if [ "${REPORTES_WORKER:-1}" = "1" ]; then
+  echo ""
+  echo "PASO 4: Iniciando worker de reportes en segundo plano..."
+  (
+    while true; do
+      python manage.py procesar_reportes --hilos "${REPORTES_HILOS:-2}" || true
+      echo "   Worker de reportes terminado; se reinicia en 5s"
+      sleep 5
+    done
+  ) &
+fi
+
 echo ""
-echo "PASO 4: Iniciando servidor Gunicorn..."
+echo "PASO 5: Iniciando servidor Gunicorn..."
 PORT=${PORT:-8080}
 exec gunicorn config.wsgi:application --bind 0.0.0.0:$PORT --workers 2 --timeout 120 --access-logfile - --error-logfile -
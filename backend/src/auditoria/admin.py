@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, PlatoPlantilla, IngredientePlantilla
+from . import nutrientes
+from .models import (
+    Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, PlatoPlantilla, IngredientePlantilla,
+    RegistroEliminado, TrabajoReporte, ContadorEstadistica, ResumenPendiente,
+)
 
 
 @admin.register(Institucion)
@@ -32,16 +36,17 @@ class IngredientePlatoInline(admin.TabularInline):
 @admin.register(PlatoObservado)
 class PlatoObservadoAdmin(admin.ModelAdmin):
     list_display = ['nombre', 'visita', 'tipo_plato', 'energia_kcal_total', 'proteinas_g_total']
+    list_select_related = ['visita__institucion']  # VisitaAuditoria.__str__ usa la institución
     list_filter = ['tipo_plato']
     search_fields = ['nombre', 'visita__institucion__nombre']
     inlines = [IngredientePlatoInline]
-    readonly_fields = ['energia_kcal_total', 'proteinas_g_total', 'grasas_totales_g_total',
-                      'carbohidratos_g_total', 'fibra_g_total', 'sodio_mg_total']
+    readonly_fields = nutrientes.CAMPOS_TOTAL
 
 
 @admin.register(IngredientePlato)
 class IngredientePlatoAdmin(admin.ModelAdmin):
     list_display = ['plato', 'alimento', 'cantidad', 'unidad', 'energia_kcal']
+    list_select_related = ['plato__visita__institucion', 'alimento']
     search_fields = ['plato__nombre', 'alimento__nombre']
 
 
@@ -57,11 +62,37 @@ class PlatoPlantillaAdmin(admin.ModelAdmin):
     list_filter = ['tipo_plato', 'activo']
     search_fields = ['nombre', 'descripcion']
     inlines = [IngredientePlantillaInline]
-    readonly_fields = ['energia_kcal_total', 'proteinas_g_total', 'grasas_totales_g_total',
-                      'carbohidratos_g_total', 'fibra_g_total', 'sodio_mg_total']
+    readonly_fields = nutrientes.CAMPOS_TOTAL
 
 
 @admin.register(IngredientePlantilla)
 class IngredientePlantillaAdmin(admin.ModelAdmin):
     list_display = ['plato_plantilla', 'alimento', 'cantidad', 'unidad']
     search_fields = ['plato_plantilla__nombre', 'alimento__nombre']
+
+
+@admin.register(RegistroEliminado)
+class RegistroEliminadoAdmin(admin.ModelAdmin):
+    list_display = ['modelo', 'objeto_id', 'eliminado_en']
+    list_filter = ['modelo']
+
+
+@admin.register(TrabajoReporte)
+class TrabajoReporteAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'estado', 'intentos', 'creado_en', 'terminado_en']
+    list_filter = ['tipo', 'estado']
+    readonly_fields = ['huella', 'firma_datos', 'resultado', 'error', 'iniciado_en', 'terminado_en']
+
+
+@admin.register(ContadorEstadistica)
+class ContadorEstadisticaAdmin(admin.ModelAdmin):
+    list_display = ['clave', 'valor', 'actualizado_en']
+    search_fields = ['clave']
+    readonly_fields = ['clave', 'valor', 'actualizado_en']
+
+
+@admin.register(ResumenPendiente)
+class ResumenPendienteAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'institucion_id', 'tipo_comida', 'marcado_en']
+    list_filter = ['tipo_comida']
+    readonly_fields = ['fecha', 'institucion_id', 'tipo_comida', 'marcado_en']
@@ -5,3 +5,11 @@ class AuditoriaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auditoria'
     verbose_name = 'Auditoría'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .bulk import verificar_modo_autoincremento
+
+        connection_created.connect(verificar_modo_autoincremento, dispatch_uid='auditoria.autoincremento')
@@ -0,0 +1,26 @@
+"""Lectura de parámetros de los reportes y exportaciones (query params o comandos); los inválidos levantan ValueError."""
+import datetime
+
+
+def fecha(valor):
+    if isinstance(valor, datetime.date):
+        return valor
+    try:
+        return datetime.date.fromisoformat(str(valor))
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {valor} (se espera AAAA-MM-DD)")
+
+
+def ids(valores):
+    """Ids de institución, ordenados y sin repetir."""
+    try:
+        return sorted({int(valor) for valor in valores})
+    except (TypeError, ValueError):
+        raise ValueError(f"Ids de institución inválidos: {', '.join(map(str, valores))}")
+
+
+def lista(valor):
+    """Lista separada por comas, o None si viene vacía."""
+    if not valor:
+        return None
+    return [parte.strip() for parte in str(valor).split(',') if parte.strip()]
@@ -0,0 +1,105 @@
+import logging
+from itertools import islice
+
+from django.db import connections, router, transaction
+from django.db.models.sql import InsertQuery
+
+logger = logging.getLogger(__name__)
+
+# El aviso de innodb_autoinc_lock_mode se emite una sola vez por proceso
+_modo_verificado = False
+
+
+def en_lotes(iterable, tamano):
+    """Parte un iterable en listas de a lo sumo `tamano` elementos."""
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def _paso_autoincremento(connection):
+    """
+    Paso entre los ids de un INSERT de varias filas, o None si no son
+    consecutivos: en InnoDB sólo lo son con innodb_autoinc_lock_mode 0 ó 1 (en
+    2, el valor por defecto de MySQL 8, dos INSERT concurrentes pueden
+    intercalar sus ids). Se consulta una vez por conexión (las variables sólo
+    cambian reiniciando el servidor).
+    """
+    if not hasattr(connection, '_paso_autoincremento'):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment')
+            modo, paso = cursor.fetchone()
+        connection._paso_autoincremento = int(paso) if int(modo) in (0, 1) else None
+    return connection._paso_autoincremento
+
+
+def verificar_modo_autoincremento(sender, connection, **kwargs):
+    """
+    Receptor de connection_created: avisa una vez por proceso si MySQL corre
+    con innodb_autoinc_lock_mode 2, en el que bulk_create_con_ids inserta fila
+    por fila (requisito de despliegue documentado en el README).
+    """
+    global _modo_verificado
+    if _modo_verificado or connection.vendor != 'mysql':
+        return
+    _modo_verificado = True
+    if _paso_autoincremento(connection) is None:
+        logger.warning(
+            "MySQL corre con innodb_autoinc_lock_mode=2: sync, clonado de plantillas y "
+            "visitas completas insertan los platos de a una fila. Configurar el servidor "
+            "con --innodb-autoinc-lock-mode=1."
+        )
+
+
+def bulk_create_con_ids(modelo, objetos, batch_size=None):
+    """
+    bulk_create que garantiza que cada objeto quede con su pk asignada.
+
+    MySQL no devuelve las filas de un INSERT múltiple. Con ids consecutivos
+    (innodb_autoinc_lock_mode 0 ó 1) se hace un INSERT por lote y los ids se
+    derivan de LAST_INSERT_ID(), que es el id de la primera fila del lote. Con
+    el modo 2 (por defecto en MySQL 8) no hay garantía de ids consecutivos y
+    se inserta fila por fila recuperando el LAST_INSERT_ID de cada una. En
+    todos los caminos se comporta como bulk_create: no se llama a save() ni se
+    emiten señales.
+    """
+    if not objetos:
+        return objetos
+
+    using = router.db_for_write(modelo)
+    connection = connections[using]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return modelo.objects.bulk_create(objetos, batch_size=batch_size)
+
+    meta = modelo._meta
+    campos = [f for f in meta.local_concrete_fields if f is not meta.auto_field]
+    paso = _paso_autoincremento(connection) if connection.vendor == 'mysql' and meta.auto_field else None
+    if paso:
+        tamano = min(batch_size or len(objetos), connection.ops.bulk_batch_size(campos, objetos))
+        with transaction.atomic(using=using, savepoint=False):
+            for lote in en_lotes(objetos, tamano):
+                query = InsertQuery(modelo)
+                query.insert_values(campos, lote)
+                with connection.cursor() as cursor:
+                    for sql, params in query.get_compiler(using=using).as_sql():
+                        cursor.execute(sql, params)
+                    primero = connection.ops.last_insert_id(cursor, meta.db_table, meta.pk.column)
+                for desplazamiento, obj in enumerate(lote):
+                    setattr(obj, meta.auto_field.attname, primero + desplazamiento * paso)
+                    obj._state.adding = False
+                    obj._state.db = using
+        return objetos
+
+    returning_fields = meta.db_returning_fields
+    for obj in objetos:
+        filas = modelo._base_manager._insert(
+            [obj], fields=campos, returning_fields=returning_fields, using=using,
+        )
+        for valor, campo in zip(filas[0], returning_fields):
+            setattr(obj, campo.attname, valor)
+        obj._state.adding = False
+        obj._state.db = using
+    return objetos
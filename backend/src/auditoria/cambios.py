@@ -0,0 +1,126 @@
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, RegistroEliminado
+from .serializers import (
+    InstitucionSerializer,
+    VisitaAuditoriaCambioSerializer,
+    PlatoObservadoCambioSerializer,
+    IngredientePlatoSerializer,
+    RegistroEliminadoSerializer,
+)
+
+
+class CursorVencido(ValueError):
+    """La posición pedida es anterior a la retención de RegistroEliminado."""
+
+
+class FeedCambios:
+    """
+    Feed "cambios desde" para delta-sync de los clientes offline.
+
+    Cada entidad se recorre con paginación keyset sobre (fecha de cambio, id),
+    usando los índices (updated_at, id). El cursor devuelto codifica la última
+    posición de cada entidad y es el high-water mark para la próxima llamada.
+
+    updated_at se fija antes del commit, así que una fila puede hacerse visible
+    con una fecha menor a la ya devuelta. Por eso sólo se recorre hasta
+    now() - CAMBIOS_MARGEN_SEGUNDOS (mayor que la transacción de escritura más
+    larga) y el cursor nunca pasa de ese tope.
+
+    Los borrados se conservan CAMBIOS_RETENCION_DIAS (ver purgar_eliminados);
+    un cursor más viejo que eso levanta CursorVencido y el cliente debe
+    resincronizar completo.
+    """
+    ENTIDADES = [
+        ('instituciones', Institucion.objects.all(), 'updated_at', InstitucionSerializer),
+        ('visitas', VisitaAuditoria.objects.select_related('institucion'), 'updated_at',
+         VisitaAuditoriaCambioSerializer),
+        ('platos', PlatoObservado.objects.all(), 'updated_at', PlatoObservadoCambioSerializer),
+        ('ingredientes', IngredientePlato.objects.select_related('alimento'), 'updated_at',
+         IngredientePlatoSerializer),
+        ('eliminados', RegistroEliminado.objects.all(), 'eliminado_en', RegistroEliminadoSerializer),
+    ]
+    LIMIT_DEFAULT = 500
+    LIMIT_MAX = 1000
+
+    @classmethod
+    def obtener(cls, desde=None, cursor=None, limit=None):
+        posiciones = cls.decodificar_cursor(cursor) if cursor else {}
+        if desde is not None:
+            desde = cls._parse_fecha(desde)
+        limit = min(int(limit or cls.LIMIT_DEFAULT), cls.LIMIT_MAX)
+        if limit < 1:
+            raise ValueError("limit debe ser positivo")
+
+        ahora = timezone.now()
+        fecha_eliminados = posiciones.get('eliminados', (desde, 0))[0]
+        if fecha_eliminados is not None and fecha_eliminados < cls.horizonte_eliminados(ahora):
+            raise CursorVencido("cursor demasiado viejo: resincronizar completo")
+        tope = ahora - timedelta(seconds=settings.CAMBIOS_MARGEN_SEGUNDOS)
+
+        respuesta = {}
+        hay_mas = False
+        for nombre, queryset, campo, serializer_class in cls.ENTIDADES:
+            fecha, ultimo_id = posiciones.get(nombre, (desde, 0))
+            queryset = queryset.filter(**{f'{campo}__lt': tope})
+            if fecha is not None:
+                queryset = queryset.filter(
+                    Q(**{f'{campo}__gt': fecha}) | Q(**{campo: fecha, 'id__gt': ultimo_id})
+                )
+            filas = list(queryset.order_by(campo, 'id')[:limit + 1])
+            if len(filas) > limit:
+                hay_mas = True
+                filas = filas[:limit]
+                posiciones[nombre] = (getattr(filas[-1], campo), filas[-1].id)
+            elif fecha is None or fecha < tope:
+                # Todo lo anterior al tope ya se devolvió: la próxima llamada arranca ahí
+                posiciones[nombre] = (tope, 0)
+            else:
+                posiciones[nombre] = (fecha, ultimo_id)
+            respuesta[nombre] = serializer_class(filas, many=True).data
+
+        respuesta['cursor'] = cls.codificar_cursor(posiciones)
+        respuesta['hay_mas'] = hay_mas
+        return respuesta
+
+    @staticmethod
+    def horizonte_eliminados(ahora=None):
+        return (ahora or timezone.now()) - timedelta(days=settings.CAMBIOS_RETENCION_DIAS)
+
+    @classmethod
+    def purgar_eliminados(cls):
+        """Borra los RegistroEliminado fuera de la retención; devuelve cuántos."""
+        borrados, _ = RegistroEliminado.objects.filter(eliminado_en__lt=cls.horizonte_eliminados()).delete()
+        return borrados
+
+    @staticmethod
+    def codificar_cursor(posiciones):
+        payload = {nombre: [fecha.isoformat(), ultimo_id] for nombre, (fecha, ultimo_id) in posiciones.items()}
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+    @classmethod
+    def decodificar_cursor(cls, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return {
+                nombre: (cls._parse_fecha(fecha), int(ultimo_id))
+                for nombre, (fecha, ultimo_id) in payload.items()
+            }
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError("cursor inválido")
+
+    @staticmethod
+    def _parse_fecha(valor):
+        fecha = parse_datetime(valor)
+        if fecha is None:
+            raise ValueError(f"fecha inválida: {valor}")
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        return fecha
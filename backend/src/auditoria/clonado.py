@@ -0,0 +1,73 @@
+from . import nutrientes, resumenes
+from .bulk import bulk_create_con_ids
+from .matriz import matriz_nutrientes
+from .models import PlatoObservado, IngredientePlato, IngredientePlantilla
+
+
+class ClonadorPlantillas:
+    """
+    Clona platos plantilla a visitas con una cantidad fija de consultas.
+
+    Los aportes de cada ingrediente y los totales de cada plato se calculan en
+    memoria antes de insertar, así que no hace falta recalcular nada después:
+    un SELECT de ingredientes y un bulk_create por tabla (los valores de los
+    alimentos salen de la matriz de nutrientes en memoria).
+    Debe ejecutarse dentro de una transacción.
+
+    Los platos se insertan con bulk_create_con_ids: con innodb_autoinc_lock_mode
+    2 (por defecto en MySQL 8) eso es un INSERT por plato, visitas × plantillas
+    en total (ver el requisito de MySQL en el README).
+    """
+
+    def __init__(self, plantillas):
+        self.plantillas = list(plantillas)
+        self._q_aporte = nutrientes.cuantizadores(IngredientePlato, nutrientes.CAMPOS_APORTE)
+        self._q_total = nutrientes.cuantizadores(PlatoObservado, nutrientes.CAMPOS_TOTAL)
+        self._ingredientes = self._preparar_ingredientes()
+
+    def _preparar_ingredientes(self):
+        """{plantilla_id: [(campos del ingrediente, aporte cuantizado)]}"""
+        filas = list(
+            IngredientePlantilla.objects
+            .filter(plato_plantilla_id__in=[p.id for p in self.plantillas])
+            .order_by('orden', 'id')
+            .values('plato_plantilla_id', 'alimento_id', 'cantidad', 'unidad', 'orden')
+        )
+        vectores = matriz_nutrientes.vectores(fila['alimento_id'] for fila in filas)
+        ingredientes = {p.id: [] for p in self.plantillas}
+        for fila in filas:
+            aporte = nutrientes.calcular_aporte(vectores[fila['alimento_id']], fila['cantidad'])
+            aporte = tuple(
+                self._q_aporte[campo](valor) for campo, valor in zip(nutrientes.CAMPOS_APORTE, aporte)
+            )
+            plantilla_id = fila.pop('plato_plantilla_id')
+            ingredientes[plantilla_id].append((fila, aporte))
+        return ingredientes
+
+    def _totales(self, plantilla):
+        suma = nutrientes.sumar(aporte for _, aporte in self._ingredientes[plantilla.id])
+        return {campo: self._q_total[campo](valor) for campo, valor in nutrientes.como_totales(suma).items()}
+
+    def clonar(self, visitas):
+        """Crea un plato por cada (visita, plantilla) y devuelve los platos creados."""
+        totales = {plantilla.id: self._totales(plantilla) for plantilla in self.plantillas}
+        platos = [
+            PlatoObservado(
+                visita=visita,
+                nombre=plantilla.nombre,
+                tipo_plato=plantilla.tipo_plato,
+                **totales[plantilla.id]
+            )
+            for visita in visitas
+            for plantilla in self.plantillas
+        ]
+        bulk_create_con_ids(PlatoObservado, platos)
+
+        ingredientes = []
+        origen = (plantilla for visita in visitas for plantilla in self.plantillas)
+        for plato, plantilla in zip(platos, origen):
+            for campos, aporte in self._ingredientes[plantilla.id]:
+                ingredientes.append(IngredientePlato(plato=plato, **campos, **nutrientes.como_aporte(aporte)))
+        IngredientePlato.objects.bulk_create(ingredientes, batch_size=1000)
+        resumenes.marcar(resumenes.clave_visita(visita) for visita in visitas)
+        return platos
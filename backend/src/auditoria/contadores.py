@@ -0,0 +1,133 @@
+"""
+Contadores del dashboard (ContadorEstadistica): totales de instituciones
+activas, visitas y platos, y su desglose por tipo. El dashboard los lee con
+una sola consulta, sin COUNT(*) sobre las tablas crudas.
+
+Se mantienen por diferencias:
+  - visitas y platos, en la transacción que refresca ResumenDiario
+    (resumenes.refrescar): la diferencia entre los resúmenes previos y los
+    nuevos. Como todas las escrituras (señales, sync, clonado, alta
+    completa) pasan por ahí, los contadores siempre coinciden con la suma de
+    ResumenDiario. Si un refresco falla no se suma nada y sus claves quedan
+    pendientes hasta que se reintenta;
+  - instituciones, en la transacción que las escribe (señales de Institucion,
+    cuyo save() es atómico, y el sync por lotes).
+reconciliar() los recalcula desde ResumenDiario e Institucion (comando
+reconciliar_contadores, al final de resumenes.reconstruir y periódicamente
+en el worker procesar_reportes) por si algo escribió por fuera.
+
+Claves: 'instituciones', 'instituciones_tipo:<tipo>', 'visitas',
+'visitas_tipo:<tipo_comida>' y 'platos'.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import ContadorEstadistica, Institucion, ResumenDiario
+
+
+def sumar(deltas):
+    """Suma `deltas` ({clave: diferencia}) con UPDATE ... SET valor = valor + d."""
+    # Orden fijo de claves: dos transacciones no se bloquean en orden cruzado
+    for clave in sorted(clave for clave, delta in deltas.items() if delta):
+        contador = ContadorEstadistica.objects.filter(clave=clave)
+        cambios = {'valor': F('valor') + deltas[clave], 'actualizado_en': timezone.now()}
+        if not contador.update(**cambios):
+            ContadorEstadistica.objects.bulk_create([ContadorEstadistica(clave=clave)], ignore_conflicts=True)
+            contador.update(**cambios)
+
+
+def de_resumenes(previos, nuevos):
+    """
+    Diferencias entre resúmenes ({(fecha, institucion_id, tipo_comida):
+    {'visitas': n, 'platos': n, ...}}) antes y después de refrescarlos.
+    """
+    deltas = Counter()
+    for signo, resumenes in ((-1, previos), (1, nuevos)):
+        for (_, _, tipo_comida), campos in resumenes.items():
+            deltas['visitas'] += signo * campos['visitas']
+            deltas[f'visitas_tipo:{tipo_comida}'] += signo * campos['visitas']
+            deltas['platos'] += signo * campos['platos']
+    return deltas
+
+
+def de_instituciones(previos, actuales):
+    """Diferencias entre estados (activo, tipo) de instituciones; None si no existía o ya no existe."""
+    deltas = Counter()
+    for signo, estados in ((-1, previos), (1, actuales)):
+        for estado in estados:
+            if estado is not None and estado[0]:
+                deltas['instituciones'] += signo
+                deltas[f'instituciones_tipo:{estado[1]}'] += signo
+    return deltas
+
+
+def estado_institucion(institucion):
+    return institucion.activo, institucion.tipo
+
+
+def calcular(instituciones, resumenes):
+    """
+    Valores correctos de todos los contadores desde querysets de Institucion
+    y ResumenDiario (2 consultas). Sólo usa nombres de campo, así que sirve
+    también con modelos históricos (migraciones).
+    """
+    valores = Counter()
+    for tipo, cantidad in (
+        instituciones.filter(activo=True).order_by().values_list('tipo').annotate(n=Count('id'))
+    ):
+        valores['instituciones'] += cantidad
+        valores[f'instituciones_tipo:{tipo}'] = cantidad
+    for tipo_comida, visitas, platos in (
+        resumenes.order_by().values_list('tipo_comida')
+        .annotate(v=Sum('visitas'), p=Sum('platos'))
+    ):
+        valores['visitas'] += visitas
+        valores[f'visitas_tipo:{tipo_comida}'] = visitas
+        valores['platos'] += platos
+    return valores
+
+
+def reconciliar(corregir=True):
+    """
+    Compara los contadores con los valores calculados y, si `corregir`, los reemplaza.
+    Devuelve {clave: (guardado, correcto)} de los que difieren.
+    """
+    with transaction.atomic():
+        # Con los contadores bloqueados, los refrescos en curso esperan y suman
+        # su diferencia sobre el valor corregido
+        guardados = dict(ContadorEstadistica.objects.select_for_update().order_by('clave').values_list('clave', 'valor'))
+        correctos = calcular(Institucion.objects.all(), ResumenDiario.objects.all())
+        diferencias = {
+            clave: (guardados.get(clave), correctos.get(clave, 0))
+            for clave in guardados.keys() | correctos.keys()
+            if guardados.get(clave, 0) != correctos.get(clave, 0)
+        }
+        if corregir and diferencias:
+            ContadorEstadistica.objects.filter(clave__in=list(diferencias)).delete()
+            ContadorEstadistica.objects.bulk_create(
+                [ContadorEstadistica(clave=clave, valor=correcto) for clave, (_, correcto) in diferencias.items()]
+            )
+    return diferencias
+
+
+def leer():
+    """Estadísticas del dashboard desde los contadores (1 consulta)."""
+    valores = dict(ContadorEstadistica.objects.values_list('clave', 'valor'))
+
+    def por_tipo(prefijo, campo):
+        filas = [
+            {campo: clave[len(prefijo):], 'count': valor}
+            for clave, valor in valores.items() if clave.startswith(prefijo) and valor > 0
+        ]
+        return sorted(filas, key=lambda fila: (-fila['count'], fila[campo]))
+
+    return {
+        'total_instituciones': valores.get('instituciones', 0),
+        'total_visitas': valores.get('visitas', 0),
+        'total_platos': valores.get('platos', 0),
+        'visitas_por_tipo': por_tipo('visitas_tipo:', 'tipo_comida'),
+        'instituciones_por_tipo': por_tipo('instituciones_tipo:', 'tipo'),
+    }
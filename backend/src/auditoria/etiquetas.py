@@ -0,0 +1,62 @@
+"""
+Etiquetas de caché de los reportes (ver core.cache).
+
+Una escritura sobre una visita o sus platos invalida:
+  'visitas'             reportes sin rango de fechas
+  'mes:AAAA-MM'         reportes globales cuyo rango incluye ese mes
+  'inst:<id>'           reportes de la institución sin rango
+  'inst:<id>:AAAA-MM'   reportes de la institución cuyo rango incluye ese mes
+Los datos de una institución invalidan 'institucion:<id>' e 'instituciones'.
+'reportes' está en todas las entradas y se invalida al reconstruir los resúmenes.
+"""
+import datetime
+
+
+# Rangos más largos se etiquetan como si no tuvieran límite
+MAX_MESES = 36
+
+
+def _mes(fecha):
+    return f'{fecha.year:04d}-{fecha.month:02d}'
+
+
+def de_claves(claves):
+    """Etiquetas a invalidar para claves de ResumenDiario (fecha, institucion_id, tipo_comida)."""
+    etiquetas = {'visitas'}
+    for fecha, institucion_id, _ in claves:
+        etiquetas.add(f'mes:{_mes(fecha)}')
+        etiquetas.add(f'inst:{institucion_id}')
+        etiquetas.add(f'inst:{institucion_id}:{_mes(fecha)}')
+    return etiquetas
+
+
+def meses(fecha_inicio, fecha_fin):
+    """Meses 'AAAA-MM' del rango, o None si está abierto, es inválido o muy largo."""
+    try:
+        inicio = datetime.date.fromisoformat(str(fecha_inicio)[:10])
+        fin = datetime.date.fromisoformat(str(fecha_fin)[:10])
+    except ValueError:
+        return None
+    cantidad = (fin.year - inicio.year) * 12 + fin.month - inicio.month + 1
+    if cantidad > MAX_MESES:
+        return None
+    resultado = []
+    anio, mes = inicio.year, inicio.month
+    for _ in range(max(cantidad, 0)):
+        resultado.append(f'{anio:04d}-{mes:02d}')
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return resultado
+
+
+def de_periodo(fecha_inicio=None, fecha_fin=None, institucion_id=None):
+    """Etiquetas de un reporte sobre visitas en el rango dado (opcionalmente de una institución)."""
+    rango = meses(fecha_inicio, fecha_fin) if fecha_inicio and fecha_fin else None
+    if institucion_id is None:
+        etiquetas = ['visitas'] if rango is None else [f'mes:{m}' for m in rango]
+    else:
+        etiquetas = [f'inst:{institucion_id}'] if rango is None else [f'inst:{institucion_id}:{m}' for m in rango]
+    return ['reportes', *etiquetas]
+
+
+def de_institucion(institucion_id):
+    return [f'institucion:{institucion_id}', 'instituciones']
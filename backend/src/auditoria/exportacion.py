@@ -0,0 +1,186 @@
+"""
+Exportación plana de visitas, platos e ingredientes (CSV y, si está
+instalado openpyxl, XLSX) para los informes al ministerio.
+
+Cada nivel es una fila por registro con las columnas de sus padres
+(ingrediente -> plato -> visita -> institución) y todas las columnas de
+nutrientes. Las filas se leen con values_list por lotes de `tamano_lote`
+ordenados por PK (WHERE id > último): memoria constante sin importar la
+cantidad de filas y en cualquier motor (con mysqlclient, iterator() trae
+igual el resultado completo al cliente). El CSV se emite fila por fila, así
+que el primer byte sale en cuanto se lee el primer lote.
+"""
+import csv
+import datetime
+import tempfile
+
+from . import argumentos, nutrientes
+from .models import VisitaAuditoria, PlatoObservado, IngredientePlato
+
+try:
+    import openpyxl
+except ImportError:  # opcional
+    openpyxl = None
+
+
+TAMANO_LOTE = 2000
+
+COLUMNAS_VISITA = [
+    ('visita_id', 'id'),
+    ('fecha', 'fecha'),
+    ('tipo_comida', 'tipo_comida'),
+    ('institucion_id', 'institucion_id'),
+    ('institucion_codigo', 'institucion__codigo'),
+    ('institucion_nombre', 'institucion__nombre'),
+    ('institucion_tipo', 'institucion__tipo'),
+    ('comuna', 'institucion__comuna'),
+    ('barrio', 'institucion__barrio'),
+    ('formulario_completado', 'formulario_completado'),
+    ('observaciones', 'observaciones'),
+]
+COLUMNAS_PLATO = [
+    ('plato_id', 'id'),
+    ('plato_nombre', 'nombre'),
+    ('tipo_plato', 'tipo_plato'),
+    ('porciones_servidas', 'porciones_servidas'),
+]
+
+
+def _con_prefijo(columnas, prefijo):
+    return [(encabezado, prefijo + campo) for encabezado, campo in columnas]
+
+
+# nivel: (modelo, prefijo hasta la visita, columnas (encabezado, lookup de values_list))
+NIVELES = {
+    'visitas': (VisitaAuditoria, '', COLUMNAS_VISITA),
+    'platos': (
+        PlatoObservado,
+        'visita__',
+        _con_prefijo(COLUMNAS_VISITA, 'visita__') + COLUMNAS_PLATO
+        + [(campo, campo) for campo in nutrientes.CAMPOS_TOTAL],
+    ),
+    'ingredientes': (
+        IngredientePlato,
+        'plato__visita__',
+        _con_prefijo(COLUMNAS_VISITA, 'plato__visita__') + _con_prefijo(COLUMNAS_PLATO, 'plato__')
+        + [
+            ('ingrediente_id', 'id'),
+            ('alimento_id', 'alimento_id'),
+            ('alimento_codigo_argenfood', 'alimento__codigo_argenfood'),
+            ('alimento_nombre', 'alimento__nombre'),
+            ('cantidad', 'cantidad'),
+            ('unidad', 'unidad'),
+            ('orden', 'orden'),
+        ]
+        + [(campo, campo) for campo in nutrientes.CAMPOS_APORTE],
+    ),
+}
+FORMATOS = ('csv', 'xlsx')
+TIPOS_COMIDA = {clave for clave, _ in VisitaAuditoria.TIPO_COMIDA_CHOICES}
+
+# Una celda que empieza así la evalúa Excel como fórmula
+_INICIO_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Exportacion:
+    """
+    Exportación de un nivel con filtros por fecha, institución y tipo de
+    comida. Los filtros inválidos levantan ValueError.
+    """
+
+    def __init__(self, nivel, fecha_desde=None, fecha_hasta=None, instituciones=None, tipos_comida=None,
+                 tamano_lote=TAMANO_LOTE):
+        if nivel not in NIVELES:
+            raise ValueError(f"Nivel inválido: {nivel}. Opciones: {', '.join(NIVELES)}")
+        self.nivel = nivel
+        self.modelo, prefijo, columnas = NIVELES[nivel]
+        self.encabezados = [encabezado for encabezado, _ in columnas]
+        self.campos = [campo for _, campo in columnas]
+        self.tamano_lote = tamano_lote
+        self.exportadas = 0
+
+        filtro = {}
+        if fecha_desde:
+            filtro[f'{prefijo}fecha__gte'] = argumentos.fecha(fecha_desde)
+        if fecha_hasta:
+            filtro[f'{prefijo}fecha__lte'] = argumentos.fecha(fecha_hasta)
+        if instituciones:
+            filtro[f'{prefijo}institucion_id__in'] = argumentos.ids(instituciones)
+        if tipos_comida:
+            tipos = set(tipos_comida)
+            if tipos - TIPOS_COMIDA:
+                raise ValueError(f"Tipo de comida inválido: {', '.join(sorted(tipos - TIPOS_COMIDA))}")
+            filtro[f'{prefijo}tipo_comida__in'] = sorted(tipos)
+        self.queryset = self.modelo.objects.filter(**filtro).order_by()
+
+    @classmethod
+    def desde_parametros(cls, nivel, parametros, **kwargs):
+        """Desde query params: fecha_desde, fecha_hasta, institucion y tipo_comida (listas separadas por comas)."""
+        return cls(
+            nivel,
+            fecha_desde=parametros.get('fecha_desde'),
+            fecha_hasta=parametros.get('fecha_hasta'),
+            instituciones=argumentos.lista(parametros.get('institucion')),
+            tipos_comida=argumentos.lista(parametros.get('tipo_comida')),
+            **kwargs,
+        )
+
+    @property
+    def nombre_archivo(self):
+        return f'{self.nivel}_{datetime.date.today():%Y%m%d}'
+
+    def filas(self):
+        """Tuplas de valores por lote de PK, en el orden de `encabezados`."""
+        ultimo = None
+        while True:
+            queryset = self.queryset if ultimo is None else self.queryset.filter(pk__gt=ultimo)
+            lote = list(queryset.order_by('pk').values_list('pk', *self.campos)[:self.tamano_lote])
+            if not lote:
+                return
+            for fila in lote:
+                self.exportadas += 1
+                yield fila[1:]
+            ultimo = lote[-1][0]
+
+    def csv(self):
+        """Líneas CSV (encabezado primero) listas para un StreamingHttpResponse."""
+        linea = _Linea()
+        escritor = csv.writer(linea)
+        yield escritor.writerow(self.encabezados)
+        for fila in self.filas():
+            yield escritor.writerow([_celda(valor) for valor in fila])
+
+    def xlsx(self, archivo):
+        """
+        Escribe el XLSX en `archivo`. openpyxl en modo write_only no guarda
+        las filas en memoria, pero el zip se arma recién al cerrar.
+        """
+        if openpyxl is None:
+            raise ValueError("El formato xlsx requiere el paquete openpyxl")
+        libro = openpyxl.Workbook(write_only=True)
+        hoja = libro.create_sheet(self.nivel)
+        hoja.append(self.encabezados)
+        for fila in self.filas():
+            hoja.append([_celda(valor) if isinstance(valor, str) else valor for valor in fila])
+        libro.save(archivo)
+
+    def xlsx_temporal(self):
+        """El XLSX en un archivo temporal (en disco pasado cierto tamaño), posicionado al inicio."""
+        archivo = tempfile.SpooledTemporaryFile(max_size=10 * 1024 * 1024)
+        self.xlsx(archivo)
+        archivo.seek(0)
+        return archivo
+
+
+class _Linea:
+    """Destino de csv.writer que devuelve la línea escrita en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _celda(valor):
+    if isinstance(valor, str) and valor.startswith(_INICIO_FORMULA):
+        return "'" + valor
+    return valor
+
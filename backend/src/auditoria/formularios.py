@@ -0,0 +1,79 @@
+"""
+Proyección de VisitaAuditoria.formulario_respuestas en RespuestaFormulario.
+
+El JSON tiene la forma {sección: {pregunta: respuesta}}. Cada respuesta se
+guarda como fila: las booleanas en valor_bool y el resto como texto en
+minúsculas (str(respuesta).lower()), que es exactamente lo que compara el
+filtro de instituciones.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from .models import RespuestaFormulario
+
+
+VALORES_VERDADEROS = ['true', 'si', 'sí', '1', 'yes']
+LARGO_INDICE = 255
+LARGO_CLAVE = 255
+
+
+def filas_respuestas(respuestas):
+    """(seccion, campo, valor, valor_indice, valor_bool) por cada respuesta."""
+    if not isinstance(respuestas, dict):
+        return
+    for seccion, preguntas in respuestas.items():
+        # Sólo las secciones objeto pueden coincidir con un filtro por pregunta
+        if not isinstance(preguntas, dict) or len(seccion) > LARGO_CLAVE:
+            continue
+        for campo, valor in preguntas.items():
+            if len(campo) > LARGO_CLAVE:
+                continue
+            if isinstance(valor, bool):
+                yield seccion, campo, None, None, valor
+            else:
+                texto = str(valor).lower()
+                yield seccion, campo, texto, texto[:LARGO_INDICE], None
+
+
+def proyectar_respuestas(visitas):
+    """Regenera las filas de RespuestaFormulario de las visitas dadas (2 consultas)."""
+    visitas = list(visitas)
+    if not visitas:
+        return
+    RespuestaFormulario.objects.filter(visita__in=[v.pk for v in visitas]).delete()
+    RespuestaFormulario.objects.bulk_create(
+        [
+            RespuestaFormulario(
+                visita_id=visita.pk, seccion=seccion, campo=campo,
+                valor=valor, valor_indice=indice, valor_bool=valor_bool,
+            )
+            for visita in visitas
+            for seccion, campo, valor, indice, valor_bool in filas_respuestas(visita.formulario_respuestas)
+        ],
+        batch_size=1000,
+    )
+
+
+def coincide(valor, valor_bool, esperado):
+    """Misma comparación que se aplicaba sobre el JSON."""
+    if valor_bool is not None:
+        return valor_bool == (esperado.lower() in VALORES_VERDADEROS)
+    return valor == esperado.lower()
+
+
+def condicion_respuestas(filtros):
+    """
+    Q sobre RespuestaFormulario que preselecciona, por índice, las filas que
+    pueden cumplir alguno de `filtros` ({campo: valor esperado}). El
+    resultado se confirma con coincide(): la colación de la base puede ser
+    insensible a mayúsculas y acentos.
+    """
+    return reduce(or_, (
+        Q(campo=campo) & (
+            Q(valor_bool=esperado.lower() in VALORES_VERDADEROS)
+            | Q(valor_indice=esperado.lower()[:LARGO_INDICE])
+        )
+        for campo, esperado in filtros.items()
+    ))
@@ -0,0 +1,103 @@
+"""
+Alta de una visita completa (visita -> platos -> ingredientes) en una sola
+llamada.
+
+La entrada se valida en una pasada con instituciones y alimentos precargados
+(un SELECT por tabla), los aportes y totales se calculan en memoria con la
+matriz de nutrientes y los platos e ingredientes se insertan con bulk_create,
+todo dentro de una transacción. crear_platos también lo usa el generador
+de datos sintéticos.
+"""
+from nutricion.models import AlimentoNutricional
+from . import nutrientes
+from .bulk import bulk_create_con_ids
+from .matriz import matriz_nutrientes
+from .models import Institucion, PlatoObservado, IngredientePlato, VisitaAuditoria
+
+
+def _ids(valores):
+    ids = set()
+    for valor in valores:
+        if isinstance(valor, bool):
+            continue
+        try:
+            ids.add(int(valor))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def contexto_visita_completa(data):
+    """Contexto para VisitaCompletaSerializer: instituciones y alimentos referenciados."""
+    platos = data.get('platos') if isinstance(data, dict) else None
+    platos = [p for p in platos if isinstance(p, dict)] if isinstance(platos, list) else []
+    alimentos = [
+        ingrediente.get('alimento')
+        for plato in platos
+        if isinstance(plato.get('ingredientes'), list)
+        for ingrediente in plato['ingredientes']
+        if isinstance(ingrediente, dict)
+    ]
+    institucion = data.get('institucion') if isinstance(data, dict) else None
+    return {
+        'instituciones': Institucion.objects.in_bulk(_ids([institucion])),
+        'alimentos': AlimentoNutricional.objects.only('id').in_bulk(_ids(alimentos)),
+    }
+
+
+def crear_visita_completa(datos):
+    """
+    Crea la visita, sus platos y sus ingredientes a partir de validated_data
+    de VisitaCompletaSerializer. Debe ejecutarse dentro de una transacción.
+    """
+    datos = dict(datos)
+    platos_datos = datos.pop('platos', [])
+    # save() normal: las señales proyectan las respuestas del formulario y
+    # refrescan el resumen diario al confirmar (ya con los platos insertados)
+    visita = VisitaAuditoria.objects.create(**datos)
+    crear_platos([(visita, platos_datos)])
+    return visita
+
+
+def crear_platos(platos_por_visita):
+    """
+    Inserta con bulk_create los platos e ingredientes de [(visita, [datos del
+    plato con 'ingredientes'])]. Aportes y totales se calculan en memoria con
+    la matriz de nutrientes. No emite señales: quien llama se ocupa de los
+    resúmenes de las visitas.
+    """
+    platos_por_visita = list(platos_por_visita)
+    q_aporte = nutrientes.cuantizadores(IngredientePlato, nutrientes.CAMPOS_APORTE)
+    q_total = nutrientes.cuantizadores(PlatoObservado, nutrientes.CAMPOS_TOTAL)
+    vectores = matriz_nutrientes.vectores(
+        ingrediente['alimento'].pk
+        for _, platos_datos in platos_por_visita
+        for plato in platos_datos
+        for ingrediente in plato.get('ingredientes', [])
+    )
+
+    platos, ingredientes_por_plato = [], []
+    for visita, platos_datos in platos_por_visita:
+        for plato_datos in platos_datos:
+            plato_datos = dict(plato_datos)
+            ingredientes = []
+            for ingrediente in plato_datos.pop('ingredientes', []):
+                aporte = nutrientes.calcular_aporte(vectores[ingrediente['alimento'].pk], ingrediente['cantidad'])
+                aporte = tuple(q_aporte[campo](valor) for campo, valor in zip(nutrientes.CAMPOS_APORTE, aporte))
+                ingredientes.append((ingrediente, aporte))
+            # Totales = suma de los aportes almacenados, como el mantenimiento incremental
+            suma = nutrientes.sumar(aporte for _, aporte in ingredientes)
+            totales = {campo: q_total[campo](valor) for campo, valor in nutrientes.como_totales(suma).items()}
+            platos.append(PlatoObservado(visita=visita, **plato_datos, **totales))
+            ingredientes_por_plato.append(ingredientes)
+
+    bulk_create_con_ids(PlatoObservado, platos)
+    IngredientePlato.objects.bulk_create(
+        [
+            IngredientePlato(plato=plato, **ingrediente, **nutrientes.como_aporte(aporte))
+            for plato, ingredientes in zip(platos, ingredientes_por_plato)
+            for ingrediente, aporte in ingredientes
+        ],
+        batch_size=1000,
+    )
+    return platos
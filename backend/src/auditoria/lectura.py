@@ -0,0 +1,157 @@
+"""
+Camino rápido de lectura para los GET pesados (visitas y platos).
+
+Proyeccion arma la misma representación que un ModelSerializer a partir de
+values(): los conversores de cada campo se toman una sola vez de los campos
+del serializer, y los anidados (platos -> ingredientes) se leen con una
+consulta por nivel agrupada por FK. No se instancia un serializer por
+objeto y el JSON que se renderiza es idéntico byte a byte.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from core.campos import recortar
+
+
+def _identidad(valor):
+    return valor
+
+
+def _conversor(campo):
+    """to_representation del campo, con atajo para los DecimalField habituales."""
+    if (
+        isinstance(campo, serializers.DecimalField)
+        and getattr(campo, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        and not campo.localize
+        and not campo.normalize_output
+        and campo.rounding is None
+        and campo.decimal_places is not None
+    ):
+        # Lo mismo que DecimalField.to_representation sin copiar el contexto
+        # decimal en cada valor: los valores de la base nunca superan max_digits
+        exponente = Decimal(1).scaleb(-campo.decimal_places)
+
+        def convertir(valor):
+            if isinstance(valor, Decimal):
+                return f'{valor.quantize(exponente):f}'
+            return campo.to_representation(valor)
+        return convertir
+    return campo.to_representation
+
+
+class Proyeccion:
+    """Representación de un ModelSerializer (con anidados many=True) desde values()."""
+
+    def __init__(self, serializer):
+        self.modelo = serializer.Meta.model
+        self.pk = self.modelo._meta.pk.attname
+        self.campos = []    # (clave, columna de values() o None si es anidado, conversor)
+        self.anidados = {}  # clave -> (Proyeccion del hijo, FK del hijo al padre)
+        for clave, campo in serializer.fields.items():
+            if campo.write_only:
+                continue
+            if isinstance(campo, serializers.ListSerializer):
+                relacion = self.modelo._meta.get_field(campo.source)
+                self.anidados[clave] = (Proyeccion(campo.child), relacion.field.attname)
+                self.campos.append((clave, None, None))
+            elif isinstance(campo, serializers.PrimaryKeyRelatedField) and campo.pk_field is None:
+                self.campos.append((clave, self.modelo._meta.get_field(campo.source).attname, _identidad))
+            elif isinstance(campo, (serializers.BaseSerializer, serializers.RelatedField,
+                                    serializers.SerializerMethodField, serializers.ReadOnlyField)):
+                raise TypeError(f'{type(serializer).__name__}.{clave}: campo no soportado por Proyeccion')
+            else:
+                self.campos.append((clave, campo.source.replace('.', '__'), _conversor(campo)))
+        self.columnas = list(dict.fromkeys(
+            [self.pk] + [columna for _, columna, _ in self.campos if columna is not None]
+        ))
+
+    def valores(self, queryset, *extra):
+        """El queryset como values() con las columnas que necesita la representación."""
+        return queryset.prefetch_related(None).values(*self.columnas, *extra)
+
+    def representar(self, filas):
+        filas = list(filas)
+        hijos = self._hijos([fila[self.pk] for fila in filas]) if self.anidados and filas else {}
+        resultado = []
+        for fila in filas:
+            representacion = {}
+            for clave, columna, conversor in self.campos:
+                if columna is None:
+                    representacion[clave] = hijos[clave].get(fila[self.pk], [])
+                else:
+                    valor = fila[columna]
+                    # Igual que Serializer.to_representation: None no pasa por el campo
+                    representacion[clave] = None if valor is None else conversor(valor)
+            resultado.append(representacion)
+        return resultado
+
+    def _hijos(self, ids):
+        """{clave: {id del padre: [representaciones]}} de cada anidado."""
+        hijos = {}
+        for clave, (proyeccion, fk) in self.anidados.items():
+            # Mismo orden que el prefetch: el Meta.ordering del hijo
+            filas = list(proyeccion.valores(proyeccion.modelo._default_manager.filter(**{f'{fk}__in': ids}), fk))
+            agrupados = defaultdict(list)
+            for fila, representacion in zip(filas, proyeccion.representar(filas)):
+                agrupados[fila[fk]].append(representacion)
+            hijos[clave] = agrupados
+        return hijos
+
+
+_proyecciones = {}
+
+# Las selecciones (?fields= / ?expand=) vienen del cliente: se acota la caché
+MAX_PROYECCIONES = 256
+
+
+def proyeccion_para(serializer_class, seleccion=None):
+    clave = (serializer_class, None if seleccion is None else seleccion.clave())
+    proyeccion = _proyecciones.get(clave)
+    if proyeccion is None:
+        serializer = serializer_class()
+        if seleccion is not None:
+            recortar(serializer, seleccion)
+        if len(_proyecciones) >= MAX_PROYECCIONES:
+            _proyecciones.clear()
+        proyeccion = _proyecciones[clave] = Proyeccion(serializer)
+    return proyeccion
+
+
+class LecturaRapidaMixin:
+    """
+    list/retrieve de un ModelViewSet servidos con Proyeccion sobre el
+    serializer de la acción. Aplica los mismos filtros, orden y paginación;
+    no se usan permisos a nivel de objeto en esta API. Con
+    CamposDinamicosMixin respeta ?fields= / ?expand=.
+    """
+
+    def get_proyeccion(self):
+        seleccion = self.get_seleccion() if hasattr(self, 'get_seleccion') else None
+        return proyeccion_para(self.get_serializer_class(), seleccion)
+
+    def list(self, request, *args, **kwargs):
+        proyeccion = self.get_proyeccion()
+        queryset = proyeccion.valores(self.filter_queryset(self.get_queryset()))
+        pagina = self.paginate_queryset(queryset)
+        if pagina is not None:
+            return self.get_paginated_response(proyeccion.representar(pagina))
+        return Response(proyeccion.representar(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        proyeccion = self.get_proyeccion()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            filas = proyeccion.valores(queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}))[:1]
+            filas = proyeccion.representar(filas)
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        if not filas:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        return Response(filas[0])
@@ -0,0 +1,245 @@
+import datetime
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from auditoria.clonado import ClonadorPlantillas
+from auditoria.models import VisitaAuditoria, PlatoObservado, PlatoPlantilla
+from auditoria.recalculo import RecalculoTotales, detectar_desvios
+from auditoria.reports import ReportService
+from auditoria.sync import VisitaSincronizador
+from core.benchmark import medir
+from core.cache import invalidar
+from nutricion.models import AlimentoNutricional
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide p50/p95 de latencia y consultas SQL de los endpoints y métodos principales "
+        "(reportes, listados, sync, recálculo, clonado) sobre los datos de la base. Pensado "
+        "para correr en SQLite con datos de generar_datos y comparar antes y después de un cambio. "
+        "Las escrituras se deshacen al terminar cada corrida"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticiones", type=int, default=20, help="Corridas medidas por escenario")
+        parser.add_argument("--calentamiento", type=int, default=2, help="Corridas previas sin medir")
+        parser.add_argument(
+            "--filtro",
+            action="append",
+            default=[],
+            help="Sólo escenarios cuyo nombre contenga este texto (se puede repetir)",
+        )
+        parser.add_argument("--lote-sync", type=int, default=100, help="Visitas por llamada de sync")
+        parser.add_argument(
+            "--con-cache",
+            action="store_true",
+            help="Mide los reportes con la caché caliente (por defecto se invalida antes de cada corrida)",
+        )
+        parser.add_argument("--json", type=str, help="Guarda los resultados en este archivo JSON")
+        parser.add_argument("--listar", action="store_true", help="Sólo lista los escenarios")
+
+    def handle(self, *args, **options):
+        if options["repeticiones"] < 1 or options["calentamiento"] < 0:
+            raise CommandError("--repeticiones debe ser mayor a 0 y --calentamiento no puede ser negativo")
+
+        escenarios = self._escenarios(self._datos(), options)
+        if options["filtro"]:
+            escenarios = [e for e in escenarios if any(f in e[0] for f in options["filtro"])]
+        if options["listar"]:
+            for nombre, _, revertir in escenarios:
+                self.stdout.write(f"  {nombre}{' (escritura)' if revertir else ''}")
+            return
+        if not escenarios:
+            raise CommandError("Ningún escenario coincide con --filtro")
+
+        antes = None if options["con_cache"] else (lambda: invalidar('reportes'))
+        resultados = []
+        self.stdout.write(f"{'escenario':<36} {'p50 ms':>9} {'p95 ms':>9} {'min ms':>9} {'max ms':>9} {'consultas':>10}")
+        # Los throttles por hora cortarían la medición
+        with mock.patch.object(APIView, 'check_throttles', lambda vista, request: None):
+            for nombre, funcion, revertir in escenarios:
+                resultado = medir(
+                    nombre, funcion,
+                    repeticiones=options["repeticiones"],
+                    calentamiento=options["calentamiento"],
+                    revertir=revertir,
+                    antes=antes,
+                )
+                resultados.append(resultado)
+                consultas = str(resultado['consultas'])
+                if resultado['consultas_max'] != resultado['consultas']:
+                    consultas += f" ({resultado['consultas_max']})"
+                self.stdout.write(
+                    f"{nombre:<36} {resultado['p50_ms']:>9.2f} {resultado['p95_ms']:>9.2f} "
+                    f"{resultado['min_ms']:>9.2f} {resultado['max_ms']:>9.2f} {consultas:>10}"
+                )
+
+        if options["json"]:
+            with open(options["json"], 'w', encoding='utf-8') as archivo:
+                json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados guardados en {options['json']}")
+        self.stdout.write(self.style.SUCCESS(f"✓ {len(resultados)} escenarios medidos"))
+
+    def _datos(self):
+        """Ids y fechas de referencia tomados de los datos existentes."""
+        visita = (
+            VisitaAuditoria.objects.annotate(n=Count('platos')).filter(n__gt=0)
+            .order_by('-fecha', '-id').values('id', 'fecha').first()
+        )
+        if visita is None:
+            raise CommandError("No hay visitas con platos. Ejecutar primero generar_datos")
+        instituciones = list(
+            VisitaAuditoria.objects.values_list('institucion', flat=True)
+            .annotate(n=Count('id')).order_by('-n')[:5]
+        )
+        return {
+            'visita': visita['id'],
+            'fecha_fin': visita['fecha'],
+            'fecha_inicio': visita['fecha'] - datetime.timedelta(days=89),
+            'instituciones': instituciones,
+            'visitas': list(VisitaAuditoria.objects.order_by('-id').values_list('id', flat=True)[:10]),
+            'platos': list(PlatoObservado.objects.order_by('id').values_list('id', flat=True)[:500]),
+            'plantillas': list(PlatoPlantilla.objects.order_by('id').values_list('id', flat=True)[:3]),
+            'alimentos': list(AlimentoNutricional.objects.order_by('id').values_list('id', flat=True)[:8]),
+        }
+
+    def _escenarios(self, datos, options):
+        """[(nombre, función, revertir)]"""
+        cliente = APIClient()
+        # Usuario sin guardar: no se escribe nada en la base para autenticar
+        cliente.force_authenticate(get_user_model()(username='benchmark', is_staff=True, is_superuser=True))
+        periodo = {'fecha_inicio': datos['fecha_inicio'].isoformat(), 'fecha_fin': datos['fecha_fin'].isoformat()}
+        rango = f"fecha_inicio={periodo['fecha_inicio']}&fecha_fin={periodo['fecha_fin']}"
+        institucion = datos['instituciones'][0]
+
+        def get(url):
+            def llamar():
+                respuesta = cliente.get(url)
+                if respuesta.status_code != 200:
+                    raise CommandError(f"GET {url}: HTTP {respuesta.status_code}")
+            return llamar
+
+        def post(url, cuerpo, esperado=200):
+            def llamar():
+                respuesta = cliente.post(url, cuerpo(), format='json')
+                if respuesta.status_code != esperado:
+                    raise CommandError(f"POST {url}: HTTP {respuesta.status_code} {respuesta.content[:300]}")
+            return llamar
+
+        def entradas_sync():
+            """Mitad visitas nuevas y mitad actualizaciones, como un lote de la app."""
+            entradas = [
+                {
+                    'local_id': f'benchmark-{numero}',
+                    'institucion': datos['instituciones'][numero % len(datos['instituciones'])],
+                    'fecha': datos['fecha_fin'].isoformat(),
+                    'tipo_comida': 'almuerzo',
+                    'formulario_completado': True,
+                    'formulario_respuestas': {'prestacion': {'servicio_funcionando': True, 'serv_obs': ''}},
+                }
+                for numero in range(options["lote_sync"] - options["lote_sync"] // 2)
+            ]
+            entradas += [
+                {'id': visita_id, 'local_id': f'benchmark-u{visita_id}', 'updated_at': '2999-01-01T00:00:00+00:00',
+                 'observaciones': 'benchmark'}
+                for visita_id in VisitaAuditoria.objects.order_by('id').values_list('id', flat=True)[:options["lote_sync"] // 2]
+            ]
+            return entradas
+
+        def visita_completa():
+            return {
+                'institucion': institucion,
+                'fecha': datos['fecha_fin'].isoformat(),
+                'tipo_comida': 'almuerzo',
+                'formulario_completado': False,
+                'platos': [
+                    {
+                        'nombre': f'Plato {numero}',
+                        'tipo_plato': 'principal',
+                        'ingredientes': [
+                            {'alimento': alimento, 'cantidad': '80.000', 'orden': orden}
+                            for orden, alimento in enumerate(datos['alimentos'], 1)
+                        ],
+                    }
+                    for numero in range(4)
+                ],
+            }
+
+        def recalcular_platos():
+            recalculo = RecalculoTotales(batch_size=250, dry_run=True)
+            for _ in recalculo.recalcular_platos(PlatoObservado.objects.filter(id__in=datos['platos'])):
+                pass
+
+        def verificar_totales():
+            for _ in detectar_desvios(PlatoObservado.objects.filter(id__in=datos['platos']), Decimal('0.01'), 250):
+                pass
+
+        def recalcular_plato():
+            PlatoObservado.objects.get(pk=datos['platos'][0]).recalcular_totales(save=True)
+
+        def sincronizar():
+            VisitaSincronizador().sincronizar(entradas_sync())
+
+        escenarios = [
+            ('api.visitas.lista', get('/api/auditoria/visitas/?limit=50'), False),
+            ('api.visitas.lista_cursor', get('/api/auditoria/visitas/?cursor=&limit=50'), False),
+            ('api.visitas.detalle', get(f"/api/auditoria/visitas/{datos['visita']}/"), False),
+            ('api.platos.lista', get('/api/auditoria/platos/?limit=100'), False),
+            ('api.instituciones.lista', get('/api/auditoria/instituciones/'), False),
+            ('api.cambios', get('/api/auditoria/cambios/?limit=500'), False),
+            ('api.alimentos.lista', get('/api/nutricion/alimentos/?limit=50'), False),
+            ('api.alimentos.buscar', get('/api/nutricion/alimentos/buscar/?q=arroz'), False),
+            ('api.reportes.dashboard', get('/api/auditoria/reportes/dashboard/'), False),
+            ('api.reportes.visitas_periodo', get(f'/api/auditoria/reportes/visitas-periodo/?{rango}'), False),
+            ('api.reportes.institucion', get(f'/api/auditoria/reportes/institucion/{institucion}/'), False),
+            ('api.reportes.ranking', get(f'/api/auditoria/reportes/ranking/?{rango}'), False),
+            ('api.reportes.comparativa', post(
+                '/api/auditoria/reportes/comparativa/', lambda: dict(periodo, institucion_ids=datos['instituciones'])
+            ), False),
+            ('api.reportes.instituciones_filtros', get(
+                f'/api/auditoria/reportes/instituciones-filtros/?{rango}'
+                '&filtro_1_campo=servicio_funcionando&filtro_1_valor=true'
+            ), False),
+            ('api.reportes.region_comuna', get(f'/api/auditoria/reportes/region/comuna/?{rango}'), False),
+            ('api.reportes.region_barrio', get(f'/api/auditoria/reportes/region/barrio/?{rango}'), False),
+            ('api.reportes.region_tipo', get(f'/api/auditoria/reportes/region/tipo/?{rango}'), False),
+            ('api.reportes.tendencias', get(
+                f'/api/auditoria/reportes/tendencias/?{rango}&granularidad=semana&agrupar=tipo_comida'
+            ), False),
+            ('api.visitas.sync', post('/api/auditoria/visitas/sync/', entradas_sync), True),
+            ('api.visitas.completa', post('/api/auditoria/visitas/completa/', visita_completa, 201), True),
+            ('servicio.reportes.dashboard', ReportService.get_dashboard_stats, False),
+            ('servicio.reportes.visitas_periodo', lambda: ReportService.get_visitas_por_periodo(**periodo), False),
+            ('servicio.reportes.institucion', lambda: ReportService.get_reporte_institucion(institucion), False),
+            ('servicio.reportes.ranking', lambda: ReportService.get_ranking_instituciones(**periodo), False),
+            ('servicio.reportes.comparativa', lambda: ReportService.get_comparativa_nutricional(
+                datos['instituciones'], **periodo
+            ), False),
+            ('servicio.sync.visitas', sincronizar, True),
+            ('servicio.recalculo.platos', recalcular_platos, False),
+            ('servicio.verificar_totales', verificar_totales, False),
+            ('modelo.plato.recalcular_totales', recalcular_plato, True),
+        ]
+        if datos['plantillas']:
+            def clonar():
+                plantillas = PlatoPlantilla.objects.in_bulk(datos['plantillas'])
+                visitas = VisitaAuditoria.objects.in_bulk(datos['visitas'])
+                ClonadorPlantillas(plantillas.values()).clonar(list(visitas.values()))
+            escenarios += [
+                ('servicio.clonado.plantillas', clonar, True),
+                ('api.plantillas.clonar', post(
+                    '/api/auditoria/platos-plantilla/clonar/',
+                    lambda: {'plantilla_ids': datos['plantillas'], 'visita_ids': datos['visitas']},
+                    201,
+                ), True),
+            ]
+        else:
+            self.stdout.write(self.style.WARNING("Sin platos plantilla: se omiten los escenarios de clonado"))
+        return escenarios
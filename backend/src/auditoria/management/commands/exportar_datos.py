@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auditoria.exportacion import FORMATOS, NIVELES, TAMANO_LOTE, Exportacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta visitas, platos o ingredientes (con todas las columnas de nutrientes) a CSV "
+        "o XLSX. Lee por lotes con memoria constante, así que sirve para exportaciones completas"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("nivel", choices=list(NIVELES), help="Qué exportar (una fila por registro)")
+        parser.add_argument("--salida", type=str, help="Archivo de salida (por defecto la salida estándar, sólo CSV)")
+        parser.add_argument("--formato", choices=FORMATOS, default="csv", help="csv o xlsx (requiere openpyxl)")
+        parser.add_argument("--fecha-desde", type=str, help="Desde esta fecha (YYYY-MM-DD)")
+        parser.add_argument("--fecha-hasta", type=str, help="Hasta esta fecha (YYYY-MM-DD)")
+        parser.add_argument("--institucion", type=str, help="Ids de institución separados por comas")
+        parser.add_argument("--tipo-comida", type=str, help="Tipos de comida separados por comas")
+        parser.add_argument("--batch-size", type=int, default=TAMANO_LOTE, help="Filas por consulta")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size debe ser mayor a 0")
+        if options["formato"] == "xlsx" and not options["salida"]:
+            raise CommandError("El formato xlsx requiere --salida")
+
+        try:
+            exportacion = Exportacion.desde_parametros(
+                options["nivel"],
+                {
+                    "fecha_desde": options["fecha_desde"],
+                    "fecha_hasta": options["fecha_hasta"],
+                    "institucion": options["institucion"],
+                    "tipo_comida": options["tipo_comida"],
+                },
+                tamano_lote=options["batch_size"],
+            )
+            inicio = time.monotonic()
+            if options["formato"] == "xlsx":
+                exportacion.xlsx(options["salida"])
+            elif options["salida"]:
+                with open(options["salida"], "w", encoding="utf-8", newline="") as archivo:
+                    archivo.writelines(exportacion.csv())
+            else:
+                for linea in exportacion.csv():
+                    self.stdout.write(linea, ending="")
+                return
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {exportacion.exportadas} filas de {options['nivel']} exportadas a {options['salida']} en {time.monotonic() - inicio:.1f}s"
+        ))
@@ -0,0 +1,89 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from auditoria.sinteticos import GeneradorSintetico
+from nutricion.models import AlimentoNutricional
+
+
+CATALOGO_POR_DEFECTO = os.path.join(settings.BASE_DIR, '..', 'fixtures', 'alimentos_inicial.json')
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos (instituciones, visitas, platos e ingredientes) sobre el "
+        "catálogo real de alimentos, para medir rendimiento con el comando benchmark. "
+        "Las instituciones generadas tienen código SIN-NNNNN"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--instituciones", type=int, default=50, help="Instituciones a crear")
+        parser.add_argument("--visitas-por-anio", type=int, default=40, help="Visitas por institución y año")
+        parser.add_argument("--anios", type=int, default=1, help="Años hacia atrás desde hoy")
+        parser.add_argument("--platos-por-visita", type=int, default=3, help="Platos por visita")
+        parser.add_argument("--ingredientes-por-plato", type=int, default=5, help="Ingredientes por plato")
+        parser.add_argument("--plantillas", type=int, default=10, help="Platos plantilla a crear")
+        parser.add_argument("--semilla", type=int, default=1, help="Semilla (mismos datos con la misma semilla)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Visitas por transacción")
+        parser.add_argument(
+            "--catalogo",
+            type=str,
+            default=CATALOGO_POR_DEFECTO,
+            help="Fixture a cargar si el catálogo de alimentos está vacío",
+        )
+        parser.add_argument(
+            "--limpiar",
+            action="store_true",
+            help="Borra antes los datos sintéticos generados previamente",
+        )
+
+    def handle(self, *args, **options):
+        for opcion in ("instituciones", "visitas_por_anio", "anios", "batch_size"):
+            if options[opcion] < 1:
+                raise CommandError(f"--{opcion.replace('_', '-')} debe ser mayor a 0")
+        for opcion in ("platos_por_visita", "ingredientes_por_plato", "plantillas"):
+            if options[opcion] < 0:
+                raise CommandError(f"--{opcion.replace('_', '-')} no puede ser negativo")
+
+        if not AlimentoNutricional.objects.exists():
+            if not os.path.exists(options["catalogo"]):
+                raise CommandError(f"Catálogo vacío y no se encontró el fixture: {options['catalogo']}")
+            self.stdout.write(f"Cargando catálogo desde {options['catalogo']}...")
+            call_command("loaddata", options["catalogo"], verbosity=0)
+
+        if options["limpiar"]:
+            with transaction.atomic():
+                borradas = GeneradorSintetico.limpiar()
+            self.stdout.write(f"  {borradas} instituciones sintéticas borradas")
+
+        generador = GeneradorSintetico(
+            instituciones=options["instituciones"],
+            visitas_por_anio=options["visitas_por_anio"],
+            platos_por_visita=options["platos_por_visita"],
+            ingredientes_por_plato=options["ingredientes_por_plato"],
+            anios=options["anios"],
+            plantillas=options["plantillas"],
+            semilla=options["semilla"],
+            visitas_por_lote=options["batch_size"],
+        )
+        inicio = time.monotonic()
+        pasos = generador.generar()
+        while True:
+            # Un lote por transacción: una corrida interrumpida deja lotes completos
+            with transaction.atomic():
+                paso = next(pasos, None)
+            if paso is None:
+                break
+            etapa, procesados, total = paso
+            self.stdout.write(f"  {etapa}: {procesados}/{total}")
+
+        visitas = options["instituciones"] * options["visitas_por_anio"] * options["anios"]
+        platos = visitas * options["platos_por_visita"]
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {options['instituciones']} instituciones, {visitas} visitas, {platos} platos y "
+            f"{platos * options['ingredientes_por_plato']} ingredientes en {time.monotonic() - inicio:.1f}s"
+        ))
@@ -0,0 +1,126 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from auditoria import contadores, resumenes, trabajos
+from auditoria.cambios import FeedCambios
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa la cola de reportes pesados (TrabajoReporte) en un pool de hilos. Se pueden "
+        "correr varias instancias a la vez: cada trabajo lo toma un solo worker. Cada minuto "
+        "reintenta además los refrescos de ResumenDiario pendientes y periódicamente reconcilia "
+        "los contadores del dashboard"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=2, help="Trabajos en paralelo")
+        parser.add_argument("--intervalo", type=float, default=2.0, help="Segundos entre consultas a la cola vacía")
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            default=600,
+            help="Segundos tras los cuales un trabajo en proceso se considera colgado y se reencola",
+        )
+        parser.add_argument(
+            "--purgar-dias",
+            type=int,
+            default=7,
+            help="Borra los trabajos terminados hace más de estos días (0 para no borrar)",
+        )
+        parser.add_argument(
+            "--reconciliar-cada",
+            type=int,
+            default=60,
+            help="Minutos entre reconciliaciones de los contadores del dashboard (0 para no reconciliar)",
+        )
+        parser.add_argument("--una-vez", action="store_true", help="Procesa lo pendiente y termina")
+
+    def handle(self, *args, **options):
+        if options["hilos"] < 1:
+            raise CommandError("--hilos debe ser mayor a 0")
+        if options["intervalo"] <= 0 or options["timeout"] < 1:
+            raise CommandError("--intervalo y --timeout deben ser mayores a 0")
+        if options["reconciliar_cada"] < 0:
+            raise CommandError("--reconciliar-cada no puede ser negativo")
+
+        self.stdout.write(f"Procesando reportes con {options['hilos']} hilos")
+        procesados = 0
+        en_curso = set()
+        ultimo_mantenimiento = 0
+        self.ultima_reconciliacion = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["hilos"], thread_name_prefix="reporte") as pool:
+            try:
+                while True:
+                    if time.monotonic() - ultimo_mantenimiento > 60:
+                        self._mantenimiento(options)
+                        ultimo_mantenimiento = time.monotonic()
+
+                    libres = options["hilos"] - len(en_curso)
+                    nuevos = trabajos.tomar(libres) if libres else []
+                    en_curso.update(pool.submit(self._ejecutar, trabajo_id) for trabajo_id in nuevos)
+
+                    if not en_curso:
+                        if options["una_vez"]:
+                            break
+                        close_old_connections()
+                        time.sleep(options["intervalo"])
+                        continue
+                    # Con todos los hilos ocupados se espera a que uno se libere
+                    terminados, en_curso = wait(
+                        en_curso,
+                        timeout=None if len(en_curso) >= options["hilos"] else options["intervalo"],
+                        return_when=FIRST_COMPLETED,
+                    )
+                    procesados += len(terminados)
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING(
+                    f"Interrumpido: se terminan {len(en_curso)} trabajos en curso antes de salir"
+                ))
+                wait(en_curso)
+                procesados += len(en_curso)
+
+        self.stdout.write(self.style.SUCCESS(f"✓ {procesados} trabajos procesados"))
+
+    def _ejecutar(self, trabajo_id):
+        try:
+            estado = trabajos.ejecutar(trabajo_id)
+            estilo = {
+                trabajos.COMPLETADO: self.style.SUCCESS,
+                trabajos.DESCARTADO: self.style.WARNING,
+            }.get(estado, self.style.ERROR)
+            self.stdout.write(estilo(f"  Trabajo #{trabajo_id}: {estado}"))
+        finally:
+            # Cada hilo abre su propia conexión
+            connections.close_all()
+
+    def _mantenimiento(self, options):
+        try:
+            refrescados = resumenes.refrescar_pendientes()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"  Error al refrescar resúmenes pendientes: {e}"))
+        else:
+            if refrescados:
+                self.stdout.write(self.style.WARNING(f"  {refrescados} resúmenes pendientes refrescados"))
+        recuperados = trabajos.recuperar_colgados(options["timeout"])
+        if recuperados:
+            self.stdout.write(self.style.WARNING(f"  {recuperados} trabajos colgados reencolados o marcados con error"))
+        if options["purgar_dias"]:
+            borrados = trabajos.purgar(options["purgar_dias"])
+            if borrados:
+                self.stdout.write(f"  {borrados} trabajos viejos borrados")
+        borrados = FeedCambios.purgar_eliminados()
+        if borrados:
+            self.stdout.write(f"  {borrados} registros de borrado fuera de retención purgados")
+        if options["reconciliar_cada"] and time.monotonic() - self.ultima_reconciliacion > options["reconciliar_cada"] * 60:
+            self.ultima_reconciliacion = time.monotonic()
+            try:
+                diferencias = contadores.reconciliar()
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"  Error al reconciliar contadores: {e}"))
+            else:
+                if diferencias:
+                    self.stdout.write(self.style.WARNING(f"  {len(diferencias)} contadores corregidos: {sorted(diferencias)}"))
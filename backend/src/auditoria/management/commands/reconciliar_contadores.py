@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from auditoria import contadores
+from auditoria.models import ResumenDiario, VisitaAuditoria, PlatoObservado
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula los contadores del dashboard desde Institucion y ResumenDiario y corrige "
+        "los que difieran. Los contadores se mantienen solos en cada escritura; usar tras "
+        "cargas masivas por SQL o si se sospecha un desvío"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Sólo informa las diferencias")
+
+    def handle(self, *args, **options):
+        diferencias = contadores.reconciliar(corregir=not options["dry_run"])
+        for clave, (guardado, correcto) in sorted(diferencias.items()):
+            self.stdout.write(f"  {clave}: {guardado} → {correcto}")
+
+        # Los contadores siguen a ResumenDiario: si éste difiere de las tablas crudas hay que reconstruirlo
+        resumen = ResumenDiario.objects.aggregate(visitas=Sum('visitas'), platos=Sum('platos'))
+        crudos = {'visitas': VisitaAuditoria.objects.count(), 'platos': PlatoObservado.objects.count()}
+        for campo, cantidad in crudos.items():
+            if (resumen[campo] or 0) != cantidad:
+                self.stdout.write(self.style.WARNING(
+                    f"ResumenDiario suma {resumen[campo] or 0} {campo} y hay {cantidad}: ejecutar reconstruir_resumenes"
+                ))
+
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS("✓ Contadores correctos"))
+        elif options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{len(diferencias)} contadores difieren (sin cambios por --dry-run)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✓ {len(diferencias)} contadores corregidos"))
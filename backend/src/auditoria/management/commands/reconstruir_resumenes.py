@@ -0,0 +1,50 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auditoria import resumenes
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye ResumenDiario desde visitas y platos. Los resúmenes se mantienen "
+        "solos en cada escritura; usar tras cargas masivas por SQL o para reconciliar"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fecha-desde", type=str, help="Desde esta fecha (YYYY-MM-DD)")
+        parser.add_argument("--fecha-hasta", type=str, help="Hasta esta fecha (YYYY-MM-DD)")
+        parser.add_argument("--dias-por-lote", type=int, default=31, help="Días por transacción")
+        parser.add_argument(
+            "--pendientes",
+            action="store_true",
+            help="Sólo refresca las claves pendientes (refrescos que fallaron o no llegaron a correr)",
+        )
+
+    def handle(self, *args, **options):
+        fechas = {}
+        for opcion in ("fecha_desde", "fecha_hasta"):
+            if options[opcion]:
+                try:
+                    fechas[opcion] = datetime.date.fromisoformat(options[opcion])
+                except ValueError:
+                    raise CommandError(f"Fecha inválida: {options[opcion]}")
+        if options["dias_por_lote"] < 1:
+            raise CommandError("--dias-por-lote debe ser mayor a 0")
+
+        inicio = time.monotonic()
+        if options["pendientes"]:
+            total = resumenes.refrescar_pendientes(antiguedad=0)
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {total} claves pendientes refrescadas en {time.monotonic() - inicio:.1f}s"
+            ))
+            return
+
+        total = 0
+        for desde, hasta, escritos in resumenes.reconstruir(dias_por_lote=options["dias_por_lote"], **fechas):
+            total += escritos
+            self.stdout.write(f"  {desde} → {hasta}: {escritos} resúmenes")
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {total} resúmenes reconstruidos en {time.monotonic() - inicio:.1f}s"
+        ))
@@ -0,0 +1,68 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auditoria.models import PlatoObservado
+from auditoria.recalculo import RecalculoTotales, detectar_desvios
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica que los totales de PlatoObservado coincidan con la suma de los aportes "
+        "de sus ingredientes (los totales se mantienen en forma incremental). "
+        "Pensado para correr periódicamente (cron); con --reparar recalcula los platos desviados"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tolerancia",
+            type=str,
+            default="0.01",
+            help="Diferencia máxima admitida por nutriente",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Platos por lote")
+        parser.add_argument(
+            "--reparar",
+            action="store_true",
+            help="Recalcula aportes y totales de los platos con desvío",
+        )
+        parser.add_argument(
+            "--mostrar",
+            type=int,
+            default=20,
+            help="Cantidad máxima de desvíos a detallar",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            tolerancia = Decimal(options["tolerancia"])
+        except InvalidOperation:
+            raise CommandError("La tolerancia debe ser un número")
+
+        revisados = 0
+        desviados = []
+        for cantidad, desvios in detectar_desvios(PlatoObservado.objects.all(), tolerancia, options["batch_size"]):
+            revisados += cantidad
+            desviados.extend(desvios)
+            self.stdout.write(f"  Revisados: {revisados} (con desvío: {len(desviados)})")
+
+        for plato_id, diferencias in desviados[:options["mostrar"]]:
+            self.stdout.write(f"  PlatoObservado #{plato_id}")
+            for campo, (almacenado, esperado) in diferencias.items():
+                self.stdout.write(f"      {campo}: almacenado {almacenado}, esperado {esperado}")
+
+        if not desviados:
+            self.stdout.write(self.style.SUCCESS("✓ Totales consistentes"))
+            return
+
+        if not options["reparar"]:
+            self.stdout.write(self.style.WARNING(
+                f"{len(desviados)} platos con desvío. Ejecutar con --reparar para corregirlos."
+            ))
+            return
+
+        recalculo = RecalculoTotales(batch_size=options["batch_size"])
+        platos = PlatoObservado.objects.filter(id__in=[plato_id for plato_id, _ in desviados])
+        for progreso in recalculo.recalcular_platos(platos):
+            self.stdout.write(f"  Reparados: {progreso['procesados']}/{progreso['total']}")
+        self.stdout.write(self.style.SUCCESS(f"✓ {len(desviados)} platos reparados"))
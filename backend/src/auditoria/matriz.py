@@ -0,0 +1,80 @@
+"""
+Matriz de nutrientes del catálogo en memoria.
+
+Una fila por alimento con sus valores efectivos cada 100 g en el orden de
+nutrientes.NUTRIENTES (alternativa y None -> 0 ya resueltos), guardados como
+enteros escalados a los decimales de cada columna en un único array('q').
+Los cálculos de aportes leen los vectores de acá en lugar de cargar
+AlimentoNutricional desde el ORM; la matriz se reconstruye cuando cambia la
+versión del catálogo (ver nutricion.catalogo).
+"""
+from array import array
+from decimal import Decimal
+
+from nutricion.catalogo import DerivadoCatalogo
+from nutricion.models import AlimentoNutricional
+from . import nutrientes
+
+
+def _decimales(nutriente):
+    campos = [nutriente.campo_alimento] + ([nutriente.alternativa] if nutriente.alternativa else [])
+    return max(AlimentoNutricional._meta.get_field(campo).decimal_places for campo in campos)
+
+
+class MatrizNutrientes(DerivadoCatalogo):
+
+    def __init__(self):
+        super().__init__()
+        self.decimales = tuple(_decimales(n) for n in nutrientes.NUTRIENTES)
+
+    def construir(self):
+        ancho = len(self.decimales)
+        filas = {}
+        valores = array('q')
+        for fila in AlimentoNutricional.objects.values('id', *nutrientes.CAMPOS_ALIMENTO).order_by('id'):
+            filas[fila['id']] = len(filas) * ancho
+            valores.extend(self._escalar(nutrientes.vector_alimento(fila)))
+        return {'filas': filas, 'valores': valores}
+
+    def _escalar(self, vector):
+        return (int(valor.scaleb(d).to_integral_value()) for valor, d in zip(vector, self.decimales))
+
+    def vector(self, alimento_id):
+        return self.vectores([alimento_id])[alimento_id]
+
+    def vectores(self, alimento_ids):
+        """
+        {alimento_id: vector} de los alimentos pedidos. Los que todavía no
+        están en la matriz (creados en otro proceso hace instantes) se leen
+        de la base sin modificar la matriz.
+        """
+        matriz = self.estado()
+        filas, valores = matriz['filas'], matriz['valores']
+        resultado, faltantes = {}, []
+        for alimento_id in set(alimento_ids):
+            inicio = filas.get(alimento_id)
+            if inicio is None:
+                faltantes.append(alimento_id)
+                continue
+            resultado[alimento_id] = tuple(
+                Decimal(entero).scaleb(-d)
+                for entero, d in zip(valores[inicio:inicio + len(self.decimales)], self.decimales)
+            )
+        if faltantes:
+            for fila in AlimentoNutricional.objects.filter(id__in=faltantes).values('id', *nutrientes.CAMPOS_ALIMENTO):
+                resultado[fila['id']] = nutrientes.vector_alimento(fila)
+        return resultado
+
+    def totales(self, ingredientes, campo_plato):
+        """
+        Como nutrientes.totales_sql, pero sin JOIN al catálogo: lee sólo
+        (plato, alimento, cantidad) de `ingredientes` y suma con la matriz.
+        """
+        filas = list(ingredientes.order_by().values_list(campo_plato, 'alimento_id', 'cantidad'))
+        vectores = self.vectores(alimento_id for _, alimento_id, _ in filas)
+        return nutrientes.totales_en_lote(
+            (plato_id, vectores[alimento_id], cantidad) for plato_id, alimento_id, cantidad in filas
+        )
+
+
+matriz_nutrientes = MatrizNutrientes()
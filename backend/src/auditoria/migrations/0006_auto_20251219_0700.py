@@ -2,25 +2,24 @@ from django.db import migrations, models
 import django.utils.timezone
 
 def add_columns_if_missing(apps, schema_editor):
+    # Las columnas pueden existir ya en bases creadas antes de esta migración.
+    # Se consulta el esquema con la introspección de Django (no SHOW COLUMNS)
+    # para que funcione en cualquier motor, incluido SQLite en desarrollo.
     connection = schema_editor.connection
-    with connection.cursor() as cursor:
-        # Check auditoria_institucion
-        cursor.execute("SHOW COLUMNS FROM auditoria_institucion LIKE 'created_at'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE auditoria_institucion ADD COLUMN created_at datetime(6) NOT NULL")
-        
-        cursor.execute("SHOW COLUMNS FROM auditoria_institucion LIKE 'updated_at'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE auditoria_institucion ADD COLUMN updated_at datetime(6) NOT NULL")
-
-        # Check auditoria_visitaauditoria
-        cursor.execute("SHOW COLUMNS FROM auditoria_visitaauditoria LIKE 'created_at'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE auditoria_visitaauditoria ADD COLUMN created_at datetime(6) NOT NULL")
-            
-        cursor.execute("SHOW COLUMNS FROM auditoria_visitaauditoria LIKE 'updated_at'")
-        if not cursor.fetchone():
-            cursor.execute("ALTER TABLE auditoria_visitaauditoria ADD COLUMN updated_at datetime(6) NOT NULL")
+    for model_name in ('institucion', 'visitaauditoria'):
+        model = apps.get_model('auditoria', model_name)
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            existing = {col.name for col in connection.introspection.get_table_description(cursor, table)}
+        for name, field in (
+            ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+        ):
+            if name in existing:
+                continue
+            # En el modelo histórico: SQLite rehace la tabla a partir de sus campos
+            field.contribute_to_class(model, name)
+            schema_editor.add_field(model, field)
 
 class Migration(migrations.Migration):
 
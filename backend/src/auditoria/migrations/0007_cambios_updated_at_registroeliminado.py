@@ -0,0 +1,58 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0006_auto_20251219_0700'),
+        ('nutricion', '0002_alimentonutricional_nutricion_a_nombre_672b80_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroEliminado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('institucion', 'Institución'), ('visita', 'Visita'), ('plato', 'Plato observado'), ('ingrediente', 'Ingrediente de plato')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('eliminado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Registro eliminado',
+                'verbose_name_plural': 'Registros eliminados',
+                'ordering': ['eliminado_en', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='ingredienteplato',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='platoobservado',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='ingredienteplato',
+            index=models.Index(fields=['updated_at', 'id'], name='auditoria_i_updated_dc0abc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='institucion',
+            index=models.Index(fields=['updated_at', 'id'], name='auditoria_i_updated_a85af7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='platoobservado',
+            index=models.Index(fields=['updated_at', 'id'], name='auditoria_p_updated_28b787_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitaauditoria',
+            index=models.Index(fields=['updated_at', 'id'], name='auditoria_v_updated_7525d5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroeliminado',
+            index=models.Index(fields=['eliminado_en', 'id'], name='auditoria_r_elimina_6b64bf_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0007_cambios_updated_at_registroeliminado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='agua_g_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='calcio_mg_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='fosforo_mg_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='grasas_monoinsat_g_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='grasas_poliinsat_g_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='grasas_saturadas_g_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='hierro_mg_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='potasio_mg_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='vitamina_c_mg_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='platoplantilla',
+            name='zinc_mg_total',
+            field=models.DecimalField(blank=True, decimal_places=3, max_digits=12, null=True),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copia congelada de auditoria.formularios.filas_respuestas: la migración no
+# debe cambiar si cambia el código de la app
+LARGO_CLAVE = 255
+LARGO_INDICE = 255
+
+
+def filas_respuestas(respuestas):
+    """(seccion, campo, valor, valor_indice, valor_bool) por cada respuesta."""
+    if not isinstance(respuestas, dict):
+        return
+    for seccion, preguntas in respuestas.items():
+        if not isinstance(preguntas, dict) or len(seccion) > LARGO_CLAVE:
+            continue
+        for campo, valor in preguntas.items():
+            if len(campo) > LARGO_CLAVE:
+                continue
+            if isinstance(valor, bool):
+                yield seccion, campo, None, None, valor
+            else:
+                texto = str(valor).lower()
+                yield seccion, campo, texto, texto[:LARGO_INDICE], None
+
+
+def proyectar_existentes(apps, schema_editor):
+    VisitaAuditoria = apps.get_model('auditoria', 'VisitaAuditoria')
+    RespuestaFormulario = apps.get_model('auditoria', 'RespuestaFormulario')
+    visitas = (
+        VisitaAuditoria.objects.filter(formulario_respuestas__isnull=False)
+        .values_list('id', 'formulario_respuestas')
+        .iterator(chunk_size=1000)
+    )
+    RespuestaFormulario.objects.bulk_create(
+        (
+            RespuestaFormulario(
+                visita_id=visita_id, seccion=seccion, campo=campo,
+                valor=valor, valor_indice=indice, valor_bool=valor_bool,
+            )
+            for visita_id, respuestas in visitas
+            for seccion, campo, valor, indice, valor_bool in filas_respuestas(respuestas)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0008_platoplantilla_totales_completos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaFormulario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seccion', models.CharField(max_length=255)),
+                ('campo', models.CharField(max_length=255)),
+                ('valor', models.TextField(blank=True, null=True)),
+                ('valor_indice', models.CharField(blank=True, max_length=255, null=True)),
+                ('valor_bool', models.BooleanField(blank=True, null=True)),
+                ('visita', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='respuestas', to='auditoria.visitaauditoria')),
+            ],
+            options={
+                'verbose_name': 'Respuesta de formulario',
+                'verbose_name_plural': 'Respuestas de formulario',
+                'ordering': ['visita', 'seccion', 'campo'],
+                'indexes': [models.Index(fields=['campo', 'valor_indice'], name='auditoria_r_campo_2c5059_idx'), models.Index(fields=['campo', 'valor_bool'], name='auditoria_r_campo_1b1931_idx')],
+            },
+        ),
+        migrations.RunPython(proyectar_existentes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+# Copia congelada de auditoria.resumenes.agregados/guardar con los nutrientes
+# de reporte de ese momento: la migración no debe cambiar si cambia la app.
+# Nutriente: total por plato en PlatoObservado
+TOTALES = {
+    'energia': 'energia_kcal_total',
+    'proteinas': 'proteinas_g_total',
+    'grasas': 'grasas_totales_g_total',
+    'carbohidratos': 'carbohidratos_g_total',
+    'fibra': 'fibra_g_total',
+    'sodio': 'sodio_mg_total',
+}
+CAMPOS_RESUMEN = ['visitas', 'platos', *(f'suma_{n}' for n in TOTALES), *(f'n_{n}' for n in TOTALES)]
+
+
+def agregados(visitas, platos):
+    resumenes = {}
+    for fila in visitas.order_by().values('fecha', 'institucion_id', 'tipo_comida').annotate(n=Count('id')):
+        clave = (fila['fecha'], fila['institucion_id'], fila['tipo_comida'])
+        resumenes[clave] = dict({campo: 0 for campo in CAMPOS_RESUMEN}, visitas=fila['n'])
+
+    anotaciones = {'n': Count('id')}
+    for nutriente, total in TOTALES.items():
+        anotaciones[f'suma_{nutriente}'] = Sum(total)
+        anotaciones[f'n_{nutriente}'] = Count(total)
+    filas = (
+        platos.order_by()
+        .values('visita__fecha', 'visita__institucion_id', 'visita__tipo_comida')
+        .annotate(**anotaciones)
+    )
+    for fila in filas:
+        resumen = resumenes.get((fila['visita__fecha'], fila['visita__institucion_id'], fila['visita__tipo_comida']))
+        if resumen is None:
+            continue
+        resumen['platos'] = fila['n']
+        for campo in CAMPOS_RESUMEN[2:]:
+            resumen[campo] = fila[campo] or 0
+    return resumenes
+
+
+def poblar_resumenes(apps, schema_editor):
+    VisitaAuditoria = apps.get_model('auditoria', 'VisitaAuditoria')
+    PlatoObservado = apps.get_model('auditoria', 'PlatoObservado')
+    ResumenDiario = apps.get_model('auditoria', 'ResumenDiario')
+    # La tabla está vacía: no hay conflictos
+    ResumenDiario.objects.bulk_create(
+        [
+            ResumenDiario(fecha=fecha, institucion_id=institucion_id, tipo_comida=tipo_comida, **campos)
+            for (fecha, institucion_id, tipo_comida), campos in agregados(
+                VisitaAuditoria.objects.all(), PlatoObservado.objects.all()
+            ).items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0009_respuestaformulario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo_comida', models.CharField(choices=[('desayuno', 'Desayuno'), ('almuerzo', 'Almuerzo'), ('merienda', 'Merienda'), ('cena', 'Cena'), ('vianda', 'Vianda')], max_length=20)),
+                ('visitas', models.PositiveIntegerField(default=0)),
+                ('platos', models.PositiveIntegerField(default=0)),
+                ('suma_energia', models.DecimalField(decimal_places=3, default=0, max_digits=18)),
+                ('n_energia', models.PositiveIntegerField(default=0)),
+                ('suma_proteinas', models.DecimalField(decimal_places=3, default=0, max_digits=18)),
+                ('n_proteinas', models.PositiveIntegerField(default=0)),
+                ('suma_grasas', models.DecimalField(decimal_places=3, default=0, max_digits=18)),
+                ('n_grasas', models.PositiveIntegerField(default=0)),
+                ('suma_carbohidratos', models.DecimalField(decimal_places=3, default=0, max_digits=18)),
+                ('n_carbohidratos', models.PositiveIntegerField(default=0)),
+                ('suma_fibra', models.DecimalField(decimal_places=3, default=0, max_digits=18)),
+                ('n_fibra', models.PositiveIntegerField(default=0)),
+                ('suma_sodio', models.DecimalField(decimal_places=3, default=0, max_digits=18)),
+                ('n_sodio', models.PositiveIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('institucion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='auditoria.institucion')),
+            ],
+            options={
+                'verbose_name': 'Resumen diario',
+                'verbose_name_plural': 'Resúmenes diarios',
+                'ordering': ['fecha', 'institucion', 'tipo_comida'],
+                'indexes': [models.Index(fields=['institucion', 'fecha'], name='auditoria_r_institu_ec4757_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumendiario',
+            constraint=models.UniqueConstraint(fields=('fecha', 'institucion', 'tipo_comida'), name='resumen_diario_unico'),
+        ),
+        migrations.RunPython(poblar_resumenes, migrations.RunPython.noop),
+    ]
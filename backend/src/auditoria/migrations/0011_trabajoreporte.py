@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:59
+
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0010_resumendiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('comparativa', 'Comparativa nutricional'), ('instituciones_filtros', 'Instituciones con filtros')], max_length=30)),
+                ('parametros', models.JSONField(default=dict)),
+                ('huella', models.CharField(max_length=64)),
+                ('firma_datos', models.CharField(blank=True, default='', max_length=64)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('resultado', models.JSONField(blank=True, encoder=rest_framework.utils.encoders.JSONEncoder, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_en', models.DateTimeField(blank=True, null=True)),
+                ('terminado_en', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de reporte',
+                'verbose_name_plural': 'Trabajos de reporte',
+                'ordering': ['-creado_en', '-id'],
+                'indexes': [models.Index(fields=['estado', 'creado_en'], name='auditoria_t_estado_3283af_idx'), models.Index(fields=['huella', 'estado'], name='auditoria_t_huella_6e28d0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:02
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def calcular(instituciones, resumenes):
+    """Copia congelada de auditoria.contadores.calcular: la migración no debe cambiar si cambia la app."""
+    valores = Counter()
+    for tipo, cantidad in (
+        instituciones.filter(activo=True).order_by().values_list('tipo').annotate(n=Count('id'))
+    ):
+        valores['instituciones'] += cantidad
+        valores[f'instituciones_tipo:{tipo}'] = cantidad
+    for tipo_comida, visitas, platos in (
+        resumenes.order_by().values_list('tipo_comida')
+        .annotate(v=Sum('visitas'), p=Sum('platos'))
+    ):
+        valores['visitas'] += visitas
+        valores[f'visitas_tipo:{tipo_comida}'] = visitas
+        valores['platos'] += platos
+    return valores
+
+
+def poblar_contadores(apps, schema_editor):
+    Institucion = apps.get_model('auditoria', 'Institucion')
+    ResumenDiario = apps.get_model('auditoria', 'ResumenDiario')
+    ContadorEstadistica = apps.get_model('auditoria', 'ContadorEstadistica')
+    valores = calcular(Institucion.objects.all(), ResumenDiario.objects.all())
+    ContadorEstadistica.objects.bulk_create(
+        [ContadorEstadistica(clave=clave, valor=valor) for clave, valor in valores.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0011_trabajoreporte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorEstadistica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=60, unique=True)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Contador de estadística',
+                'verbose_name_plural': 'Contadores de estadísticas',
+                'ordering': ['clave'],
+            },
+        ),
+        migrations.RunPython(poblar_contadores, migrations.RunPython.noop),
+    ]
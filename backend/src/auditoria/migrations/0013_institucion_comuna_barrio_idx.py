@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0012_contadorestadistica'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='institucion',
+            index=models.Index(fields=['comuna', 'barrio', 'activo'], name='auditoria_i_comuna_9b53c5_idx'),
+        ),
+    ]
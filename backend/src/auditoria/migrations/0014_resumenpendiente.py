@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auditoria', '0013_institucion_comuna_barrio_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('institucion_id', models.BigIntegerField()),
+                ('tipo_comida', models.CharField(choices=[('desayuno', 'Desayuno'), ('almuerzo', 'Almuerzo'), ('merienda', 'Merienda'), ('cena', 'Cena'), ('vianda', 'Vianda')], max_length=20)),
+                ('marcado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen pendiente',
+                'verbose_name_plural': 'Resúmenes pendientes',
+                'ordering': ['marcado_en', 'id'],
+                'indexes': [models.Index(fields=['marcado_en'], name='auditoria_r_marcado_6d7204_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumenpendiente',
+            constraint=models.UniqueConstraint(fields=('fecha', 'institucion_id', 'tipo_comida'), name='resumen_pendiente_unico'),
+        ),
+    ]
@@ -1,6 +1,24 @@
-from django.db import models
-from decimal import Decimal
+from django.db import models, router, transaction
+from rest_framework.utils.encoders import JSONEncoder
 from nutricion.models import AlimentoNutricional
+from . import nutrientes
+from .matriz import matriz_nutrientes
+
+
+class GuardadoAtomico(models.Model):
+    """
+    save() en una transacción: lo que escriben las señales de pre/post_save
+    (contadores del dashboard, claves de resumen pendientes) se confirma o se
+    descarta junto con la fila, también en modo autocommit.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
 
 
 class PlatoPlantilla(models.Model):
@@ -22,8 +40,18 @@ class PlatoPlantilla(models.Model):
     proteinas_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
     grasas_totales_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
     carbohidratos_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    agua_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
     fibra_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
     sodio_mg_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    calcio_mg_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    hierro_mg_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    zinc_mg_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    vitamina_c_mg_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    potasio_mg_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    fosforo_mg_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    grasas_saturadas_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    grasas_monoinsat_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
+    grasas_poliinsat_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
 
     class Meta:
         verbose_name = "Plato plantilla"
@@ -38,50 +66,18 @@ class PlatoPlantilla(models.Model):
         return self.nombre
 
     def recalcular_totales(self, save=True):
-        energia = Decimal("0")
-        prot = Decimal("0")
-        grasa = Decimal("0")
-        cho = Decimal("0")
-        fibra = Decimal("0")
-        sodio = Decimal("0")
-
-        for ing in self.ingredientes_plantilla.select_related('alimento').all():
-            factor = (ing.cantidad or 0) / Decimal("100")
-            alimento = ing.alimento
-
-            if alimento.energia_kcal is not None:
-                energia += factor * alimento.energia_kcal
-            if alimento.proteinas_g is not None:
-                prot += factor * alimento.proteinas_g
-            if alimento.grasas_totales_g is not None:
-                grasa += factor * alimento.grasas_totales_g
-            if alimento.carbohidratos_disponibles_g is not None:
-                cho += factor * alimento.carbohidratos_disponibles_g
-            elif alimento.carbohidratos_totales_g is not None:
-                cho += factor * alimento.carbohidratos_totales_g
-            if alimento.fibra_g is not None:
-                fibra += factor * alimento.fibra_g
-            if alimento.sodio_mg is not None:
-                sodio += factor * alimento.sodio_mg
-
-        self.energia_kcal_total = energia
-        self.proteinas_g_total = prot
-        self.grasas_totales_g_total = grasa
-        self.carbohidratos_g_total = cho
-        self.fibra_g_total = fibra
-        self.sodio_mg_total = sodio
+        """Recalcula los totales nutricionales a partir de sus ingredientes y la matriz de nutrientes."""
+        vector = matriz_nutrientes.totales(
+            IngredientePlantilla.objects.filter(plato_plantilla=self), 'plato_plantilla'
+        ).get(self.pk, nutrientes.VECTOR_CERO)
+        totales = nutrientes.como_totales(vector)
+        for campo, valor in totales.items():
+            setattr(self, campo, valor)
 
         if save:
             self.save()
 
-        return {
-            "energia_kcal_total": energia,
-            "proteinas_g_total": prot,
-            "grasas_totales_g_total": grasa,
-            "carbohidratos_g_total": cho,
-            "fibra_g_total": fibra,
-            "sodio_mg_total": sodio,
-        }
+        return totales
 
 
 class IngredientePlantilla(models.Model):
@@ -104,7 +100,7 @@ class IngredientePlantilla(models.Model):
         return f"{self.alimento.nombre} ({self.cantidad}{self.unidad})"
 
 
-class Institucion(models.Model):
+class Institucion(GuardadoAtomico):
     TIPO_CHOICES = [
         ('escuela', 'Escuela'),
         ('cdi', 'CDI'),
@@ -132,13 +128,16 @@ class Institucion(models.Model):
             models.Index(fields=['activo', 'nombre']),
             models.Index(fields=['codigo']),
             models.Index(fields=['comuna', 'activo']),
+            # Reportes por región: agrupa por comuna y barrio sin leer la tabla
+            models.Index(fields=['comuna', 'barrio', 'activo']),
+            models.Index(fields=['updated_at', 'id']),
         ]
 
     def __str__(self):
         return f"{self.nombre} ({self.codigo})"
 
 
-class VisitaAuditoria(models.Model):
+class VisitaAuditoria(GuardadoAtomico):
     TIPO_COMIDA_CHOICES = [
         ("desayuno", "Desayuno"),
         ("almuerzo", "Almuerzo"),
@@ -171,13 +170,14 @@ class VisitaAuditoria(models.Model):
             models.Index(fields=['-fecha']),
             models.Index(fields=['tipo_comida', '-fecha']),
             models.Index(fields=['fecha']),
+            models.Index(fields=['updated_at', 'id']),
         ]
 
     def __str__(self):
         return f"{self.institucion.nombre} - {self.fecha} - {self.get_tipo_comida_display()}"
 
 
-class PlatoObservado(models.Model):
+class PlatoObservado(GuardadoAtomico):
     TIPO_PLATO_CHOICES = [
         ("principal", "Plato principal"),
         ("guarnicion", "Guarnición"),
@@ -221,6 +221,8 @@ class PlatoObservado(models.Model):
     grasas_monoinsat_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
     grasas_poliinsat_g_total = models.DecimalField(max_digits=12, decimal_places=3, null=True, blank=True)
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         verbose_name = "Plato observado"
         verbose_name_plural = "Platos observados"
@@ -228,64 +230,25 @@ class PlatoObservado(models.Model):
         indexes = [
             models.Index(fields=['visita', 'tipo_plato']),
             models.Index(fields=['visita']),
+            models.Index(fields=['updated_at', 'id']),
         ]
 
     def __str__(self):
         return f"{self.nombre} ({self.visita})"
 
     def recalcular_totales(self, save=True):
-        """Recalcula los totales nutricionales del plato sumando todos sus ingredientes."""
-        totales = {
-            'energia': Decimal("0"), 'prot': Decimal("0"), 'grasa': Decimal("0"),
-            'cho': Decimal("0"), 'agua': Decimal("0"), 'fibra': Decimal("0"),
-            'sodio': Decimal("0"), 'calcio': Decimal("0"), 'hierro': Decimal("0"),
-            'zinc': Decimal("0"), 'vitamina_c': Decimal("0"), 'potasio': Decimal("0"),
-            'fosforo': Decimal("0"), 'grasas_sat': Decimal("0"), 'grasas_mono': Decimal("0"),
-            'grasas_poli': Decimal("0")
-        }
-
-        for ing in self.ingredientes.select_related('alimento').all():
-            factor = (ing.cantidad or 0) / Decimal("100")
-            a = ing.alimento
-
-            totales['energia'] += factor * (a.energia_kcal or 0)
-            totales['prot'] += factor * (a.proteinas_g or 0)
-            totales['grasa'] += factor * (a.grasas_totales_g or 0)
-            totales['agua'] += factor * (a.agua_g or 0)
-            totales['cho'] += factor * (a.carbohidratos_disponibles_g or a.carbohidratos_totales_g or 0)
-            totales['fibra'] += factor * (a.fibra_g or 0)
-            totales['sodio'] += factor * (a.sodio_mg or 0)
-            totales['calcio'] += factor * (a.calcio_mg or 0)
-            totales['hierro'] += factor * (a.hierro_mg or 0)
-            totales['zinc'] += factor * (a.zinc_mg or 0)
-            totales['vitamina_c'] += factor * (a.vitamina_c_mg or 0)
-            totales['potasio'] += factor * (a.potasio_mg or 0)
-            totales['fosforo'] += factor * (a.fosforo_mg or 0)
-            totales['grasas_sat'] += factor * (a.grasas_saturadas_g or 0)
-            totales['grasas_mono'] += factor * (a.grasas_monoinsat_g or 0)
-            totales['grasas_poli'] += factor * (a.grasas_poliinsat_g or 0)
-
-        self.energia_kcal_total = totales['energia']
-        self.proteinas_g_total = totales['prot']
-        self.grasas_totales_g_total = totales['grasa']
-        self.carbohidratos_g_total = totales['cho']
-        self.agua_g_total = totales['agua']
-        self.fibra_g_total = totales['fibra']
-        self.sodio_mg_total = totales['sodio']
-        self.calcio_mg_total = totales['calcio']
-        self.hierro_mg_total = totales['hierro']
-        self.zinc_mg_total = totales['zinc']
-        self.vitamina_c_mg_total = totales['vitamina_c']
-        self.potasio_mg_total = totales['potasio']
-        self.fosforo_mg_total = totales['fosforo']
-        self.grasas_saturadas_g_total = totales['grasas_sat']
-        self.grasas_monoinsat_g_total = totales['grasas_mono']
-        self.grasas_poliinsat_g_total = totales['grasas_poli']
+        """Recalcula los totales nutricionales del plato a partir de sus ingredientes y la matriz de nutrientes."""
+        vector = matriz_nutrientes.totales(
+            IngredientePlato.objects.filter(plato=self), 'plato'
+        ).get(self.pk, nutrientes.VECTOR_CERO)
+        totales = nutrientes.como_totales(vector)
+        for campo, valor in totales.items():
+            setattr(self, campo, valor)
 
         if save:
             self.save()
 
-        return {k + '_total': v for k, v in totales.items()}
+        return totales
 
 
 class IngredientePlato(models.Model):
@@ -323,6 +286,8 @@ class IngredientePlato(models.Model):
     grasas_monoinsat_g = models.DecimalField(max_digits=12, decimal_places=5, null=True, blank=True)
     grasas_poliinsat_g = models.DecimalField(max_digits=12, decimal_places=5, null=True, blank=True)
 
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         verbose_name = "Ingrediente de plato"
         verbose_name_plural = "Ingredientes de plato"
@@ -330,58 +295,229 @@ class IngredientePlato(models.Model):
         indexes = [
             models.Index(fields=['plato', 'orden']),
             models.Index(fields=['alimento']),
+            models.Index(fields=['updated_at', 'id']),
         ]
 
     def __str__(self):
         return f"{self.alimento.nombre} ({self.cantidad}{self.unidad})"
 
     def recalcular_aporte(self, save=True):
-        """Calcula y guarda el aporte nutricional de ESTE ingrediente."""
-        factor = self.cantidad / Decimal("100")
-        a = self.alimento
-
-        # Campos comunes
-        self.energia_kcal = factor * (a.energia_kcal or 0)
-        self.proteinas_g = factor * (a.proteinas_g or 0)
-        self.grasas_totales_g = factor * (a.grasas_totales_g or 0)
-        self.agua_g = factor * (a.agua_g or 0)
-
-        if a.carbohidratos_disponibles_g is not None:
-            self.carbohidratos_g = factor * a.carbohidratos_disponibles_g
-        else:
-            self.carbohidratos_g = factor * (a.carbohidratos_totales_g or 0)
-
-        # Campos adicionales
-        self.fibra_g = factor * (a.fibra_g or 0)
-        self.sodio_mg = factor * (a.sodio_mg or 0)
-        self.calcio_mg = factor * (a.calcio_mg or 0)
-        self.hierro_mg = factor * (a.hierro_mg or 0)
-        self.zinc_mg = factor * (a.zinc_mg or 0)
-        self.vitamina_c_mg = factor * (a.vitamina_c_mg or 0)
-        self.potasio_mg = factor * (a.potasio_mg or 0)
-        self.fosforo_mg = factor * (a.fosforo_mg or 0)
-        self.grasas_saturadas_g = factor * (a.grasas_saturadas_g or 0)
-        self.grasas_monoinsat_g = factor * (a.grasas_monoinsat_g or 0)
-        self.grasas_poliinsat_g = factor * (a.grasas_poliinsat_g or 0)
+        """Calcula y guarda el aporte nutricional de ESTE ingrediente (redondeado como en la BD)."""
+        aporte = nutrientes.como_aporte(
+            nutrientes.calcular_aporte(matriz_nutrientes.vector(self.alimento_id), self.cantidad)
+        )
+        cuantizar = nutrientes.cuantizadores(IngredientePlato, nutrientes.CAMPOS_APORTE)
+        for campo, valor in aporte.items():
+            aporte[campo] = cuantizar[campo](valor)
+            setattr(self, campo, aporte[campo])
 
         if save:
             self.save()
 
-        return {
-            "energia_kcal": self.energia_kcal,
-            "proteinas_g": self.proteinas_g,
-            "grasas_totales_g": self.grasas_totales_g,
-            "carbohidratos_g": self.carbohidratos_g,
-            "agua_g": self.agua_g,
-            "fibra_g": self.fibra_g,
-            "sodio_mg": self.sodio_mg,
-            "calcio_mg": self.calcio_mg,
-            "hierro_mg": self.hierro_mg,
-            "zinc_mg": self.zinc_mg,
-            "vitamina_c_mg": self.vitamina_c_mg,
-            "potasio_mg": self.potasio_mg,
-            "fosforo_mg": self.fosforo_mg,
-            "grasas_saturadas_g": self.grasas_saturadas_g,
-            "grasas_monoinsat_g": self.grasas_monoinsat_g,
-            "grasas_poliinsat_g": self.grasas_poliinsat_g,
-        }
+        return aporte
+
+
+class RegistroEliminado(models.Model):
+    """Tombstone de registros borrados, para el feed de cambios (delta-sync)."""
+    MODELO_CHOICES = [
+        ("institucion", "Institución"),
+        ("visita", "Visita"),
+        ("plato", "Plato observado"),
+        ("ingrediente", "Ingrediente de plato"),
+    ]
+
+    modelo = models.CharField(max_length=20, choices=MODELO_CHOICES)
+    objeto_id = models.BigIntegerField()
+    eliminado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Registro eliminado"
+        verbose_name_plural = "Registros eliminados"
+        ordering = ['eliminado_en', 'id']
+        indexes = [
+            models.Index(fields=['eliminado_en', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.modelo} #{self.objeto_id}"
+
+
+class RespuestaFormulario(models.Model):
+    """
+    Proyección normalizada de VisitaAuditoria.formulario_respuestas: una fila
+    por (sección, pregunta) para poder filtrar por respuesta con índices en
+    lugar de recorrer el JSON. Se regenera en cada guardado de la visita
+    (ver formularios.proyectar_respuestas).
+    """
+    visita = models.ForeignKey(
+        VisitaAuditoria,
+        on_delete=models.CASCADE,
+        related_name="respuestas",
+    )
+    seccion = models.CharField(max_length=255)
+    campo = models.CharField(max_length=255)
+    # Texto en minúsculas de respuestas no booleanas; valor_indice son sus
+    # primeros 255 caracteres (indexable en MySQL)
+    valor = models.TextField(null=True, blank=True)
+    valor_indice = models.CharField(max_length=255, null=True, blank=True)
+    valor_bool = models.BooleanField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Respuesta de formulario"
+        verbose_name_plural = "Respuestas de formulario"
+        ordering = ['visita', 'seccion', 'campo']
+        indexes = [
+            models.Index(fields=['campo', 'valor_indice']),
+            models.Index(fields=['campo', 'valor_bool']),
+        ]
+
+    def __str__(self):
+        return f"{self.seccion}.{self.campo}"
+
+
+class ResumenDiario(models.Model):
+    """
+    Agregado por (fecha, institución, tipo de comida) que leen los reportes.
+    Se refresca de forma incremental cuando cambian visitas o platos (ver
+    resumenes.py) y puede reconstruirse con `reconstruir_resumenes`.
+
+    Para cada nutriente de reporte se guardan la suma de los totales por plato
+    y la cantidad de platos con ese total informado, de modo que el promedio
+    (suma / n) coincide con AVG() sobre los platos.
+    """
+    fecha = models.DateField()
+    institucion = models.ForeignKey(
+        Institucion,
+        on_delete=models.CASCADE,
+        related_name="resumenes",
+    )
+    tipo_comida = models.CharField(max_length=20, choices=VisitaAuditoria.TIPO_COMIDA_CHOICES)
+    visitas = models.PositiveIntegerField(default=0)
+    platos = models.PositiveIntegerField(default=0)
+
+    suma_energia = models.DecimalField(max_digits=18, decimal_places=3, default=0)
+    n_energia = models.PositiveIntegerField(default=0)
+    suma_proteinas = models.DecimalField(max_digits=18, decimal_places=3, default=0)
+    n_proteinas = models.PositiveIntegerField(default=0)
+    suma_grasas = models.DecimalField(max_digits=18, decimal_places=3, default=0)
+    n_grasas = models.PositiveIntegerField(default=0)
+    suma_carbohidratos = models.DecimalField(max_digits=18, decimal_places=3, default=0)
+    n_carbohidratos = models.PositiveIntegerField(default=0)
+    suma_fibra = models.DecimalField(max_digits=18, decimal_places=3, default=0)
+    n_fibra = models.PositiveIntegerField(default=0)
+    suma_sodio = models.DecimalField(max_digits=18, decimal_places=3, default=0)
+    n_sodio = models.PositiveIntegerField(default=0)
+
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumen diario"
+        verbose_name_plural = "Resúmenes diarios"
+        ordering = ['fecha', 'institucion', 'tipo_comida']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'institucion', 'tipo_comida'],
+                name='resumen_diario_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['institucion', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.institucion_id} - {self.tipo_comida}"
+
+
+class ResumenPendiente(models.Model):
+    """
+    Clave de ResumenDiario a refrescar. Se registra en la misma transacción
+    que la escritura y se borra en la del refresco: si el refresco falla o el
+    proceso muere, queda acá y se reintenta (resumenes.refrescar_pendientes).
+    """
+    fecha = models.DateField()
+    institucion_id = models.BigIntegerField()
+    tipo_comida = models.CharField(max_length=20, choices=VisitaAuditoria.TIPO_COMIDA_CHOICES)
+    marcado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Resumen pendiente"
+        verbose_name_plural = "Resúmenes pendientes"
+        ordering = ['marcado_en', 'id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'institucion_id', 'tipo_comida'],
+                name='resumen_pendiente_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['marcado_en']),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.institucion_id} - {self.tipo_comida}"
+
+
+class ContadorEstadistica(models.Model):
+    """
+    Contador del dashboard que se mantiene por diferencias en cada escritura
+    (ver contadores.py) para no contar las tablas crudas en cada lectura.
+    """
+    clave = models.CharField(max_length=60, unique=True)
+    valor = models.BigIntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Contador de estadística"
+        verbose_name_plural = "Contadores de estadísticas"
+        ordering = ['clave']
+
+    def __str__(self):
+        return f"{self.clave} = {self.valor}"
+
+
+class TrabajoReporte(models.Model):
+    """
+    Reporte pesado que se calcula fuera de la petición: la API lo encola y
+    el comando procesar_reportes lo ejecuta (ver trabajos.py). `huella`
+    identifica tipo + parámetros normalizados y `firma_datos` la versión de
+    los datos sobre la que se calculó el resultado.
+    """
+    TIPO_CHOICES = [
+        ("comparativa", "Comparativa nutricional"),
+        ("instituciones_filtros", "Instituciones con filtros"),
+    ]
+    ESTADO_CHOICES = [
+        ("pendiente", "Pendiente"),
+        ("en_proceso", "En proceso"),
+        ("completado", "Completado"),
+        ("error", "Error"),
+    ]
+
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES)
+    parametros = models.JSONField(default=dict)
+    huella = models.CharField(max_length=64)
+    # Igual a huella mientras el trabajo espera a ser tomado: la restricción
+    # unique impide encolar dos pendientes iguales en paralelo (MySQL no tiene
+    # índices únicos parciales; los NULL no chocan entre sí)
+    huella_pendiente = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False)
+    firma_datos = models.CharField(max_length=64, blank=True, default="")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default="pendiente")
+    # Mismo encoder que la respuesta síncrona (Decimal -> número)
+    resultado = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+    error = models.TextField(null=True, blank=True)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    terminado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Trabajo de reporte"
+        verbose_name_plural = "Trabajos de reporte"
+        ordering = ['-creado_en', '-id']
+        indexes = [
+            models.Index(fields=['estado', 'creado_en']),
+            models.Index(fields=['huella', 'estado']),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.estado})"
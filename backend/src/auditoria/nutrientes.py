@@ -0,0 +1,184 @@
+"""
+Registro declarativo de nutrientes y cálculo de aportes/totales.
+
+Cada Nutriente vincula la columna del catálogo (AlimentoNutricional, valor
+cada 100 g) con el campo de aporte de IngredientePlato y el campo de total de
+PlatoObservado / PlatoPlantilla. Todo el cálculo nutricional (modelos,
+comandos, vistas y reportes) pasa por este módulo.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Avg, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+Nutriente = namedtuple('Nutriente', ['clave', 'campo_alimento', 'alternativa', 'campo_aporte', 'campo_total'])
+
+NUTRIENTES = (
+    Nutriente('energia', 'energia_kcal', None, 'energia_kcal', 'energia_kcal_total'),
+    Nutriente('proteinas', 'proteinas_g', None, 'proteinas_g', 'proteinas_g_total'),
+    Nutriente('grasas', 'grasas_totales_g', None, 'grasas_totales_g', 'grasas_totales_g_total'),
+    # Si el alimento no informa carbohidratos disponibles se usan los totales
+    Nutriente('carbohidratos', 'carbohidratos_disponibles_g', 'carbohidratos_totales_g',
+              'carbohidratos_g', 'carbohidratos_g_total'),
+    Nutriente('agua', 'agua_g', None, 'agua_g', 'agua_g_total'),
+    Nutriente('fibra', 'fibra_g', None, 'fibra_g', 'fibra_g_total'),
+    Nutriente('sodio', 'sodio_mg', None, 'sodio_mg', 'sodio_mg_total'),
+    Nutriente('calcio', 'calcio_mg', None, 'calcio_mg', 'calcio_mg_total'),
+    Nutriente('hierro', 'hierro_mg', None, 'hierro_mg', 'hierro_mg_total'),
+    Nutriente('zinc', 'zinc_mg', None, 'zinc_mg', 'zinc_mg_total'),
+    Nutriente('vitamina_c', 'vitamina_c_mg', None, 'vitamina_c_mg', 'vitamina_c_mg_total'),
+    Nutriente('potasio', 'potasio_mg', None, 'potasio_mg', 'potasio_mg_total'),
+    Nutriente('fosforo', 'fosforo_mg', None, 'fosforo_mg', 'fosforo_mg_total'),
+    Nutriente('grasas_saturadas', 'grasas_saturadas_g', None, 'grasas_saturadas_g', 'grasas_saturadas_g_total'),
+    Nutriente('grasas_monoinsat', 'grasas_monoinsat_g', None, 'grasas_monoinsat_g', 'grasas_monoinsat_g_total'),
+    Nutriente('grasas_poliinsat', 'grasas_poliinsat_g', None, 'grasas_poliinsat_g', 'grasas_poliinsat_g_total'),
+)
+
+# Nutrientes que se informan en los reportes (promedios por plato)
+CLAVES_REPORTE = ('energia', 'proteinas', 'grasas', 'carbohidratos', 'fibra', 'sodio')
+NUTRIENTES_REPORTE = tuple(n for n in NUTRIENTES if n.clave in CLAVES_REPORTE)
+
+CAMPOS_ALIMENTO = tuple(sorted({n.campo_alimento for n in NUTRIENTES} | {n.alternativa for n in NUTRIENTES if n.alternativa}))
+CAMPOS_APORTE = tuple(n.campo_aporte for n in NUTRIENTES)
+CAMPOS_TOTAL = tuple(n.campo_total for n in NUTRIENTES)
+
+CERO = Decimal("0")
+CIEN = Decimal("100")
+CENTESIMO = Decimal("0.01")
+VECTOR_CERO = (CERO,) * len(NUTRIENTES)
+
+
+def vector_alimento(alimento):
+    """
+    Valores efectivos cada 100 g de un alimento, en el orden de NUTRIENTES.
+    Acepta una instancia de AlimentoNutricional o un dict de values().
+    """
+    get = alimento.get if isinstance(alimento, dict) else (lambda campo: getattr(alimento, campo))
+    vector = []
+    for n in NUTRIENTES:
+        valor = get(n.campo_alimento)
+        if valor is None and n.alternativa:
+            valor = get(n.alternativa)
+        if valor is None:
+            valor = CERO
+        elif not isinstance(valor, Decimal):
+            valor = Decimal(str(valor))
+        vector.append(valor)
+    return tuple(vector)
+
+
+def calcular_aporte(vector, cantidad):
+    """Aporte de `cantidad` gramos de un alimento con valores `vector` cada 100 g."""
+    factor = (cantidad or CERO) / CIEN
+    return tuple(factor * valor for valor in vector)
+
+
+def sumar(vectores):
+    totales = list(VECTOR_CERO)
+    for vector in vectores:
+        for i, valor in enumerate(vector):
+            totales[i] += valor
+    return tuple(totales)
+
+
+def restar(a, b):
+    return tuple(x - y for x, y in zip(a, b))
+
+
+def como_aporte(vector):
+    """{campo_aporte: valor} listo para asignar a un IngredientePlato."""
+    return dict(zip(CAMPOS_APORTE, vector))
+
+
+def como_totales(vector):
+    """{campo_total: valor} listo para asignar a un PlatoObservado / PlatoPlantilla."""
+    return dict(zip(CAMPOS_TOTAL, vector))
+
+
+def vector_aporte(ingrediente, estricto=False):
+    """
+    Aporte almacenado en un IngredientePlato (o dict de values()); None cuenta
+    como 0. Con `estricto=True` devuelve None si falta algún valor.
+    """
+    get = ingrediente.get if isinstance(ingrediente, dict) else (lambda campo: getattr(ingrediente, campo))
+    valores = tuple(get(campo) for campo in CAMPOS_APORTE)
+    if estricto and any(valor is None for valor in valores):
+        return None
+    return tuple(CERO if valor is None else valor for valor in valores)
+
+
+def cuantizadores(modelo, campos):
+    """{campo: función que redondea al decimal_places de la columna}."""
+    resultado = {}
+    for campo in campos:
+        exponente = Decimal(1).scaleb(-modelo._meta.get_field(campo).decimal_places)
+        resultado[campo] = lambda valor, exponente=exponente: (
+            None if valor is None else Decimal(valor).quantize(exponente)
+        )
+    return resultado
+
+
+def totales_en_lote(filas):
+    """
+    Totales de muchos platos en una pasada en Python.
+    `filas`: iterable de (plato_id, vector_alimento, cantidad).
+    Devuelve {plato_id: vector_totales}.
+    """
+    acumulado = {}
+    for plato_id, vector, cantidad in filas:
+        totales = acumulado.setdefault(plato_id, list(VECTOR_CERO))
+        factor = (cantidad or CERO) / CIEN
+        for i, valor in enumerate(vector):
+            totales[i] += factor * valor
+    return {plato_id: tuple(totales) for plato_id, totales in acumulado.items()}
+
+
+def _expresion_valor(prefijo, nutriente):
+    campos = [F(f'{prefijo}{nutriente.campo_alimento}')]
+    if nutriente.alternativa:
+        campos.append(F(f'{prefijo}{nutriente.alternativa}'))
+    return Coalesce(*campos, Value(CERO), output_field=DecimalField())
+
+
+def anotaciones_totales(prefijo_alimento='alimento__'):
+    """
+    {campo_total: SUM(cantidad * nutriente) / 100} para usar en annotate/aggregate
+    sobre un queryset de ingredientes (IngredientePlato o IngredientePlantilla).
+    Se multiplica por 0.01 en lugar de dividir por 100: SQLite guarda los
+    decimales enteros como INTEGER y haría división entera.
+    """
+    return {
+        n.campo_total: ExpressionWrapper(
+            Sum(F('cantidad') * _expresion_valor(prefijo_alimento, n)) * Value(CENTESIMO),
+            output_field=DecimalField(max_digits=20, decimal_places=6),
+        )
+        for n in NUTRIENTES
+    }
+
+
+def totales_sql(ingredientes, campo_plato):
+    """
+    Totales por plato con un único SELECT ... GROUP BY sobre `ingredientes`
+    (queryset de IngredientePlato o IngredientePlantilla). `campo_plato` es el
+    nombre de la FK al plato ('plato' o 'plato_plantilla').
+    Devuelve {plato_id: vector_totales}; los platos sin ingredientes no aparecen.
+    """
+    filas = (
+        ingredientes.order_by()
+        .values(campo_plato)
+        .annotate(**anotaciones_totales())
+    )
+    return {
+        fila[campo_plato]: tuple(fila[campo] or CERO for campo in CAMPOS_TOTAL)
+        for fila in filas
+    }
+
+
+def promedios_reporte(prefijo='', formato='{clave}'):
+    """Kwargs de Avg() de los totales que informan los reportes."""
+    return {
+        formato.format(clave=n.clave): Avg(f'{prefijo}{n.campo_total}')
+        for n in NUTRIENTES_REPORTE
+    }
@@ -0,0 +1,190 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import nutrientes, resumenes
+from .matriz import matriz_nutrientes
+from .models import PlatoObservado, IngredientePlato, PlatoPlantilla, IngredientePlantilla
+
+
+class RecalculoTotales:
+    """
+    Recalcula aportes de IngredientePlato y totales de PlatoObservado /
+    PlatoPlantilla por lotes de platos, con lecturas values() y escrituras
+    bulk_update. Sólo se escriben las filas cuyo valor almacenado cambia.
+
+    Los métodos recalcular_* son generadores: emiten un dict de progreso
+    por lote para que el llamador informe avance.
+    """
+
+    def __init__(self, batch_size=1000, dry_run=False, max_diferencias=20):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.max_diferencias = max_diferencias
+        self.diferencias = []
+        self._q_aporte = nutrientes.cuantizadores(IngredientePlato, nutrientes.CAMPOS_APORTE)
+        self._q_plato = nutrientes.cuantizadores(PlatoObservado, nutrientes.CAMPOS_TOTAL)
+        self._q_plantilla = nutrientes.cuantizadores(PlatoPlantilla, nutrientes.CAMPOS_TOTAL)
+
+    def recalcular_platos(self, platos):
+        total = platos.count()
+        progreso = {'modelo': 'platos', 'total': total, 'procesados': 0, 'cambiados': 0, 'ingredientes_cambiados': 0}
+        for ids in self._lotes_ids(platos):
+            filas = list(
+                IngredientePlato.objects.filter(plato_id__in=ids)
+                .values('id', 'plato_id', 'alimento_id', 'cantidad', *nutrientes.CAMPOS_APORTE)
+            )
+            vectores = matriz_nutrientes.vectores(fila['alimento_id'] for fila in filas)
+
+            ingredientes_cambiados = []
+            aportes_por_plato = {plato_id: [] for plato_id in ids}
+            for fila in filas:
+                aporte = nutrientes.calcular_aporte(vectores[fila['alimento_id']], fila['cantidad'])
+                aportes_por_plato[fila['plato_id']].append(aporte)
+                nuevo = nutrientes.como_aporte(aporte)
+                if self._distinto(fila, nuevo, self._q_aporte):
+                    ingredientes_cambiados.append(IngredientePlato(id=fila['id'], **nuevo))
+
+            actuales = PlatoObservado.objects.filter(id__in=ids).values('id', 'nombre', *nutrientes.CAMPOS_TOTAL)
+            platos_cambiados = self._comparar_totales(actuales, aportes_por_plato, self._q_plato, PlatoObservado)
+
+            self._guardar(IngredientePlato, ingredientes_cambiados, nutrientes.CAMPOS_APORTE)
+            self._guardar(PlatoObservado, platos_cambiados, nutrientes.CAMPOS_TOTAL)
+
+            progreso['procesados'] += len(ids)
+            progreso['cambiados'] += len(platos_cambiados)
+            progreso['ingredientes_cambiados'] += len(ingredientes_cambiados)
+            yield dict(progreso)
+
+    def recalcular_plantillas(self, plantillas):
+        total = plantillas.count()
+        progreso = {'modelo': 'plantillas', 'total': total, 'procesados': 0, 'cambiados': 0}
+        for ids in self._lotes_ids(plantillas):
+            filas = list(
+                IngredientePlantilla.objects.filter(plato_plantilla_id__in=ids)
+                .values('plato_plantilla_id', 'alimento_id', 'cantidad')
+            )
+            vectores = matriz_nutrientes.vectores(fila['alimento_id'] for fila in filas)
+            aportes_por_plato = {plato_id: [] for plato_id in ids}
+            for fila in filas:
+                aportes_por_plato[fila['plato_plantilla_id']].append(
+                    nutrientes.calcular_aporte(vectores[fila['alimento_id']], fila['cantidad'])
+                )
+
+            actuales = PlatoPlantilla.objects.filter(id__in=ids).values('id', 'nombre', *nutrientes.CAMPOS_TOTAL)
+            cambiados = self._comparar_totales(actuales, aportes_por_plato, self._q_plantilla, PlatoPlantilla)
+            self._guardar(PlatoPlantilla, cambiados, nutrientes.CAMPOS_TOTAL)
+
+            progreso['procesados'] += len(ids)
+            progreso['cambiados'] += len(cambiados)
+            yield dict(progreso)
+
+    def _lotes_ids(self, queryset):
+        ultimo = 0
+        while True:
+            ids = list(
+                queryset.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return
+            yield ids
+            ultimo = ids[-1]
+
+    def _comparar_totales(self, actuales, aportes_por_plato, cuantizadores, modelo):
+        cambiados = []
+        for fila in actuales:
+            nuevo = nutrientes.como_totales(nutrientes.sumar(aportes_por_plato[fila['id']]))
+            if self._distinto(fila, nuevo, cuantizadores):
+                self._registrar_diferencia(modelo, fila, nuevo, cuantizadores)
+                cambiados.append(modelo(id=fila['id'], **nuevo))
+        return cambiados
+
+    @staticmethod
+    def _distinto(actual, nuevo, cuantizadores):
+        return any(cuantizadores[campo](valor) != actual[campo] for campo, valor in nuevo.items())
+
+    def _registrar_diferencia(self, modelo, fila, nuevo, cuantizadores):
+        if len(self.diferencias) >= self.max_diferencias:
+            return
+        cambios = {
+            campo: (fila[campo], cuantizadores[campo](valor))
+            for campo, valor in nuevo.items()
+            if cuantizadores[campo](valor) != fila[campo]
+        }
+        self.diferencias.append((modelo.__name__, fila['id'], fila['nombre'], cambios))
+
+    def _guardar(self, modelo, objetos, campos):
+        if self.dry_run or not objetos:
+            return
+        campos = list(campos)
+        if any(f.name == 'updated_at' for f in modelo._meta.concrete_fields):
+            ahora = timezone.now()
+            for obj in objetos:
+                obj.updated_at = ahora
+            campos.append('updated_at')
+        with transaction.atomic():
+            modelo.objects.bulk_update(objetos, campos, batch_size=500)
+            if modelo is PlatoObservado:
+                resumenes.marcar(resumenes.claves_de_platos(obj.id for obj in objetos))
+
+
+def aplicar_delta_totales(plato_id, delta):
+    """
+    Suma `delta` (vector en el orden de NUTRIENTES) a los totales del plato con
+    un único UPDATE ... SET total = total + δ, sin releer sus ingredientes.
+
+    Devuelve False si el plato no tenía totales calculados: en ese caso no se
+    toca nada y el llamador debe recalcular el plato completo.
+    """
+    cambios = {
+        campo: Coalesce(F(campo), Value(nutrientes.CERO)) + Value(valor)
+        for campo, valor in zip(nutrientes.CAMPOS_TOTAL, delta)
+        if valor
+    }
+    if not cambios:
+        return True
+    actualizados = (
+        PlatoObservado.objects
+        .filter(pk=plato_id, energia_kcal_total__isnull=False)
+        .update(updated_at=timezone.now(), **cambios)
+    )
+    if actualizados:
+        resumenes.marcar(resumenes.claves_de_platos([plato_id]))
+    return actualizados == 1
+
+
+def detectar_desvios(platos, tolerancia, batch_size=1000):
+    """
+    Compara los totales almacenados de cada plato con la suma de los aportes
+    almacenados de sus ingredientes (un GROUP BY por lote). Emite, por lote,
+    una lista de (plato_id, {campo_total: (almacenado, esperado)}) con los
+    platos cuya diferencia supera `tolerancia` en algún nutriente.
+    """
+    sumas = {n.campo_total: Sum(n.campo_aporte) for n in nutrientes.NUTRIENTES}
+    ultimo = 0
+    while True:
+        ids = list(platos.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        ultimo = ids[-1]
+
+        esperados = {
+            fila['plato_id']: fila
+            for fila in IngredientePlato.objects.filter(plato_id__in=ids)
+            .order_by().values('plato_id').annotate(**sumas)
+        }
+        desvios = []
+        for fila in PlatoObservado.objects.filter(id__in=ids).values('id', *nutrientes.CAMPOS_TOTAL):
+            esperado = esperados.get(fila['id'], {})
+            diferencias = {}
+            for campo in nutrientes.CAMPOS_TOTAL:
+                almacenado = fila[campo] or nutrientes.CERO
+                calculado = esperado.get(campo) or nutrientes.CERO
+                if abs(Decimal(almacenado) - Decimal(calculado)) > tolerancia:
+                    diferencias[campo] = (fila[campo], calculado)
+            if diferencias:
+                desvios.append((fila['id'], diferencias))
+        yield len(ids), desvios
@@ -1,46 +1,31 @@
-from django.db.models import Count, Avg, Sum, Q
-from django.db.models.functions import TruncDate
+from django.db.models import Count, F, FilteredRelation, IntegerField, Q, Sum
+from django.db.models.functions import Cast
 from django.core.cache import cache
-from .models import Institucion, VisitaAuditoria, PlatoObservado
+from core.cache import clave_etiquetada
+from .models import Institucion, VisitaAuditoria, RespuestaFormulario, ResumenDiario
+from . import contadores, etiquetas, formularios, resumenes
 
 
 class ReportService:
     @staticmethod
     def get_dashboard_stats():
-        """Estadísticas generales del dashboard - CON CACHÉ"""
-        cache_key = 'dashboard_stats'
-        stats = cache.get(cache_key)
-        
-        if stats is None:
-            stats = {
-                'total_instituciones': Institucion.objects.filter(activo=True).count(),
-                'total_visitas': VisitaAuditoria.objects.count(),
-                'total_platos': PlatoObservado.objects.count(),
-                'visitas_por_tipo': list(
-                    VisitaAuditoria.objects.values('tipo_comida')
-                    .annotate(count=Count('id'))
-                    .order_by('-count')
-                ),
-                'instituciones_por_tipo': list(
-                    Institucion.objects.filter(activo=True)
-                    .values('tipo')
-                    .annotate(count=Count('id'))
-                    .order_by('-count')
-                ),
-            }
-            # Caché por 5 minutos
-            cache.set(cache_key, stats, 300)
-        
-        return stats
+        """
+        Estadísticas generales del dashboard, desde los contadores mantenidos
+        en cada escritura (contadores.py): 1 consulta sin importar el tamaño
+        de las tablas, así que no hace falta caché.
+        """
+        return contadores.leer()
 
     @staticmethod
     def get_visitas_por_periodo(fecha_inicio=None, fecha_fin=None):
         """Visitas agrupadas por fecha - CON CACHÉ"""
-        cache_key = f'visitas_periodo_{fecha_inicio}_{fecha_fin}'
+        cache_key = clave_etiquetada(
+            f'visitas_periodo_{fecha_inicio}_{fecha_fin}', etiquetas.de_periodo(fecha_inicio, fecha_fin)
+        )
         visitas = cache.get(cache_key)
         
         if visitas is None:
-            queryset = VisitaAuditoria.objects.all()
+            queryset = ResumenDiario.objects.all()
             
             if fecha_inicio:
                 queryset = queryset.filter(fecha__gte=fecha_inicio)
@@ -48,9 +33,8 @@ class ReportService:
                 queryset = queryset.filter(fecha__lte=fecha_fin)
             
             visitas = list(
-                queryset.annotate(dia=TruncDate('fecha'))
-                .values('dia')
-                .annotate(count=Count('id'))
+                queryset.values(dia=F('fecha'))
+                .annotate(count=Cast(Sum('visitas'), IntegerField()))
                 .order_by('dia')
             )
             # Caché por 10 minutos
@@ -61,19 +45,30 @@ class ReportService:
     @staticmethod
     def get_reporte_institucion(institucion_id, fecha_inicio=None, fecha_fin=None):
         """Reporte detallado de una institución - CON CACHÉ"""
-        cache_key = f'reporte_inst_{institucion_id}_{fecha_inicio}_{fecha_fin}'
+        cache_key = clave_etiquetada(
+            f'reporte_inst_{institucion_id}_{fecha_inicio}_{fecha_fin}',
+            etiquetas.de_periodo(fecha_inicio, fecha_fin, institucion_id) + etiquetas.de_institucion(institucion_id),
+        )
         reporte = cache.get(cache_key)
         
         if reporte is None:
             institucion = Institucion.objects.get(id=institucion_id)
             visitas = VisitaAuditoria.objects.filter(institucion=institucion)
+            resumen = ResumenDiario.objects.filter(institucion=institucion)
             
             if fecha_inicio:
                 visitas = visitas.filter(fecha__gte=fecha_inicio)
+                resumen = resumen.filter(fecha__gte=fecha_inicio)
             if fecha_fin:
                 visitas = visitas.filter(fecha__lte=fecha_fin)
+                resumen = resumen.filter(fecha__lte=fecha_fin)
             
-            platos = PlatoObservado.objects.filter(visita__in=visitas).select_related('visita')
+            por_tipo = list(
+                resumen.values('tipo_comida')
+                .annotate(**resumenes.sumas())
+                .order_by('tipo_comida')
+            )
+            totales = {campo: sum(fila[campo] or 0 for fila in por_tipo) for campo in resumenes.CAMPOS_RESUMEN}
             
             reporte = {
                 'institucion': {
@@ -82,20 +77,13 @@ class ReportService:
                     'codigo': institucion.codigo,
                     'tipo': institucion.tipo,
                 },
-                'total_visitas': visitas.count(),
-                'visitas_por_tipo_comida': list(
-                    visitas.values('tipo_comida')
-                    .annotate(count=Count('id'))
-                ),
-                'total_platos': platos.count(),
-                'promedios_nutricionales': platos.aggregate(
-                    energia_promedio=Avg('energia_kcal_total'),
-                    proteinas_promedio=Avg('proteinas_g_total'),
-                    grasas_promedio=Avg('grasas_totales_g_total'),
-                    carbohidratos_promedio=Avg('carbohidratos_g_total'),
-                    fibra_promedio=Avg('fibra_g_total'),
-                    sodio_promedio=Avg('sodio_mg_total'),
-                ),
+                'total_visitas': int(totales['visitas']),
+                'visitas_por_tipo_comida': [
+                    {'tipo_comida': fila['tipo_comida'], 'count': int(fila['visitas'])}
+                    for fila in por_tipo
+                ],
+                'total_platos': int(totales['platos']),
+                'promedios_nutricionales': resumenes.promedios(totales, formato='{clave}_promedio'),
                 'ultimas_visitas': list(
                     visitas.order_by('-fecha')[:10]
                     .values('id', 'fecha', 'tipo_comida', 'observaciones')
@@ -109,11 +97,14 @@ class ReportService:
     @staticmethod
     def get_ranking_instituciones(fecha_inicio=None, fecha_fin=None, limit=10):
         """Ranking de instituciones por cantidad de visitas - CON CACHÉ"""
-        cache_key = f'ranking_{fecha_inicio}_{fecha_fin}_{limit}'
+        cache_key = clave_etiquetada(
+            f'ranking_{fecha_inicio}_{fecha_fin}_{limit}',
+            etiquetas.de_periodo(fecha_inicio, fecha_fin) + ['instituciones'],
+        )
         ranking = cache.get(cache_key)
         
         if ranking is None:
-            queryset = VisitaAuditoria.objects.all()
+            queryset = ResumenDiario.objects.all()
             
             if fecha_inicio:
                 queryset = queryset.filter(fecha__gte=fecha_inicio)
@@ -122,7 +113,7 @@ class ReportService:
             
             ranking = list(
                 queryset.values('institucion__id', 'institucion__nombre', 'institucion__tipo')
-                .annotate(total_visitas=Count('id'))
+                .annotate(total_visitas=Cast(Sum('visitas'), IntegerField()))
                 .order_by('-total_visitas')[:limit]
             )
             # Caché por 10 minutos
@@ -130,30 +121,96 @@ class ReportService:
         
         return ranking
 
+    # nivel: campos de Institucion por los que se agrupa
+    NIVELES_REGION = {
+        'comuna': ['comuna'],
+        'barrio': ['comuna', 'barrio'],
+        'tipo': ['tipo'],
+    }
+
+    @staticmethod
+    def get_reporte_region(nivel, fecha_inicio=None, fecha_fin=None, comunas=None, tipos=None):
+        """
+        Cobertura de visitas, platos y promedios nutricionales por comuna,
+        barrio o tipo de institución - CON CACHÉ.
+
+        Una sola consulta agrupada desde Institucion con LEFT JOIN a
+        ResumenDiario acotado al período en la condición del JOIN
+        (FilteredRelation): usa el índice (institucion, fecha) del resumen y
+        las regiones sin visitas aparecen con cobertura 0.
+        """
+        if nivel not in ReportService.NIVELES_REGION:
+            raise ValueError(f"Nivel inválido: {nivel}. Opciones: {', '.join(ReportService.NIVELES_REGION)}")
+        comunas, tipos = sorted(comunas or []), sorted(tipos or [])
+        cache_key = clave_etiquetada(
+            f"reporte_region_{nivel}_{fecha_inicio}_{fecha_fin}_{','.join(comunas)}_{','.join(tipos)}",
+            etiquetas.de_periodo(fecha_inicio, fecha_fin) + ['instituciones'],
+        )
+        reporte = cache.get(cache_key)
+
+        if reporte is None:
+            condicion = Q()
+            if fecha_inicio:
+                condicion &= Q(resumenes__fecha__gte=fecha_inicio)
+            if fecha_fin:
+                condicion &= Q(resumenes__fecha__lte=fecha_fin)
+            instituciones = Institucion.objects.all()
+            if comunas:
+                instituciones = instituciones.filter(comuna__in=comunas)
+            if tipos:
+                instituciones = instituciones.filter(tipo__in=tipos)
+
+            campos = ReportService.NIVELES_REGION[nivel]
+            visitada = Q(periodo__id__isnull=False)
+            filas = (
+                instituciones.annotate(periodo=FilteredRelation('resumenes', condition=condicion))
+                .values(*campos)
+                .annotate(
+                    todas=Count('id', distinct=True),
+                    todas_visitadas=Count('id', filter=visitada, distinct=True),
+                    instituciones_activas=Count('id', filter=Q(activo=True), distinct=True),
+                    activas_visitadas=Count('id', filter=visitada & Q(activo=True), distinct=True),
+                    **resumenes.sumas('periodo__'),
+                )
+                .order_by(*campos)
+            )
+            reporte = [
+                {
+                    **{campo: fila[campo] for campo in campos},
+                    # instituciones, instituciones_visitadas y cobertura cuentan sólo las activas
+                    'instituciones': fila['instituciones_activas'],
+                    'instituciones_visitadas': fila['activas_visitadas'],
+                    # Las visitas y platos incluyen los de instituciones ya inactivas
+                    'instituciones_con_inactivas': fila['todas'],
+                    'visitadas_con_inactivas': fila['todas_visitadas'],
+                    'cobertura': (
+                        round(100 * fila['activas_visitadas'] / fila['instituciones_activas'], 1)
+                        if fila['instituciones_activas'] else None
+                    ),
+                    'total_visitas': int(fila['visitas'] or 0),
+                    'total_platos': int(fila['platos'] or 0),
+                    'promedios': resumenes.promedios(fila),
+                }
+                for fila in filas
+            ]
+            # Caché por 10 minutos
+            cache.set(cache_key, reporte, 600)
+
+        return reporte
+
     @staticmethod
     def get_comparativa_nutricional(institucion_ids, fecha_inicio=None, fecha_fin=None):
-        """Comparativa nutricional entre instituciones - OPTIMIZADO"""
-        from django.db.models import F, Subquery, OuterRef
-        
-        # Filtrar visitas
-        visitas_qs = VisitaAuditoria.objects.filter(institucion_id__in=institucion_ids)
+        """Comparativa nutricional entre instituciones (desde ResumenDiario)"""
+        resumen = ResumenDiario.objects.filter(institucion_id__in=institucion_ids)
         if fecha_inicio:
-            visitas_qs = visitas_qs.filter(fecha__gte=fecha_inicio)
+            resumen = resumen.filter(fecha__gte=fecha_inicio)
         if fecha_fin:
-            visitas_qs = visitas_qs.filter(fecha__lte=fecha_fin)
+            resumen = resumen.filter(fecha__lte=fecha_fin)
         
-        # Una sola query con aggregates por institución
-        resultados = visitas_qs.values(
+        resultados = resumen.values(
             'institucion__id', 'institucion__nombre'
         ).annotate(
-            total_visitas=Count('id', distinct=True),
-            total_platos=Count('platos', distinct=True),
-            energia=Avg('platos__energia_kcal_total'),
-            proteinas=Avg('platos__proteinas_g_total'),
-            grasas=Avg('platos__grasas_totales_g_total'),
-            carbohidratos=Avg('platos__carbohidratos_g_total'),
-            fibra=Avg('platos__fibra_g_total'),
-            sodio=Avg('platos__sodio_mg_total'),
+            **resumenes.sumas()
         ).order_by('institucion__nombre')
         
         # Formatear respuesta
@@ -161,97 +218,90 @@ class ReportService:
             {
                 'institucion_id': r['institucion__id'],
                 'institucion_nombre': r['institucion__nombre'],
-                'total_visitas': r['total_visitas'],
-                'total_platos': r['total_platos'],
-                'promedios': {
-                    'energia': r['energia'],
-                    'proteinas': r['proteinas'],
-                    'grasas': r['grasas'],
-                    'carbohidratos': r['carbohidratos'],
-                    'fibra': r['fibra'],
-                    'sodio': r['sodio'],
-                }
+                'total_visitas': int(r['visitas']),
+                'total_platos': int(r['platos']),
+                'promedios': resumenes.promedios(r),
             }
             for r in resultados
         ]
 
     @staticmethod
     def get_instituciones_con_filtros(fecha_inicio=None, fecha_fin=None, filtros=None):
-        """Instituciones que cumplen con filtros del formulario"""
-        from django.db.models import Q, Count
-        
+        """
+        Instituciones que cumplen con filtros del formulario.
+        Las respuestas se buscan en RespuestaFormulario (proyección indexada del
+        JSON), así que el reporte usa a lo sumo 4 consultas.
+        """
+        filtros = filtros or {}
+
         # Filtrar visitas por fecha
-        visitas_qs = VisitaAuditoria.objects.select_related('institucion')
+        visitas_qs = VisitaAuditoria.objects.all()
         if fecha_inicio:
             visitas_qs = visitas_qs.filter(fecha__gte=fecha_inicio)
         if fecha_fin:
             visitas_qs = visitas_qs.filter(fecha__lte=fecha_fin)
-        
-        # Obtener todas las instituciones con visitas
-        instituciones_ids = visitas_qs.values_list('institucion_id', flat=True).distinct()
-        instituciones = Institucion.objects.filter(id__in=instituciones_ids)
-        
-        # Construir respuesta
-        resultados = []
-        for inst in instituciones:
-            visitas_inst = visitas_qs.filter(institucion=inst)
-            total_visitas = visitas_inst.count()
-            
-            # Verificar cumplimiento de criterios
-            cumple = True
-            visitas_con_formulario = visitas_inst.filter(formulario_completado=True)
-            
-            if filtros and visitas_con_formulario.exists():
-                for campo, valor_esperado in filtros.items():
-                    campo_encontrado = False
-                    
-                    # Filtros especiales
-                    if campo == 'tipo_institucion':
-                        if inst.tipo.lower() != valor_esperado.lower():
-                            cumple = False
-                            break
-                        campo_encontrado = True
-                    elif campo == 'tipo_comida':
-                        if not visitas_inst.filter(tipo_comida__icontains=valor_esperado).exists():
-                            cumple = False
-                            break
-                        campo_encontrado = True
-                    else:
-                        # Buscar en formulario_respuestas
-                        for visita in visitas_con_formulario:
-                            if visita.formulario_respuestas:
-                                for seccion, respuestas in visita.formulario_respuestas.items():
-                                    if campo in respuestas:
-                                        valor_real = respuestas[campo]
-                                        
-                                        # Comparar valores
-                                        if isinstance(valor_real, bool):
-                                            valor_esperado_bool = valor_esperado.lower() in ['true', 'si', 'sí', '1', 'yes']
-                                            if valor_real == valor_esperado_bool:
-                                                campo_encontrado = True
-                                                break
-                                        else:
-                                            if str(valor_real).lower() == valor_esperado.lower():
-                                                campo_encontrado = True
-                                                break
-                                
-                                if campo_encontrado:
-                                    break
-                    
-                    if not campo_encontrado:
-                        cumple = False
-                        break
-            elif filtros:
-                # Si hay filtros pero no hay formularios completados
-                cumple = False
-            
-            resultados.append({
+
+        conteos = {
+            fila['institucion_id']: fila
+            for fila in visitas_qs.order_by().values('institucion_id').annotate(
+                total_visitas=Count('id'),
+                con_formulario=Count('id', filter=Q(formulario_completado=True)),
+            )
+        }
+        instituciones = Institucion.objects.filter(id__in=visitas_qs.values('institucion_id'))
+
+        # Instituciones con alguna visita del tipo de comida pedido
+        con_tipo_comida = set()
+        if 'tipo_comida' in filtros:
+            con_tipo_comida = set(
+                visitas_qs.filter(tipo_comida__icontains=filtros['tipo_comida'])
+                .values_list('institucion_id', flat=True).distinct()
+            )
+
+        # (institución, campo) con alguna respuesta que coincide en visitas completadas
+        filtros_formulario = {
+            campo: valor for campo, valor in filtros.items()
+            if campo not in ('tipo_institucion', 'tipo_comida')
+        }
+        encontrados = set()
+        if filtros_formulario:
+            candidatas = (
+                RespuestaFormulario.objects
+                .filter(visita__in=visitas_qs.filter(formulario_completado=True).values('id'))
+                .filter(formularios.condicion_respuestas(filtros_formulario))
+                .order_by()
+                .values_list('visita__institucion_id', 'campo', 'valor', 'valor_bool')
+                .distinct()
+            )
+            for institucion_id, campo, valor, valor_bool in candidatas:
+                if campo in filtros_formulario and formularios.coincide(valor, valor_bool, filtros_formulario[campo]):
+                    encontrados.add((institucion_id, campo))
+
+        def cumple_criterios(inst):
+            if not filtros:
+                return True
+            # Si hay filtros pero no hay formularios completados
+            if not conteos[inst.id]['con_formulario']:
+                return False
+            for campo, valor_esperado in filtros.items():
+                if campo == 'tipo_institucion':
+                    cumple = inst.tipo.lower() == valor_esperado.lower()
+                elif campo == 'tipo_comida':
+                    cumple = inst.id in con_tipo_comida
+                else:
+                    cumple = (inst.id, campo) in encontrados
+                if not cumple:
+                    return False
+            return True
+
+        return [
+            {
                 'id': inst.id,
                 'nombre': inst.nombre,
                 'codigo': inst.codigo,
                 'tipo': inst.tipo,
-                'total_visitas': total_visitas,
-                'cumple_criterios': cumple,
-            })
-        
-        return resultados
+                'total_visitas': conteos[inst.id]['total_visitas'],
+                'cumple_criterios': cumple_criterios(inst),
+            }
+            for inst in instituciones
+        ]
@@ -0,0 +1,289 @@
+"""
+Mantenimiento de ResumenDiario, el agregado por (fecha, institución, tipo de
+comida) del que leen los reportes.
+
+Cada escritura sobre visitas o platos marca las claves afectadas con
+marcar(), que las registra en ResumenPendiente dentro de la misma
+transacción; al confirmarse se recalculan sólo esas claves desde las tablas
+crudas (un GROUP BY acotado por índice) y se hace upsert. Así el costo de
+refrescar no depende del tamaño del histórico. Después se invalidan las
+etiquetas de caché de esas claves (ver etiquetas.py). En la transacción del
+refresco se suman a los contadores del dashboard las diferencias de visitas
+y platos (ver contadores.py) y se borran las claves pendientes: si falla,
+todo vuelve atrás y refrescar_pendientes lo reintenta (worker
+procesar_reportes, o reconstruir_resumenes --pendientes).
+"""
+import datetime
+import logging
+from decimal import Decimal
+from functools import partial
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from core.cache import invalidar
+
+from . import contadores, etiquetas, nutrientes
+from .models import VisitaAuditoria, PlatoObservado, ResumenDiario, ResumenPendiente
+
+
+logger = logging.getLogger(__name__)
+
+
+CAMPOS_SUMA = {n.clave: f'suma_{n.clave}' for n in nutrientes.NUTRIENTES_REPORTE}
+CAMPOS_CANTIDAD = {n.clave: f'n_{n.clave}' for n in nutrientes.NUTRIENTES_REPORTE}
+CAMPOS_RESUMEN = ['visitas', 'platos', *CAMPOS_SUMA.values(), *CAMPOS_CANTIDAD.values()]
+
+
+def _fecha(valor):
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, str):
+        return datetime.date.fromisoformat(valor[:10])
+    return valor
+
+
+def clave_visita(visita):
+    """Clave de resumen de una visita (instancia o dict de values())."""
+    get = visita.get if isinstance(visita, dict) else (lambda campo: getattr(visita, campo))
+    return _fecha(get('fecha')), get('institucion_id'), get('tipo_comida')
+
+
+def claves_de_visitas(visita_ids):
+    """Claves de las visitas dadas (1 consulta)."""
+    filas = VisitaAuditoria.objects.filter(id__in=list(visita_ids)).values('fecha', 'institucion_id', 'tipo_comida')
+    return {clave_visita(fila) for fila in filas}
+
+
+def claves_de_platos(plato_ids):
+    """Claves de las visitas de los platos dados (1 consulta)."""
+    filas = (
+        VisitaAuditoria.objects.filter(platos__id__in=list(plato_ids))
+        .values('fecha', 'institucion_id', 'tipo_comida').distinct()
+    )
+    return {clave_visita(fila) for fila in filas}
+
+
+def _vacio():
+    return {campo: 0 for campo in CAMPOS_RESUMEN}
+
+
+def agregados(visitas, platos):
+    """
+    {clave: {campo: valor}} desde querysets crudos de visitas y platos.
+    Sólo usa nombres de campo, así que sirve también con modelos históricos
+    (migraciones).
+    """
+    resumenes = {}
+    for fila in visitas.order_by().values('fecha', 'institucion_id', 'tipo_comida').annotate(n=Count('id')):
+        resumenes[clave_visita(fila)] = dict(_vacio(), visitas=fila['n'])
+
+    anotaciones = {'n': Count('id')}
+    for n in nutrientes.NUTRIENTES_REPORTE:
+        anotaciones[CAMPOS_SUMA[n.clave]] = Sum(n.campo_total)
+        anotaciones[CAMPOS_CANTIDAD[n.clave]] = Count(n.campo_total)
+    filas = (
+        platos.order_by()
+        .values('visita__fecha', 'visita__institucion_id', 'visita__tipo_comida')
+        .annotate(**anotaciones)
+    )
+    for fila in filas:
+        clave = (_fecha(fila['visita__fecha']), fila['visita__institucion_id'], fila['visita__tipo_comida'])
+        resumen = resumenes.get(clave)
+        if resumen is None:
+            continue
+        resumen['platos'] = fila['n']
+        for campo in (*CAMPOS_SUMA.values(), *CAMPOS_CANTIDAD.values()):
+            resumen[campo] = fila[campo] or 0
+    return resumenes
+
+
+def guardar(modelo, resumenes):
+    """Upsert de `resumenes` ({clave: campos}) en `modelo` (ResumenDiario o su versión histórica)."""
+    if not resumenes:
+        return
+    objetos = [
+        modelo(fecha=fecha, institucion_id=institucion_id, tipo_comida=tipo_comida, **campos)
+        for (fecha, institucion_id, tipo_comida), campos in resumenes.items()
+    ]
+    # MySQL resuelve el conflicto con ON DUPLICATE KEY UPDATE y no admite indicar la clave
+    connection = connections[router.db_for_write(modelo)]
+    unicos = ['fecha', 'institucion', 'tipo_comida'] if connection.features.supports_update_conflicts_with_target else None
+    modelo.objects.bulk_create(
+        objetos,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=unicos,
+        update_fields=[*CAMPOS_RESUMEN, 'actualizado_en'],
+    )
+
+
+def _normalizar(claves):
+    return {(_fecha(f), i, t) for f, i, t in claves if i is not None and f is not None}
+
+
+def _por_claves(queryset, claves, tamano=200):
+    """
+    `queryset` filtrado por las claves exactas (OR de fecha, institución y
+    tipo de comida), en tandas ordenadas: SQLite limita la profundidad del WHERE.
+    """
+    claves = sorted(claves)
+    for inicio in range(0, len(claves), tamano):
+        condicion = Q()
+        for fecha, institucion_id, tipo_comida in claves[inicio:inicio + tamano]:
+            condicion |= Q(fecha=fecha, institucion_id=institucion_id, tipo_comida=tipo_comida)
+        yield queryset.filter(condicion)
+
+
+def refrescar(claves):
+    """Recalcula desde las tablas crudas los resúmenes de `claves` que siguen pendientes."""
+    claves = _normalizar(claves)
+    if not claves:
+        return
+
+    with transaction.atomic():
+        # Se bloquean sólo las filas pendientes de estas claves, en orden: dos
+        # refrescos de la misma clave se serializan y el segundo la encuentra
+        # ya refrescada. La escritura que la marcó mantiene la fila bloqueada
+        # hasta confirmar, así que lo que se lee después ya la incluye
+        pendientes = [
+            fila
+            for tanda in _por_claves(ResumenPendiente.objects.select_for_update(), claves)
+            for fila in tanda.order_by('fecha', 'institucion_id', 'tipo_comida')
+            .values_list('id', 'fecha', 'institucion_id', 'tipo_comida')
+        ]
+        if not pendientes:
+            return
+        ResumenPendiente.objects.filter(id__in=[fila[0] for fila in pendientes]).delete()
+        claves = {(_fecha(f), i, t) for _, f, i, t in pendientes}
+
+        previos = {
+            clave_visita(fila): fila
+            for tanda in _por_claves(ResumenDiario.objects.all(), claves)
+            for fila in tanda.values('fecha', 'institucion_id', 'tipo_comida', 'visitas', 'platos')
+        }
+
+        fechas = {f for f, _, _ in claves}
+        instituciones = {i for _, i, _ in claves}
+        # Filtro por fecha e institución (indexado); las claves sobrantes se descartan
+        visitas = VisitaAuditoria.objects.filter(fecha__in=fechas, institucion_id__in=instituciones)
+        platos = PlatoObservado.objects.filter(visita__fecha__in=fechas, visita__institucion_id__in=instituciones)
+        nuevos = {clave: campos for clave, campos in agregados(visitas, platos).items() if clave in claves}
+
+        for tanda in _por_claves(ResumenDiario.objects.all(), previos.keys() - nuevos.keys()):
+            tanda.delete()
+        guardar(ResumenDiario, nuevos)
+        contadores.sumar(contadores.de_resumenes(previos, nuevos))
+    invalidar(*etiquetas.de_claves(claves))
+
+
+def _refrescar_marcadas(claves):
+    try:
+        refrescar(claves)
+    except Exception:
+        # La escritura ya se confirmó: no se propaga. Las claves siguen en
+        # ResumenPendiente y las reintenta refrescar_pendientes
+        logger.exception('No se pudieron refrescar %d resúmenes; quedan pendientes', len(claves))
+
+
+def marcar(claves):
+    """
+    Registra `claves` como pendientes dentro de la transacción en curso y
+    programa su refresco para cuando se confirme.
+    """
+    claves = _normalizar(claves)
+    if not claves:
+        return
+    ResumenPendiente.objects.bulk_create(
+        [
+            ResumenPendiente(fecha=fecha, institucion_id=institucion_id, tipo_comida=tipo_comida)
+            for fecha, institucion_id, tipo_comida in sorted(claves)
+        ],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(partial(_refrescar_marcadas, claves))
+
+
+def refrescar_pendientes(antiguedad=60, tamano=1000):
+    """
+    Reintenta las claves pendientes hace más de `antiguedad` segundos (las más
+    nuevas las está refrescando la transacción que las marcó), de a `tamano`
+    por transacción. Devuelve cuántas había.
+    """
+    marcadas_antes = timezone.now() - datetime.timedelta(seconds=antiguedad)
+    pendientes = (
+        ResumenPendiente.objects.filter(marcado_en__lte=marcadas_antes)
+        .order_by('marcado_en', 'id').values_list('fecha', 'institucion_id', 'tipo_comida')
+    )
+    total = 0
+    while True:
+        # Las refrescadas se borran, así que cada tanda trae las siguientes
+        claves = list(pendientes[:tamano])
+        if claves:
+            refrescar(claves)
+            total += len(claves)
+        if len(claves) < tamano:
+            return total
+
+
+def reconstruir(fecha_desde=None, fecha_hasta=None, dias_por_lote=31):
+    """
+    Reconstruye todos los resúmenes (o los de un rango de fechas) por lotes de
+    días. Emite (fecha_inicio_lote, fecha_fin_lote, resúmenes escritos).
+    """
+    visitas = VisitaAuditoria.objects.all()
+    if fecha_desde:
+        visitas = visitas.filter(fecha__gte=fecha_desde)
+    if fecha_hasta:
+        visitas = visitas.filter(fecha__lte=fecha_hasta)
+    rango = visitas.order_by().aggregate(desde=Min('fecha'), hasta=Max('fecha'))
+    if rango['desde'] is None:
+        ResumenDiario.objects.filter(**_filtro_rango(fecha_desde, fecha_hasta)).delete()
+        contadores.reconciliar()
+        invalidar('reportes')
+        return
+
+    inicio = _fecha(fecha_desde) or rango['desde']
+    fin = _fecha(fecha_hasta) or rango['hasta']
+    # Resúmenes huérfanos fuera del rango con visitas
+    ResumenDiario.objects.filter(**_filtro_rango(fecha_desde, fecha_hasta)).exclude(fecha__range=(inicio, fin)).delete()
+    while inicio <= fin:
+        hasta = min(inicio + datetime.timedelta(days=dias_por_lote - 1), fin)
+        nuevos = agregados(
+            VisitaAuditoria.objects.filter(fecha__range=(inicio, hasta)),
+            PlatoObservado.objects.filter(visita__fecha__range=(inicio, hasta)),
+        )
+        with transaction.atomic():
+            ResumenDiario.objects.filter(fecha__range=(inicio, hasta)).delete()
+            guardar(ResumenDiario, nuevos)
+        yield inicio, hasta, len(nuevos)
+        inicio = hasta + datetime.timedelta(days=1)
+    contadores.reconciliar()
+    invalidar('reportes')
+
+
+def _filtro_rango(fecha_desde, fecha_hasta):
+    filtro = {}
+    if fecha_desde:
+        filtro['fecha__gte'] = fecha_desde
+    if fecha_hasta:
+        filtro['fecha__lte'] = fecha_hasta
+    return filtro
+
+
+def promedios(fila, formato='{clave}'):
+    """Promedios por plato (suma / n) desde una fila con sumas de ResumenDiario."""
+    resultado = {}
+    for n in nutrientes.NUTRIENTES_REPORTE:
+        cantidad = fila[CAMPOS_CANTIDAD[n.clave]]
+        suma = fila[CAMPOS_SUMA[n.clave]]
+        resultado[formato.format(clave=n.clave)] = (
+            Decimal(suma) / cantidad if cantidad else None
+        )
+    return resultado
+
+
+def sumas(prefijo=''):
+    """Kwargs de Sum() sobre ResumenDiario (o la relación `prefijo`) para agregar varias claves."""
+    return {campo: Sum(prefijo + campo) for campo in CAMPOS_RESUMEN}
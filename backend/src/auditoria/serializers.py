@@ -1,5 +1,10 @@
 from rest_framework import serializers
-from .models import Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, PlatoPlantilla, IngredientePlantilla
+from nutricion.models import AlimentoNutricional
+from . import nutrientes
+from .models import (
+    Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, PlatoPlantilla, IngredientePlantilla,
+    RegistroEliminado, TrabajoReporte,
+)
 
 
 class InstitucionSerializer(serializers.ModelSerializer):
@@ -14,8 +19,7 @@ class IngredientePlatoSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientePlato
         fields = '__all__'
-        read_only_fields = ['energia_kcal', 'proteinas_g', 'grasas_totales_g', 
-                           'carbohidratos_g', 'fibra_g', 'sodio_mg']
+        read_only_fields = nutrientes.CAMPOS_APORTE
 
 
 class PlatoObservadoSerializer(serializers.ModelSerializer):
@@ -24,8 +28,7 @@ class PlatoObservadoSerializer(serializers.ModelSerializer):
     class Meta:
         model = PlatoObservado
         fields = '__all__'
-        read_only_fields = ['energia_kcal_total', 'proteinas_g_total', 'grasas_totales_g_total',
-                           'carbohidratos_g_total', 'fibra_g_total', 'sodio_mg_total']
+        read_only_fields = nutrientes.CAMPOS_TOTAL
 
 
 class VisitaAuditoriaSerializer(serializers.ModelSerializer):
@@ -38,6 +41,42 @@ class VisitaAuditoriaSerializer(serializers.ModelSerializer):
         read_only_fields = []
 
 
+class RelacionPrecargadaField(serializers.PrimaryKeyRelatedField):
+    """
+    Resuelve la FK contra el dict `contexto` del contexto del serializer
+    (precargado con in_bulk) en lugar de hacer un SELECT por registro.
+    """
+    contexto = None
+
+    def to_internal_value(self, data):
+        precargadas = self.context.get(self.contexto)
+        if precargadas is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return precargadas[pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class InstitucionPrecargadaField(RelacionPrecargadaField):
+    contexto = 'instituciones'
+
+
+class AlimentoPrecargadoField(RelacionPrecargadaField):
+    contexto = 'alimentos'
+
+
+class VisitaAuditoriaSyncSerializer(VisitaAuditoriaSerializer):
+    """Validación de visitas dentro de /visitas/sync/ (sin consultas por registro)."""
+    institucion = InstitucionPrecargadaField(queryset=Institucion.objects.all())
+
+
 class VisitaAuditoriaListSerializer(serializers.ModelSerializer):
     institucion_nombre = serializers.CharField(source='institucion.nombre', read_only=True)
     cantidad_platos = serializers.IntegerField(read_only=True)  # Ya viene del annotate
@@ -62,5 +101,96 @@ class PlatoPlantillaSerializer(serializers.ModelSerializer):
     class Meta:
         model = PlatoPlantilla
         fields = '__all__'
-        read_only_fields = ['energia_kcal_total', 'proteinas_g_total', 'grasas_totales_g_total',
-                           'carbohidratos_g_total', 'fibra_g_total', 'sodio_mg_total']
+        read_only_fields = nutrientes.CAMPOS_TOTAL
+
+
+class PlatoObservadoCambioSerializer(PlatoObservadoSerializer):
+    """Plato sin ingredientes anidados: el feed de cambios los envía por separado."""
+    ingredientes = None
+
+
+class VisitaAuditoriaCambioSerializer(VisitaAuditoriaSerializer):
+    """Visita sin platos anidados: el feed de cambios los envía por separado."""
+    platos = None
+
+
+class RegistroEliminadoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RegistroEliminado
+        fields = ['modelo', 'objeto_id', 'eliminado_en']
+
+
+class ClonarPlantillasSerializer(serializers.Serializer):
+    plantilla_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    visita_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+
+class IngredienteVisitaCompletaSerializer(serializers.ModelSerializer):
+    alimento = AlimentoPrecargadoField(queryset=AlimentoNutricional.objects.all())
+
+    class Meta:
+        model = IngredientePlato
+        fields = ['alimento', 'cantidad', 'unidad', 'orden']
+
+
+class PlatoVisitaCompletaSerializer(serializers.ModelSerializer):
+    ingredientes = IngredienteVisitaCompletaSerializer(many=True, required=False)
+
+    class Meta:
+        model = PlatoObservado
+        fields = ['nombre', 'tipo_plato', 'porciones_servidas', 'notas', 'ingredientes']
+
+
+class VisitaCompletaSerializer(serializers.ModelSerializer):
+    """Alta de visita -> platos -> ingredientes en una sola llamada (ver grafo.py)."""
+    institucion = InstitucionPrecargadaField(queryset=Institucion.objects.all())
+    platos = PlatoVisitaCompletaSerializer(many=True, required=False)
+
+    class Meta:
+        model = VisitaAuditoria
+        fields = [
+            'institucion', 'fecha', 'tipo_comida', 'observaciones',
+            'formulario_completado', 'formulario_respuestas', 'platos',
+        ]
+
+
+class ComparativaParametrosSerializer(serializers.Serializer):
+    institucion_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    fecha_inicio = serializers.DateField(allow_null=True, default=None)
+    fecha_fin = serializers.DateField(allow_null=True, default=None)
+
+    def validate_institucion_ids(self, value):
+        return sorted(set(value))
+
+
+class InstitucionesFiltrosParametrosSerializer(serializers.Serializer):
+    fecha_inicio = serializers.DateField(allow_null=True, default=None)
+    fecha_fin = serializers.DateField(allow_null=True, default=None)
+    filtros = serializers.DictField(child=serializers.CharField(allow_blank=True), default=dict)
+
+
+class TrabajoReporteCrearSerializer(serializers.Serializer):
+    """Alta de un trabajo: valida y normaliza los parámetros según el tipo."""
+    PARAMETROS = {
+        'comparativa': ComparativaParametrosSerializer,
+        'instituciones_filtros': InstitucionesFiltrosParametrosSerializer,
+    }
+
+    tipo = serializers.ChoiceField(choices=TrabajoReporte.TIPO_CHOICES)
+    parametros = serializers.DictField(default=dict)
+
+    def validate(self, data):
+        parametros = self.PARAMETROS[data['tipo']](data=data['parametros'])
+        if not parametros.is_valid():
+            raise serializers.ValidationError({'parametros': parametros.errors})
+        # Representación JSON (fechas ISO, ids ordenados): base de la huella
+        return {'tipo': data['tipo'], 'parametros': dict(parametros.data)}
+
+
+class TrabajoReporteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TrabajoReporte
+        fields = [
+            'id', 'tipo', 'parametros', 'estado', 'resultado', 'error',
+            'creado_en', 'iniciado_en', 'terminado_en',
+        ]
@@ -0,0 +1,193 @@
+import threading
+
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+
+from core.cache import invalidar_al_confirmar
+
+from . import contadores, etiquetas, resumenes
+from .formularios import proyectar_respuestas
+from .models import Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, RegistroEliminado
+
+
+MODELOS_CON_TOMBSTONE = {
+    Institucion: "institucion",
+    VisitaAuditoria: "visita",
+    PlatoObservado: "plato",
+    IngredientePlato: "ingrediente",
+}
+
+_hilo = threading.local()
+
+
+class _Borrado:
+    """
+    Lo que deja un borrado en cascada (un Collector.delete): tombstones,
+    claves de resumen y diferencias de contadores. Se escriben juntos cuando
+    llega el post_delete del último objeto, todavía dentro de la transacción
+    del borrado.
+    """
+
+    def __init__(self, origen):
+        self.origen = origen
+        self.pendientes = set()
+        self.borrando = False
+        self.tombstones = []
+        self.claves = set()
+        self.visitas_borradas = set()
+        self.visitas_de_platos = set()
+        self.instituciones = []
+
+    def anotar(self, sender, instance):
+        self.pendientes.add((sender, instance.pk))
+        if sender is VisitaAuditoria:
+            self.claves.add(resumenes.clave_visita(instance))
+            self.visitas_borradas.add(instance.pk)
+        elif sender is PlatoObservado:
+            self.visitas_de_platos.add(instance.visita_id)
+        elif sender is Institucion:
+            self.instituciones.append(contadores.estado_institucion(instance))
+
+    def registrar(self, sender, instance):
+        """Devuelve True con el último objeto del borrado."""
+        self.borrando = True
+        self.pendientes.discard((sender, instance.pk))
+        self.tombstones.append(RegistroEliminado(modelo=MODELOS_CON_TOMBSTONE[sender], objeto_id=instance.pk))
+        return not self.pendientes
+
+    def guardar(self):
+        RegistroEliminado.objects.bulk_create(self.tombstones)
+        # Las visitas de los platos que siguen existiendo (1 consulta)
+        visitas = self.visitas_de_platos - self.visitas_borradas
+        if visitas:
+            self.claves |= resumenes.claves_de_visitas(visitas)
+        resumenes.marcar(self.claves)
+        if self.instituciones:
+            contadores.sumar(contadores.de_instituciones(self.instituciones, [None] * len(self.instituciones)))
+
+
+def anotar_borrado(sender, instance, origin=None, **kwargs):
+    """pre_delete: Collector.delete los envía todos antes de borrar."""
+    borrado = getattr(_hilo, 'borrado', None)
+    # Otro borrado, o un reintento del mismo tras un error
+    if (borrado is None or borrado.origen is not origin or borrado.borrando
+            or (sender, instance.pk) in borrado.pendientes):
+        borrado = _hilo.borrado = _Borrado(origin)
+    borrado.anotar(sender, instance)
+
+
+def registrar_borrado(sender, instance, origin=None, **kwargs):
+    """post_delete: deja un tombstone para que los clientes offline se enteren del borrado."""
+    borrado = getattr(_hilo, 'borrado', None)
+    if borrado is None or borrado.origen is not origin or (sender, instance.pk) not in borrado.pendientes:
+        # Sin pre_delete previo (no debería pasar): se registra sólo este objeto
+        borrado = _Borrado(origin)
+        borrado.anotar(sender, instance)
+    if borrado.registrar(sender, instance):
+        if getattr(_hilo, 'borrado', None) is borrado:
+            _hilo.borrado = None
+        borrado.guardar()
+
+
+# Se conecta por modelo (no con sender=None) para no desactivar el fast-delete del resto
+for _modelo in MODELOS_CON_TOMBSTONE:
+    pre_delete.connect(anotar_borrado, sender=_modelo, dispatch_uid=f'borrado_previo_{_modelo.__name__}')
+    post_delete.connect(registrar_borrado, sender=_modelo, dispatch_uid=f'tombstone_{_modelo.__name__}')
+
+
+def actualizar_respuestas(sender, instance, update_fields=None, **kwargs):
+    """Mantiene RespuestaFormulario al día con el JSON de la visita."""
+    if update_fields is not None and 'formulario_respuestas' not in update_fields:
+        return
+    proyectar_respuestas([instance])
+
+
+post_save.connect(actualizar_respuestas, sender=VisitaAuditoria, dispatch_uid='respuestas_formulario')
+
+
+# Lo que determina la clave de resumen previa, por modelo
+CAMPOS_CLAVE_RESUMEN = {
+    VisitaAuditoria: ('fecha', 'institucion_id', 'tipo_comida'),
+    PlatoObservado: ('visita_id',),
+}
+
+
+def recordar_clave_cargada(sender, instance, **kwargs):
+    """Guarda (sin consultas) los campos de la clave de resumen tal como están en la base."""
+    valores = instance.__dict__
+    campos = CAMPOS_CLAVE_RESUMEN[sender]
+    # Con campos diferidos no se sabe: recordar_clave_resumen consulta
+    if instance.pk is None or any(campo not in valores for campo in campos):
+        instance._clave_resumen_cargada = None
+    elif sender is VisitaAuditoria:
+        instance._clave_resumen_cargada = resumenes.clave_visita(valores)
+    else:
+        instance._clave_resumen_cargada = valores['visita_id']
+
+
+def recordar_clave_resumen(sender, instance, **kwargs):
+    """Guarda la clave de resumen previa por si el guardado la cambia."""
+    instance._claves_resumen_previas = set()
+    if instance.pk is None:
+        return
+    cargada = getattr(instance, '_clave_resumen_cargada', None)
+    if sender is VisitaAuditoria:
+        previas = {cargada} if cargada else resumenes.claves_de_visitas([instance.pk])
+    elif cargada is None:
+        previas = resumenes.claves_de_platos([instance.pk])
+    elif cargada != instance.visita_id:
+        previas = resumenes.claves_de_visitas([cargada])
+    else:
+        # Misma visita: la clave previa es la actual
+        previas = set()
+    instance._claves_resumen_previas = previas
+
+
+def _claves_plato(plato):
+    if PlatoObservado.visita.is_cached(plato):
+        return {resumenes.clave_visita(plato.visita)}
+    return resumenes.claves_de_visitas([plato.visita_id])
+
+
+def refrescar_resumen(sender, instance, **kwargs):
+    """Refresca ResumenDiario de la clave actual (y la previa) al confirmar."""
+    claves = set(getattr(instance, '_claves_resumen_previas', ()))
+    if sender is VisitaAuditoria:
+        claves.add(resumenes.clave_visita(instance))
+    else:
+        claves |= _claves_plato(instance)
+    resumenes.marcar(claves)
+    # Lo guardado pasa a ser lo que está en la base
+    recordar_clave_cargada(sender, instance)
+
+
+# Los borrados refrescan los resúmenes en registrar_borrado, una vez por cascada
+for _modelo in (VisitaAuditoria, PlatoObservado):
+    post_init.connect(recordar_clave_cargada, sender=_modelo, dispatch_uid=f'resumen_cargado_{_modelo.__name__}')
+    pre_save.connect(recordar_clave_resumen, sender=_modelo, dispatch_uid=f'resumen_previo_{_modelo.__name__}')
+    post_save.connect(refrescar_resumen, sender=_modelo, dispatch_uid=f'resumen_{_modelo.__name__}')
+
+
+def invalidar_institucion(sender, instance, **kwargs):
+    invalidar_al_confirmar(*etiquetas.de_institucion(instance.pk))
+
+
+post_save.connect(invalidar_institucion, sender=Institucion, dispatch_uid='cache_institucion')
+post_delete.connect(invalidar_institucion, sender=Institucion, dispatch_uid='cache_institucion_borrado')
+
+
+def recordar_estado_institucion(sender, instance, **kwargs):
+    """Guarda (activo, tipo) previos para ajustar los contadores del dashboard."""
+    instance._estado_previo = None
+    if instance.pk is not None:
+        instance._estado_previo = Institucion.objects.filter(pk=instance.pk).values_list('activo', 'tipo').first()
+
+
+def contar_institucion(sender, instance, **kwargs):
+    contadores.sumar(contadores.de_instituciones(
+        [getattr(instance, '_estado_previo', None)], [contadores.estado_institucion(instance)]
+    ))
+
+
+pre_save.connect(recordar_estado_institucion, sender=Institucion, dispatch_uid='contador_institucion_previo')
+post_save.connect(contar_institucion, sender=Institucion, dispatch_uid='contador_institucion')
+# Los borrados descuentan en registrar_borrado
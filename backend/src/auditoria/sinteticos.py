@@ -0,0 +1,258 @@
+"""
+Datos sintéticos para medir rendimiento (ver los comandos generar_datos y
+benchmark).
+
+GeneradorSintetico crea instituciones, visitas, platos e ingredientes sobre
+el catálogo real de alimentos con la misma forma que los datos cargados
+desde las apps: tipos de comida según el tipo de institución, platos típicos
+con ingredientes de categorías acordes y cantidades en gramos razonables, y
+el formulario de relevamiento de la app móvil. Con la misma semilla genera
+siempre los mismos datos.
+
+Se escribe con bulk_create por lotes de visitas (sin señales): las
+respuestas del formulario se proyectan por lote y los resúmenes diarios se
+reconstruyen al final.
+"""
+import datetime
+import random
+from decimal import Decimal
+
+from core.cache import invalidar
+from nutricion.models import AlimentoNutricional
+from . import contadores, resumenes
+from .bulk import bulk_create_con_ids, en_lotes
+from .formularios import proyectar_respuestas
+from .grafo import crear_platos
+from .models import (
+    Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, RespuestaFormulario, ResumenDiario,
+    PlatoPlantilla, IngredientePlantilla,
+)
+from .recalculo import RecalculoTotales
+
+
+PREFIJO_CODIGO = 'SIN-'
+DESCRIPCION_PLANTILLA = 'Plantilla sintética'
+
+COMIDAS_POR_TIPO = {
+    'escuela': ['desayuno', 'almuerzo', 'almuerzo', 'merienda'],
+    'cdi': ['desayuno', 'almuerzo', 'merienda'],
+    'hogar': ['desayuno', 'almuerzo', 'merienda', 'cena'],
+    'geriatrico': ['desayuno', 'almuerzo', 'merienda', 'cena'],
+    'otro': ['almuerzo', 'vianda'],
+}
+PESO_TIPOS = {'escuela': 6, 'cdi': 3, 'hogar': 1, 'geriatrico': 1, 'otro': 1}
+
+BARRIOS_POR_COMUNA = {
+    'Comuna 1': ['Retiro', 'San Nicolás', 'Monserrat', 'Constitución'],
+    'Comuna 3': ['Balvanera', 'San Cristóbal'],
+    'Comuna 4': ['La Boca', 'Barracas', 'Parque Patricios', 'Nueva Pompeya'],
+    'Comuna 7': ['Flores', 'Parque Chacabuco'],
+    'Comuna 8': ['Villa Soldati', 'Villa Riachuelo', 'Villa Lugano'],
+    'Comuna 9': ['Liniers', 'Mataderos', 'Parque Avellaneda'],
+    'Comuna 10': ['Villa Real', 'Monte Castro', 'Versalles', 'Floresta', 'Vélez Sarsfield', 'Villa Luro'],
+    'Comuna 11': ['Villa General Mitre', 'Villa Devoto', 'Villa del Parque', 'Villa Santa Rita'],
+    'Comuna 12': ['Coghlan', 'Saavedra', 'Villa Urquiza', 'Villa Pueyrredón'],
+    'Comuna 15': ['Chacarita', 'Villa Crespo', 'Paternal', 'Villa Ortúzar', 'Agronomía', 'Parque Chas'],
+}
+CALLES = ['Av. Rivadavia', 'Av. San Juan', 'Av. Directorio', 'Av. Eva Perón', 'Av. Cabildo', 'Pedernera', 'Mozart', 'Lacarra']
+
+# tipo de plato: (nombres, categorías de los ingredientes, gramos mínimo y máximo)
+PLATOS = {
+    'principal': (
+        ['Guiso de lentejas', 'Arroz con pollo', 'Fideos con tuco', 'Polenta con salsa',
+         'Pastel de papa', 'Milanesa con puré', 'Estofado de carne', 'Tarta de verdura'],
+        ['CER', 'HOR', 'PES', 'GRA', 'CON'], 20, 180,
+    ),
+    'guarnicion': (['Ensalada mixta', 'Puré de calabaza', 'Arroz blanco', 'Verduras salteadas'], ['HOR', 'CER', 'GRA'], 15, 120),
+    'postre': (['Fruta de estación', 'Ensalada de frutas', 'Compota', 'Postre de leche'], ['FRT'], 60, 150),
+    'bebida': (['Jugo natural', 'Agua saborizada', 'Mate cocido', 'Licuado'], ['FRT', 'CON'], 100, 250),
+    'otro': (['Pan', 'Galletitas', 'Barrita de cereal'], ['CER', 'CON'], 20, 60),
+}
+ORDEN_PLATOS = ['principal', 'guarnicion', 'postre', 'bebida', 'otro']
+
+
+class GeneradorSintetico:
+    """
+    Genera `instituciones` instituciones con `visitas_por_anio` visitas por
+    año en los últimos `anios` años, `platos_por_visita` platos por visita y
+    `ingredientes_por_plato` ingredientes por plato, más `plantillas` platos
+    plantilla.
+    """
+
+    def __init__(self, instituciones, visitas_por_anio, platos_por_visita, ingredientes_por_plato,
+                 anios=1, plantillas=0, semilla=1, visitas_por_lote=500, hasta=None):
+        self.instituciones = instituciones
+        self.plantillas = plantillas
+        self.visitas_por_anio = visitas_por_anio
+        self.platos_por_visita = platos_por_visita
+        self.ingredientes_por_plato = ingredientes_por_plato
+        self.anios = anios
+        self.visitas_por_lote = visitas_por_lote
+        self.hasta = hasta or datetime.date.today()
+        self.desde = self.hasta - datetime.timedelta(days=365 * anios - 1)
+        self.random = random.Random(semilla)
+
+    def generar(self):
+        """Crea los datos. Emite (etapa, procesados, total) para mostrar progreso."""
+        candidatos = self._candidatos()
+        instituciones = self._crear_instituciones()
+        yield 'instituciones', len(instituciones), len(instituciones)
+        if self.plantillas:
+            self._crear_plantillas(candidatos)
+            yield 'plantillas', self.plantillas, self.plantillas
+
+        total = len(instituciones) * self.visitas_por_anio * self.anios
+        procesadas = 0
+        for lote in en_lotes(self._visitas(instituciones), self.visitas_por_lote):
+            bulk_create_con_ids(VisitaAuditoria, lote)
+            proyectar_respuestas(lote)
+            crear_platos((visita, self._platos(candidatos)) for visita in lote)
+            procesadas += len(lote)
+            yield 'visitas', procesadas, total
+
+        for _, hasta, _ in resumenes.reconstruir(self.desde, self.hasta):
+            yield 'resumenes', (hasta - self.desde).days + 1, (self.hasta - self.desde).days + 1
+
+    @staticmethod
+    def limpiar():
+        """
+        Borra las instituciones sintéticas con sus visitas, platos, ingredientes,
+        respuestas y resúmenes, y las plantillas sintéticas. Se borra por tabla sin pasar por el collector:
+        no hacen falta tombstones ni refrescos por objeto. Devuelve cuántas.
+        """
+        instituciones = Institucion.objects.filter(codigo__startswith=PREFIJO_CODIGO)
+        plantillas = PlatoPlantilla.objects.filter(descripcion=DESCRIPCION_PLANTILLA)
+        cantidad = instituciones.count()
+        for queryset in (
+            IngredientePlantilla.objects.filter(plato_plantilla__in=plantillas),
+            plantillas,
+            IngredientePlato.objects.filter(plato__visita__institucion__in=instituciones),
+            PlatoObservado.objects.filter(visita__institucion__in=instituciones),
+            RespuestaFormulario.objects.filter(visita__institucion__in=instituciones),
+            ResumenDiario.objects.filter(institucion__in=instituciones),
+            VisitaAuditoria.objects.filter(institucion__in=instituciones),
+            instituciones,
+        ):
+            queryset._raw_delete(queryset.db)
+        contadores.reconciliar()
+        invalidar('reportes', 'instituciones')
+        return cantidad
+
+    @staticmethod
+    def _candidatos():
+        """{tipo de plato: alimentos posibles} según las categorías del catálogo."""
+        por_categoria = {}
+        for pk, codigo in AlimentoNutricional.objects.values_list('pk', 'categoria__codigo').order_by('pk'):
+            por_categoria.setdefault(codigo, []).append(AlimentoNutricional(pk=pk))
+        todos = [alimento for alimentos in por_categoria.values() for alimento in alimentos]
+        if not todos:
+            raise ValueError('El catálogo de alimentos está vacío')
+        return {
+            tipo: [a for categoria in categorias for a in por_categoria.get(categoria, ())] or todos
+            for tipo, (_, categorias, _, _) in PLATOS.items()
+        }
+
+    def _crear_instituciones(self):
+        existentes = Institucion.objects.filter(codigo__startswith=PREFIJO_CODIGO).count()
+        tipos = list(PESO_TIPOS)
+        instituciones = []
+        for numero in range(existentes + 1, existentes + self.instituciones + 1):
+            tipo = self.random.choices(tipos, weights=list(PESO_TIPOS.values()))[0]
+            comuna = self.random.choice(list(BARRIOS_POR_COMUNA))
+            instituciones.append(Institucion(
+                codigo=f'{PREFIJO_CODIGO}{numero:05d}',
+                nombre=f'{dict(Institucion.TIPO_CHOICES)[tipo]} N° {numero}',
+                tipo=tipo,
+                direccion=f'{self.random.choice(CALLES)} {self.random.randint(100, 8000)}',
+                barrio=self.random.choice(BARRIOS_POR_COMUNA[comuna]),
+                comuna=comuna,
+                activo=self.random.random() > 0.05,
+            ))
+        return bulk_create_con_ids(Institucion, instituciones)
+
+    def _crear_plantillas(self, candidatos):
+        plantillas = []
+        for indice in range(self.plantillas):
+            tipo = ORDEN_PLATOS[indice % len(ORDEN_PLATOS)]
+            plantillas.append(PlatoPlantilla(
+                nombre=self.random.choice(PLATOS[tipo][0]),
+                tipo_plato=tipo,
+                descripcion=DESCRIPCION_PLANTILLA,
+            ))
+        bulk_create_con_ids(PlatoPlantilla, plantillas)
+        IngredientePlantilla.objects.bulk_create(
+            [
+                IngredientePlantilla(plato_plantilla=plantilla, **ingrediente)
+                for plantilla in plantillas
+                for ingrediente in self._ingredientes(plantilla.tipo_plato, candidatos)
+            ],
+            batch_size=1000,
+        )
+        for _ in RecalculoTotales().recalcular_plantillas(
+            PlatoPlantilla.objects.filter(pk__in=[plantilla.pk for plantilla in plantillas])
+        ):
+            pass
+
+    def _visitas(self, instituciones):
+        dias = (self.hasta - self.desde).days + 1
+        for institucion in instituciones:
+            for _ in range(self.visitas_por_anio * self.anios):
+                fecha = self.desde + datetime.timedelta(days=self.random.randrange(dias))
+                if fecha.weekday() >= 5 and institucion.tipo in ('escuela', 'cdi'):
+                    # Sin fines de semana: al viernes anterior o, si queda fuera del rango, al lunes
+                    viernes = fecha - datetime.timedelta(days=fecha.weekday() - 4)
+                    fecha = viernes if viernes >= self.desde else fecha + datetime.timedelta(days=7 - fecha.weekday())
+                completado = self.random.random() < 0.7
+                yield VisitaAuditoria(
+                    institucion=institucion,
+                    fecha=fecha,
+                    tipo_comida=self.random.choice(COMIDAS_POR_TIPO[institucion.tipo]),
+                    observaciones=self.random.choice([None, None, 'Sin novedades', 'Faltante de insumos']),
+                    formulario_completado=completado,
+                    formulario_respuestas=self._formulario() if completado else None,
+                )
+
+    def _formulario(self):
+        """Respuestas con la forma del formulario de relevamiento de la app móvil."""
+        programadas = self.random.randint(30, 400)
+        control = self.random.random() < 0.8
+        return {
+            'prestacion': {
+                'servicio_funcionando': self.random.random() < 0.95,
+                'serv_obs': self.random.choice(['', '', 'Demora en la entrega']),
+            },
+            'raciones': {
+                'cant_prog': str(programadas),
+                'cant_serv': str(programadas - self.random.randint(0, programadas // 10)),
+            },
+            'temperaturas': {
+                'ctrl_temp': control,
+                'temp_frio': str(self.random.randint(2, 8)) if control else '',
+                'temp_caliente': str(self.random.randint(60, 85)) if control else '',
+            },
+        }
+
+    def _platos(self, candidatos):
+        platos = []
+        for indice in range(self.platos_por_visita):
+            tipo = ORDEN_PLATOS[indice % len(ORDEN_PLATOS)]
+            platos.append({
+                'nombre': self.random.choice(PLATOS[tipo][0]),
+                'tipo_plato': tipo,
+                'porciones_servidas': self.random.randint(20, 300),
+                'notas': None,
+                'ingredientes': self._ingredientes(tipo, candidatos),
+            })
+        return platos
+
+    def _ingredientes(self, tipo, candidatos):
+        _, _, minimo, maximo = PLATOS[tipo]
+        return [
+            {
+                'alimento': self.random.choice(candidatos[tipo]),
+                'cantidad': Decimal(self.random.randint(minimo * 10, maximo * 10)) / 10,
+                'unidad': 'g',
+                'orden': orden,
+            }
+            for orden in range(1, self.ingredientes_por_plato + 1)
+        ]
@@ -0,0 +1,276 @@
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import invalidar_al_confirmar
+
+from . import contadores, etiquetas, resumenes
+from .bulk import bulk_create_con_ids, en_lotes
+from .formularios import proyectar_respuestas
+from .models import Institucion, VisitaAuditoria
+from .serializers import InstitucionSerializer, VisitaAuditoriaSyncSerializer
+
+
+class SincronizadorLote:
+    """
+    Sincronización Offline-First por lotes.
+
+    Lee todos los registros referenciados con un único in_bulk, resuelve
+    Last Write Wins (updated_at) en memoria y escribe con bulk_create /
+    bulk_update en lotes de `batch_size`. Devuelve un resultado por entrada,
+    en el mismo orden en que llegaron.
+    """
+    model = None
+    serializer_class = None
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.SYNC_BATCH_SIZE
+
+    def get_serializer_context(self, entries):
+        return {}
+
+    def preparar_entrada(self, entry):
+        """Hook para completar/normalizar cada entrada antes de validarla."""
+        return entry
+
+    def despues_de_cargar(self, existentes):
+        """Hook con los registros existentes ({pk: obj}) antes de modificarlos."""
+
+    def despues_de_guardar(self, objetos):
+        """Hook con los objetos creados/actualizados (bulk_* no emite señales)."""
+
+    def sincronizar(self, entries):
+        entries = [self.preparar_entrada(entry) for entry in entries]
+        resultados = [None] * len(entries)
+        pks = self._resolver_ids(entries, resultados)
+        existentes = self.model.objects.in_bulk(set(pks.values()))
+        self.despues_de_cargar(existentes)
+        context = self.get_serializer_context(entries)
+
+        crear = []          # [(indice, obj)]
+        actualizar = {}     # pk -> obj
+        campos = set()
+
+        for i, entry in enumerate(entries):
+            if resultados[i] is not None:
+                continue
+            local_id = entry.get('local_id')
+            try:
+                if i in pks:
+                    instance = existentes.get(pks[i])
+                    if instance is None:
+                        raise self.model.DoesNotExist(
+                            f"{self.model.__name__} matching query does not exist."
+                        )
+                    # Conflict Resolution: Last Write Wins (comparando ISO strings)
+                    client_updated_at = entry.get('updated_at')
+                    if client_updated_at and client_updated_at > instance.updated_at.isoformat():
+                        serializer = self.serializer_class(instance, data=entry, partial=True, context=context)
+                        if serializer.is_valid():
+                            for attr, value in serializer.validated_data.items():
+                                setattr(instance, attr, value)
+                            instance.updated_at = timezone.now()
+                            actualizar[instance.pk] = instance
+                            campos.update(serializer.validated_data)
+                            resultados[i] = {"local_id": local_id, "id": instance.id, "status": "updated"}
+                        else:
+                            resultados[i] = {"local_id": local_id, "error": serializer.errors, "status": "error"}
+                    else:
+                        resultados[i] = {"local_id": local_id, "id": instance.id, "status": "skipped_older"}
+                else:
+                    serializer = self.serializer_class(data=entry, context=context)
+                    if serializer.is_valid():
+                        crear.append((i, self.model(**serializer.validated_data)))
+                    else:
+                        resultados[i] = {"local_id": local_id, "error": serializer.errors, "status": "error"}
+            except Exception as e:
+                resultados[i] = {"local_id": local_id, "error": str(e), "status": "error"}
+
+        self._crear(entries, crear, resultados)
+        self._actualizar(list(actualizar.values()), sorted(campos | {'updated_at'}), entries, resultados)
+
+        guardados = {obj.pk: obj for _, obj in crear if obj.pk is not None}
+        guardados.update(actualizar)
+        ok = {r['id'] for r in resultados if r.get('status') in ('created', 'updated')}
+        self.despues_de_guardar([obj for pk, obj in guardados.items() if pk in ok])
+        return resultados
+
+    def _resolver_ids(self, entries, resultados):
+        """Convierte los `id` recibidos a pk; los inválidos quedan como error."""
+        pk_field = self.model._meta.pk
+        pks = {}
+        for i, entry in enumerate(entries):
+            server_id = entry.get('id')
+            if not server_id:
+                continue
+            try:
+                pks[i] = pk_field.get_prep_value(server_id)
+            except (TypeError, ValueError) as e:
+                resultados[i] = {"local_id": entry.get('local_id'), "error": str(e), "status": "error"}
+        return pks
+
+    def _crear(self, entries, crear, resultados):
+        for lote in en_lotes(crear, self.batch_size):
+            try:
+                with transaction.atomic():
+                    bulk_create_con_ids(self.model, [obj for _, obj in lote])
+            except Exception:
+                # Reintento fila por fila para aislar el registro inválido
+                for i, obj in lote:
+                    try:
+                        with transaction.atomic():
+                            obj.pk = None
+                            bulk_create_con_ids(self.model, [obj])
+                    except Exception as e:
+                        resultados[i] = {"local_id": entries[i].get('local_id'), "error": str(e), "status": "error"}
+            for i, obj in lote:
+                if resultados[i] is None:
+                    resultados[i] = {"local_id": entries[i].get('local_id'), "id": obj.id, "status": "created"}
+
+    def _actualizar(self, objetos, campos, entries, resultados):
+        for lote in en_lotes(objetos, self.batch_size):
+            try:
+                with transaction.atomic():
+                    self.model.objects.bulk_update(lote, campos)
+            except Exception:
+                for obj in lote:
+                    try:
+                        with transaction.atomic():
+                            self.model.objects.bulk_update([obj], campos)
+                    except Exception as e:
+                        self._marcar_error(obj, e, entries, resultados)
+
+    def _marcar_error(self, obj, error, entries, resultados):
+        for i, resultado in enumerate(resultados):
+            if resultado.get('status') == 'updated' and resultado.get('id') == obj.pk:
+                resultados[i] = {"local_id": entries[i].get('local_id'), "error": str(error), "status": "error"}
+
+
+class InstitucionSincronizador(SincronizadorLote):
+    model = Institucion
+    serializer_class = InstitucionSerializer
+
+    def preparar_entrada(self, entry):
+        # Ensure codigo exists (it's mandatory in model)
+        if not entry.get('codigo'):
+            entry['codigo'] = entry.get('nombre', 'INST').upper()[:10] + "-" + str(entry.get('local_id'))[:8]
+        return entry
+
+    def despues_de_cargar(self, existentes):
+        self._estados_previos = {pk: contadores.estado_institucion(obj) for pk, obj in existentes.items()}
+
+    def despues_de_guardar(self, objetos):
+        contadores.sumar(contadores.de_instituciones(
+            [self._estados_previos.get(obj.pk) for obj in objetos],
+            [contadores.estado_institucion(obj) for obj in objetos],
+        ))
+        invalidar_al_confirmar(*{etiqueta for obj in objetos for etiqueta in etiquetas.de_institucion(obj.pk)})
+
+
+class VisitaSincronizador(SincronizadorLote):
+    model = VisitaAuditoria
+    serializer_class = VisitaAuditoriaSyncSerializer
+
+    def get_serializer_context(self, entries):
+        ids = set()
+        for entry in entries:
+            institucion = entry.get('institucion')
+            if isinstance(institucion, bool):
+                continue
+            try:
+                ids.add(int(institucion))
+            except (TypeError, ValueError):
+                continue
+        return {'instituciones': Institucion.objects.in_bulk(ids)}
+
+    def despues_de_cargar(self, existentes):
+        # Claves de resumen previas: una actualización puede mover la visita de día
+        self._claves_previas = {resumenes.clave_visita(v) for v in existentes.values()}
+
+    def despues_de_guardar(self, objetos):
+        proyectar_respuestas(objetos)
+        resumenes.marcar(self._claves_previas | {resumenes.clave_visita(v) for v in objetos})
+
+
+def _leer_ndjson(lineas):
+    """Decodifica un flujo NDJSON; las líneas inválidas se devuelven como error."""
+    for numero, linea in enumerate(lineas, start=1):
+        if isinstance(linea, bytes):
+            linea = linea.decode('utf-8', errors='replace')
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            entry = json.loads(linea)
+        except ValueError as e:
+            yield numero, None, f"JSON inválido: {e}"
+            continue
+        if not isinstance(entry, dict):
+            yield numero, None, "Se esperaba un objeto JSON por línea"
+            continue
+        yield numero, entry, None
+
+
+def sincronizar_stream(sincronizador, lineas, cursor=None):
+    """
+    Sincronización NDJSON en streaming.
+
+    Lee el cuerpo línea por línea, aplica cada lote de `batch_size` registros
+    en su propia transacción y, al confirmar, emite los resultados del lote
+    seguidos de una línea `{"cursor": <último local_id confirmado>}`.
+
+    Si se recibe `cursor` (el último local_id confirmado en un intento
+    anterior), se descartan todas las entradas hasta esa inclusive; así el
+    cliente puede reenviar su cola completa tras un corte de conexión sin
+    volver a aplicar lo ya confirmado.
+    """
+    estado = {'cursor': cursor, 'procesados': 0}
+
+    def _confirmar(lote):
+        entries = [entry for _, entry, _ in lote if entry is not None]
+        with transaction.atomic():
+            resultados = iter(sincronizador.sincronizar(entries))
+        for numero, entry, error in lote:
+            if entry is None:
+                yield {"local_id": None, "linea": numero, "error": error, "status": "error"}
+            else:
+                yield next(resultados)
+                if entry.get('local_id') is not None:
+                    estado['cursor'] = entry.get('local_id')
+        estado['procesados'] += len(lote)
+        yield {"cursor": estado['cursor'], "procesados": estado['procesados']}
+
+    def _lotes():
+        saltando = cursor is not None
+        lote = []
+        for item in _leer_ndjson(lineas):
+            entry = item[1]
+            if saltando:
+                if entry is not None and str(entry.get('local_id')) == str(cursor):
+                    saltando = False
+                continue
+            lote.append(item)
+            if len(lote) >= sincronizador.batch_size:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+        if saltando:
+            raise ValueError("cursor no encontrado en el flujo; no se aplicó ningún registro")
+
+    try:
+        for lote in _lotes():
+            for linea in _confirmar(lote):
+                yield _ndjson(linea)
+    except Exception as e:
+        # Lo confirmado hasta acá queda aplicado; el cliente reanuda desde `cursor`
+        yield _ndjson({"error": str(e), "status": "error", "cursor": estado['cursor']})
+        return
+
+    yield _ndjson({"fin": True, "cursor": estado['cursor'], "procesados": estado['procesados']})
+
+
+def _ndjson(obj):
+    return json.dumps(obj, ensure_ascii=False, default=str, separators=(',', ':')) + '\n'
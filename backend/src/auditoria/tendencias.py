@@ -0,0 +1,227 @@
+"""
+Tendencia de nutrientes por plato en el tiempo: para cada período (día,
+semana, mes o trimestre) y grupo (institución, comuna o tipo de comida)
+cantidad de platos, media, mínimo, máximo y percentiles de cada nutriente.
+
+Los percentiles no se pueden sacar de ResumenDiario (sólo guarda sumas), así
+que se leen los totales de los platos con una consulta por pedido y se
+agregan en Python. Cada período se guarda en caché por separado, etiquetado
+con los meses que cubre (ver etiquetas.py): una escritura invalida sólo los
+períodos de su mes y en el siguiente pedido se recalculan sólo esos. Los
+períodos son siempre completos (una semana de lunes a domingo, un mes
+entero) aunque el rango pedido los corte, para poder reutilizarlos.
+"""
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from core.cache import claves_etiquetadas
+from core.estadistica import percentil
+
+from . import argumentos, etiquetas, nutrientes
+from .models import PlatoObservado, VisitaAuditoria
+
+
+GRANULARIDADES = ('dia', 'semana', 'mes', 'trimestre')
+# agrupación: lookup desde el plato
+AGRUPACIONES = {
+    'institucion': 'visita__institucion_id',
+    'comuna': 'visita__institucion__comuna',
+    'tipo_comida': 'visita__tipo_comida',
+}
+PERCENTILES = (25, 50, 75, 90)
+NUTRIENTES = {n.clave: n for n in nutrientes.NUTRIENTES}
+TIPOS_COMIDA = {clave for clave, _ in VisitaAuditoria.TIPO_COMIDA_CHOICES}
+
+# Más períodos por pedido son demasiadas entradas de caché (y de respuesta)
+MAX_PERIODOS = 400
+DIAS_POR_DEFECTO = 365
+TIMEOUT = 60 * 60 * 6
+
+
+def inicio_periodo(fecha, granularidad):
+    if granularidad == 'semana':
+        return fecha - datetime.timedelta(days=fecha.weekday())
+    if granularidad == 'mes':
+        return fecha.replace(day=1)
+    if granularidad == 'trimestre':
+        return fecha.replace(month=(fecha.month - 1) // 3 * 3 + 1, day=1)
+    return fecha
+
+
+def siguiente_periodo(inicio, granularidad):
+    if granularidad == 'semana':
+        return inicio + datetime.timedelta(days=7)
+    if granularidad in ('mes', 'trimestre'):
+        meses = inicio.month - 1 + (1 if granularidad == 'mes' else 3)
+        return inicio.replace(year=inicio.year + meses // 12, month=meses % 12 + 1)
+    return inicio + datetime.timedelta(days=1)
+
+
+class TendenciaNutrientes:
+    """
+    Tendencia entre `fecha_inicio` y `fecha_fin` (por defecto el último año),
+    opcionalmente filtrada por instituciones, comunas y tipos de comida. Los
+    parámetros inválidos levantan ValueError.
+    """
+
+    def __init__(self, granularidad='mes', fecha_inicio=None, fecha_fin=None, agrupar=None,
+                 nutrientes_pedidos=None, instituciones=None, comunas=None, tipos_comida=None):
+        if granularidad not in GRANULARIDADES:
+            raise ValueError(f"Granularidad inválida: {granularidad}. Opciones: {', '.join(GRANULARIDADES)}")
+        if agrupar and agrupar not in AGRUPACIONES:
+            raise ValueError(f"Agrupación inválida: {agrupar}. Opciones: {', '.join(AGRUPACIONES)}")
+        claves = list(nutrientes_pedidos or nutrientes.CLAVES_REPORTE)
+        invalidos = [clave for clave in claves if clave not in NUTRIENTES]
+        if invalidos:
+            raise ValueError(f"Nutriente inválido: {', '.join(invalidos)}. Opciones: {', '.join(NUTRIENTES)}")
+        if tipos_comida and set(tipos_comida) - TIPOS_COMIDA:
+            raise ValueError(f"Tipo de comida inválido: {', '.join(sorted(set(tipos_comida) - TIPOS_COMIDA))}")
+
+        self.granularidad = granularidad
+        self.agrupar = agrupar or None
+        self.nutrientes = claves
+        self.fecha_fin = argumentos.fecha(fecha_fin) if fecha_fin else datetime.date.today()
+        self.fecha_inicio = (
+            argumentos.fecha(fecha_inicio) if fecha_inicio else self.fecha_fin - datetime.timedelta(days=DIAS_POR_DEFECTO)
+        )
+        if self.fecha_inicio > self.fecha_fin:
+            raise ValueError("fecha_inicio no puede ser posterior a fecha_fin")
+        self.instituciones = argumentos.ids(instituciones) if instituciones else []
+        self.comunas = sorted(set(comunas or []))
+        self.tipos_comida = sorted(set(tipos_comida or []))
+
+        self.periodos = []
+        inicio = inicio_periodo(self.fecha_inicio, granularidad)
+        while inicio <= self.fecha_fin:
+            fin = siguiente_periodo(inicio, granularidad)
+            self.periodos.append((inicio, fin - datetime.timedelta(days=1)))
+            inicio = fin
+            if len(self.periodos) > MAX_PERIODOS:
+                raise ValueError(f"El rango tiene más de {MAX_PERIODOS} períodos: usar una granularidad mayor")
+        self.calculados = 0
+        contenido = json.dumps([self.agrupar, self.nutrientes, self.instituciones, self.comunas, self.tipos_comida])
+        self.huella = hashlib.md5(contenido.encode()).hexdigest()[:16]
+
+    @classmethod
+    def desde_parametros(cls, parametros):
+        """Desde query params; agrupar, nutrientes, institucion, comuna y tipo_comida (listas separadas por comas)."""
+        return cls(
+            granularidad=parametros.get('granularidad', 'mes'),
+            fecha_inicio=parametros.get('fecha_inicio'),
+            fecha_fin=parametros.get('fecha_fin'),
+            agrupar=parametros.get('agrupar'),
+            nutrientes_pedidos=argumentos.lista(parametros.get('nutrientes')),
+            instituciones=argumentos.lista(parametros.get('institucion')),
+            comunas=argumentos.lista(parametros.get('comuna')),
+            tipos_comida=argumentos.lista(parametros.get('tipo_comida')),
+        )
+
+    def resultado(self):
+        """Filas por (período, grupo), en orden. Sólo se calculan los períodos que no están en caché."""
+        claves = claves_etiquetadas({self._base(inicio): self._etiquetas(inicio, fin) for inicio, fin in self.periodos})
+        en_cache = cache.get_many(list(claves.values()))
+        faltantes = [(inicio, fin) for inicio, fin in self.periodos if claves[self._base(inicio)] not in en_cache]
+        if faltantes:
+            calculados = self._calcular(faltantes)
+            nuevos = {claves[self._base(inicio)]: calculados.get(inicio, []) for inicio, _ in faltantes}
+            cache.set_many(nuevos, TIMEOUT)
+            en_cache.update(nuevos)
+        self.calculados = len(faltantes)
+
+        filas = []
+        for inicio, _ in self.periodos:
+            filas.extend(en_cache[claves[self._base(inicio)]])
+        return {
+            'granularidad': self.granularidad,
+            'agrupar': self.agrupar,
+            'fecha_inicio': self.periodos[0][0],
+            'fecha_fin': self.periodos[-1][1],
+            'nutrientes': self.nutrientes,
+            'percentiles': list(PERCENTILES),
+            'resultados': filas,
+        }
+
+    def _base(self, inicio):
+        return f'tendencia_{self.granularidad}_{inicio.isoformat()}_{self.huella}'
+
+    def _etiquetas(self, inicio, fin):
+        if len(self.instituciones) == 1:
+            resultado = etiquetas.de_periodo(inicio, fin, self.instituciones[0])
+        else:
+            resultado = etiquetas.de_periodo(inicio, fin)
+        # La comuna es un dato de la institución
+        if self.agrupar == 'comuna' or self.comunas:
+            resultado.append('instituciones')
+        return resultado
+
+    def _calcular(self, periodos):
+        """{inicio del período: [filas]} para `periodos` con una consulta."""
+        rangos = Q()
+        for desde, hasta in _unir(periodos):
+            rangos |= Q(visita__fecha__range=(desde, hasta))
+        platos = PlatoObservado.objects.filter(rangos)
+        if self.instituciones:
+            platos = platos.filter(visita__institucion_id__in=self.instituciones)
+        if self.comunas:
+            platos = platos.filter(visita__institucion__comuna__in=self.comunas)
+        if self.tipos_comida:
+            platos = platos.filter(visita__tipo_comida__in=self.tipos_comida)
+
+        campos = [NUTRIENTES[clave].campo_total for clave in self.nutrientes]
+        grupo = AGRUPACIONES[self.agrupar] if self.agrupar else None
+        valores = {}  # (inicio, grupo) -> [platos, [valores por nutriente]]
+        filas = platos.order_by().values_list('visita__fecha', *([grupo] if grupo else []), *campos)
+        for fecha, *totales in filas.iterator(chunk_size=5000):
+            clave_grupo = totales.pop(0) if grupo else None
+            clave = (inicio_periodo(fecha, self.granularidad), clave_grupo)
+            acumulado = valores.get(clave)
+            if acumulado is None:
+                acumulado = valores[clave] = [0, [[] for _ in campos]]
+            acumulado[0] += 1
+            for lista, total in zip(acumulado[1], totales):
+                if total is not None:
+                    lista.append(float(total))
+
+        resultado = {}
+        for (inicio, clave_grupo), (cantidad, listas) in sorted(valores.items(), key=_orden):
+            resultado.setdefault(inicio, []).append({
+                'periodo': inicio,
+                'periodo_fin': siguiente_periodo(inicio, self.granularidad) - datetime.timedelta(days=1),
+                'grupo': clave_grupo,
+                'platos': cantidad,
+                **{clave: _estadisticas(lista) for clave, lista in zip(self.nutrientes, listas)},
+            })
+        return resultado
+
+
+def _estadisticas(valores):
+    if not valores:
+        return {'n': 0, 'media': None, 'min': None, 'max': None, **{f'p{p}': None for p in PERCENTILES}}
+    return {
+        'n': len(valores),
+        'media': round(sum(valores) / len(valores), 2),
+        'min': round(min(valores), 2),
+        'max': round(max(valores), 2),
+        **{f'p{p}': round(percentil(valores, p), 2) for p in PERCENTILES},
+    }
+
+
+def _orden(item):
+    (inicio, grupo), _ = item
+    return inicio, grupo is None, str(grupo)
+
+
+def _unir(periodos):
+    """Une períodos consecutivos en rangos (desde, hasta) para acotar el WHERE."""
+    rangos = []
+    for inicio, fin in sorted(periodos):
+        if rangos and rangos[-1][1] + datetime.timedelta(days=1) == inicio:
+            rangos[-1] = (rangos[-1][0], fin)
+        else:
+            rangos.append((inicio, fin))
+    return rangos
+
@@ -0,0 +1,198 @@
+import datetime
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.consultas import presupuesto_consultas
+from nutricion.models import AlimentoNutricional, CategoriaAlimento
+
+from . import bulk, trabajos
+from .cambios import FeedCambios
+from .models import (
+    IngredientePlato, Institucion, PlatoObservado, RegistroEliminado, TrabajoReporte, VisitaAuditoria,
+)
+
+
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def crear_visita(institucion, fecha, tipo_comida='almuerzo'):
+    return VisitaAuditoria.objects.create(institucion=institucion, fecha=fecha, tipo_comida=tipo_comida)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ReporteRegionTests(TestCase):
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(User.objects.create_user('auditor'))
+        activa = Institucion.objects.create(codigo='A', nombre='Activa', tipo='escuela', comuna='Comuna 10')
+        inactiva = Institucion.objects.create(codigo='I', nombre='Inactiva', tipo='escuela', comuna='Comuna 10')
+        Institucion.objects.create(codigo='S', nombre='Sin visitas', tipo='escuela', comuna='Comuna 10')
+        # Los resúmenes se refrescan al confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_visita(activa, datetime.date(2025, 3, 1))
+            crear_visita(inactiva, datetime.date(2025, 3, 2))
+        inactiva.activo = False
+        inactiva.save()
+
+    def test_visitadas_cuenta_solo_activas(self):
+        respuesta = self.cliente.get('/api/auditoria/reportes/region/comuna/')
+        self.assertEqual(respuesta.status_code, 200)
+        fila, = respuesta.json()
+        self.assertEqual(fila['comuna'], 'Comuna 10')
+        self.assertEqual(fila['instituciones'], 2)
+        self.assertEqual(fila['instituciones_visitadas'], 1)
+        self.assertEqual(fila['cobertura'], 50.0)
+        self.assertEqual(fila['instituciones_con_inactivas'], 3)
+        self.assertEqual(fila['visitadas_con_inactivas'], 2)
+        self.assertEqual(fila['total_visitas'], 2)
+
+    def test_visitadas_no_supera_instituciones(self):
+        for nivel in ('comuna', 'barrio', 'tipo'):
+            for fila in self.cliente.get(f'/api/auditoria/reportes/region/{nivel}/').json():
+                self.assertLessEqual(fila['instituciones_visitadas'], fila['instituciones'], nivel)
+
+
+@override_settings(CACHES=CACHE_LOCAL, CAMBIOS_MARGEN_SEGUNDOS=180, CAMBIOS_RETENCION_DIAS=90)
+class FeedCambiosTests(TestCase):
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(User.objects.create_user('auditor'))
+        self.vieja = Institucion.objects.create(codigo='V', nombre='Vieja', tipo='escuela')
+        self.reciente = Institucion.objects.create(codigo='R', nombre='Reciente', tipo='escuela')
+        hace_una_hora = timezone.now() - datetime.timedelta(hours=1)
+        Institucion.objects.filter(pk=self.vieja.pk).update(updated_at=hace_una_hora)
+
+    def cambios(self, **params):
+        return self.cliente.get('/api/auditoria/cambios/', params)
+
+    def test_no_devuelve_ni_avanza_dentro_del_margen(self):
+        primera = self.cambios().json()
+        self.assertEqual([i['id'] for i in primera['instituciones']], [self.vieja.pk])
+        # Cuando la fila sale del margen aparece: el cursor no pasó de largo
+        with self.settings(CAMBIOS_MARGEN_SEGUNDOS=0):
+            segunda = self.cambios(cursor=primera['cursor']).json()
+        self.assertEqual([i['id'] for i in segunda['instituciones']], [self.reciente.pk])
+
+    def test_cursor_mas_viejo_que_la_retencion(self):
+        desde = (timezone.now() - datetime.timedelta(days=91)).isoformat()
+        respuesta = self.cambios(desde=desde)
+        self.assertEqual(respuesta.status_code, 410)
+        self.assertTrue(respuesta.json()['resincronizar'])
+
+    def test_purgar_eliminados(self):
+        viejo = RegistroEliminado.objects.create(modelo='institucion', objeto_id=1)
+        RegistroEliminado.objects.filter(pk=viejo.pk).update(
+            eliminado_en=timezone.now() - datetime.timedelta(days=91))
+        nuevo = RegistroEliminado.objects.create(modelo='institucion', objeto_id=2)
+        self.assertEqual(FeedCambios.purgar_eliminados(), 1)
+        self.assertEqual(list(RegistroEliminado.objects.values_list('pk', flat=True)), [nuevo.pk])
+
+
+class ModoAutoincrementoTests(SimpleTestCase):
+    def conexion(self, modo):
+        conexion = mock.Mock(vendor='mysql', spec=['vendor', 'cursor'], cursor=mock.MagicMock())
+        conexion.cursor.return_value.__enter__.return_value.fetchone.return_value = (modo, 1)
+        return conexion
+
+    @mock.patch.object(bulk, '_modo_verificado', False)
+    def test_avisa_una_vez_con_modo_2(self):
+        with self.assertLogs('auditoria.bulk', 'WARNING') as logs:
+            bulk.verificar_modo_autoincremento(None, self.conexion(2))
+            bulk.verificar_modo_autoincremento(None, self.conexion(2))
+        self.assertEqual(len(logs.records), 1)
+
+    @mock.patch.object(bulk, '_modo_verificado', False)
+    def test_no_avisa_con_modo_1(self):
+        with self.assertNoLogs('auditoria.bulk', 'WARNING'):
+            bulk.verificar_modo_autoincremento(None, self.conexion(1))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class PresupuestoConsultasTests(TestCase):
+    """Las vistas con presupuesto en CONSULTAS_PRESUPUESTOS no crecen con la cantidad de filas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categorias = [CategoriaAlimento.objects.create(codigo=f'C{i}', nombre=f'Categoría {i}') for i in range(2)]
+        alimentos = [
+            AlimentoNutricional.objects.create(codigo_argenfood=i, nombre=f'Alimento {i}', categoria=categorias[i % 2])
+            for i in range(4)
+        ]
+        for i in range(3):
+            institucion = Institucion.objects.create(
+                codigo=f'I{i}', nombre=f'Institución {i}', tipo='escuela', comuna=f'Comuna {i % 2}')
+            for dia in (1, 2):
+                visita = crear_visita(institucion, datetime.date(2025, 3, dia))
+                for j in range(2):
+                    plato = PlatoObservado.objects.create(visita=visita, nombre=f'Plato {j}', tipo_plato='principal')
+                    for alimento in alimentos[j:j + 2]:
+                        IngredientePlato.objects.create(plato=plato, alimento=alimento, cantidad=100)
+        cls.visita = visita
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(User.objects.create_user('auditor'))
+
+    def assertPresupuesto(self, vista, url):
+        with presupuesto_consultas(settings.CONSULTAS_PRESUPUESTOS[vista], umbral_repetidas=3):
+            respuesta = self.cliente.get(url)
+        self.assertEqual(respuesta.status_code, 200, vista)
+        return respuesta
+
+    def test_visitas_lista(self):
+        self.assertPresupuesto('visitaauditoria-list', '/api/auditoria/visitas/')
+
+    def test_visita_detalle(self):
+        self.assertPresupuesto('visitaauditoria-detail', f'/api/auditoria/visitas/{self.visita.pk}/')
+
+    def test_platos_lista(self):
+        self.assertPresupuesto('platoobservado-list', '/api/auditoria/platos/')
+
+    def test_alimentos_lista(self):
+        self.assertPresupuesto('alimentonutricional-list', '/api/nutricion/alimentos/')
+
+    def test_reporte_region(self):
+        self.assertPresupuesto('reporte-region', '/api/auditoria/reportes/region/comuna/')
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class TrabajosTests(TestCase):
+    PARAMETROS = {'institucion_ids': [1], 'fecha_inicio': None, 'fecha_fin': None}
+
+    def test_encolar_deduplica_pendientes(self):
+        trabajo, creado = trabajos.encolar('comparativa', self.PARAMETROS)
+        self.assertTrue(creado)
+        self.assertEqual(trabajos.encolar('comparativa', self.PARAMETROS), (trabajo, False))
+
+    def test_encolar_pierde_la_carrera(self):
+        # Fila que la búsqueda no ve como pendiente vigente pero ya ocupa la huella
+        clave = trabajos.huella('comparativa', self.PARAMETROS)
+        ganador = TrabajoReporte.objects.create(
+            tipo='comparativa', parametros=self.PARAMETROS, huella=clave, huella_pendiente=clave,
+            estado=trabajos.EN_PROCESO, firma_datos='otra',
+        )
+        self.assertEqual(trabajos.encolar('comparativa', self.PARAMETROS), (ganador, False))
+
+    def test_tomar_libera_la_huella(self):
+        trabajo, _ = trabajos.encolar('comparativa', self.PARAMETROS)
+        self.assertEqual(trabajos.tomar(), [trabajo.pk])
+        trabajo.refresh_from_db()
+        self.assertIsNone(trabajo.huella_pendiente)
+
+    def test_ejecutar_descarta_si_se_reencolo(self):
+        trabajo, _ = trabajos.encolar('comparativa', self.PARAMETROS)
+        trabajos.tomar()
+        # Sigue corriendo pero el mantenimiento lo da por colgado
+        TrabajoReporte.objects.filter(pk=trabajo.pk).update(
+            iniciado_en=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(trabajos.recuperar_colgados(600), 1)
+        with self.assertLogs('auditoria.trabajos', 'WARNING'):
+            self.assertEqual(trabajos.ejecutar(trabajo.pk), trabajos.DESCARTADO)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, trabajos.PENDIENTE)
+        self.assertIsNone(trabajo.resultado)
@@ -0,0 +1,185 @@
+"""
+Cola de reportes pesados en la base de datos (TrabajoReporte), sin broker.
+
+La API encola con encolar() y devuelve el id; el comando procesar_reportes
+toma los trabajos pendientes y los ejecuta en un pool de hilos. Se pueden
+correr varios procesos worker: un trabajo se toma con un UPDATE condicional
+(estado pendiente -> en_proceso), que sólo gana uno y no necesita SELECT ...
+FOR UPDATE SKIP LOCKED, así que funciona igual en MySQL y SQLite.
+
+Deduplicación por huella (tipo + parámetros normalizados):
+  - si hay un trabajo pendiente con la misma huella, se devuelve ese (dos
+    encolar simultáneos chocan en la columna única huella_pendiente y el
+    perdedor devuelve el trabajo del ganador);
+  - si hay uno en proceso o completado calculado sobre la misma versión de
+    los datos, también. La versión es la firma de las etiquetas de caché del
+    reporte (core.cache), la misma invalidación que usan los reportes
+    cacheados: al cambiar una visita del período el resultado deja de servir.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.cache import clave_etiquetada
+
+from . import etiquetas
+from .models import TrabajoReporte
+from .reports import ReportService
+
+
+logger = logging.getLogger(__name__)
+
+PENDIENTE, EN_PROCESO, COMPLETADO, ERROR = 'pendiente', 'en_proceso', 'completado', 'error'
+TERMINADOS = (COMPLETADO, ERROR)
+# Resultado de ejecutar() (no es un estado): el trabajo se reencoló mientras corría
+DESCARTADO = 'descartado'
+
+# Reintentos de un trabajo cuyo worker murió a mitad de camino
+MAX_INTENTOS = 3
+
+TipoReporte = namedtuple('TipoReporte', ['ejecutar', 'etiquetas'])
+
+TIPOS = {
+    'comparativa': TipoReporte(
+        lambda institucion_ids, fecha_inicio, fecha_fin: ReportService.get_comparativa_nutricional(
+            institucion_ids, fecha_inicio, fecha_fin
+        ),
+        lambda institucion_ids, fecha_inicio, fecha_fin: etiquetas.de_periodo(fecha_inicio, fecha_fin)
+        + ['instituciones'],
+    ),
+    'instituciones_filtros': TipoReporte(
+        lambda fecha_inicio, fecha_fin, filtros: ReportService.get_instituciones_con_filtros(
+            fecha_inicio, fecha_fin, filtros
+        ),
+        lambda fecha_inicio, fecha_fin, filtros: etiquetas.de_periodo(fecha_inicio, fecha_fin)
+        + ['instituciones'],
+    ),
+}
+
+
+def huella(tipo, parametros):
+    contenido = json.dumps({'tipo': tipo, 'parametros': parametros}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def firma_datos(tipo, parametros):
+    """Cambia cuando se invalida alguna etiqueta de caché de los datos del reporte."""
+    return clave_etiquetada('trabajo', TIPOS[tipo].etiquetas(**parametros)).split(':', 1)[1]
+
+
+def encolar(tipo, parametros):
+    """
+    Devuelve (trabajo, creado). `parametros` ya normalizados
+    (TrabajoReporteCrearSerializer).
+    """
+    clave = huella(tipo, parametros)
+    existentes = TrabajoReporte.objects.filter(huella=clave).order_by('-creado_en', '-id')
+    pendiente = existentes.filter(estado=PENDIENTE).first()
+    if pendiente is not None:
+        return pendiente, False
+    # La firma se toma al encolar, en el proceso de la API: el resultado se
+    # calcula después, así que nunca es más viejo que la firma, y no depende de
+    # que el worker comparta la caché
+    firma = firma_datos(tipo, parametros)
+    vigente = existentes.filter(estado__in=(EN_PROCESO, COMPLETADO), firma_datos=firma).first()
+    if vigente is not None:
+        return vigente, False
+    try:
+        with transaction.atomic():
+            trabajo = TrabajoReporte.objects.create(
+                tipo=tipo, parametros=parametros, huella=clave, huella_pendiente=clave, firma_datos=firma,
+            )
+    except IntegrityError:
+        # Otro encolar creó el mismo trabajo entre la búsqueda y el INSERT
+        return existentes.first(), False
+    return trabajo, True
+
+
+def tomar(limite=1):
+    """Marca como en proceso hasta `limite` trabajos pendientes (los más viejos) y devuelve sus ids."""
+    tomados = []
+    candidatos = (
+        TrabajoReporte.objects.filter(estado=PENDIENTE)
+        .order_by('creado_en', 'id').values_list('id', flat=True)[:limite * 2]
+    )
+    for trabajo_id in candidatos:
+        if len(tomados) >= limite:
+            break
+        # Si otro worker lo tomó primero, el UPDATE no afecta filas
+        tomado = TrabajoReporte.objects.filter(pk=trabajo_id, estado=PENDIENTE).update(
+            estado=EN_PROCESO, iniciado_en=timezone.now(), intentos=F('intentos') + 1, huella_pendiente=None,
+        )
+        if tomado:
+            tomados.append(trabajo_id)
+    return tomados
+
+
+def ejecutar(trabajo_id):
+    """
+    Calcula un trabajo ya tomado y guarda el resultado (o el error).
+
+    `intentos` identifica esta toma: si recuperar_colgados lo reencoló (o lo
+    dio por fallido) mientras corría, o si otro worker lo volvió a tomar, el
+    UPDATE final no afecta filas y el resultado se descarta.
+    """
+    trabajo = TrabajoReporte.objects.get(pk=trabajo_id)
+    toma = TrabajoReporte.objects.filter(pk=trabajo_id, estado=EN_PROCESO, intentos=trabajo.intentos)
+    inicio = time.monotonic()
+    try:
+        resultado = TIPOS[trabajo.tipo].ejecutar(**trabajo.parametros)
+    except Exception as e:
+        logger.exception('Error en el trabajo de reporte #%s', trabajo_id)
+        estado, cambios = ERROR, {'estado': ERROR, 'error': str(e)}
+    else:
+        estado, cambios = COMPLETADO, {'estado': COMPLETADO, 'resultado': resultado, 'error': None}
+    duracion = time.monotonic() - inicio
+    if not toma.update(terminado_en=timezone.now(), **cambios):
+        logger.warning(
+            'Trabajo de reporte #%s reencolado mientras corría (%.1fs): se descarta el resultado; '
+            'revisar --timeout de procesar_reportes', trabajo_id, duracion,
+        )
+        return DESCARTADO
+    if estado == COMPLETADO:
+        logger.info('Trabajo de reporte #%s (%s) en %.1fs', trabajo_id, trabajo.tipo, duracion)
+    return estado
+
+
+def recuperar_colgados(segundos):
+    """
+    Trabajos en proceso hace más de `segundos` (su worker murió): vuelven a
+    pendiente o, agotados los intentos, quedan con error. Devuelve cuántos.
+    """
+    limite = timezone.now() - timedelta(seconds=segundos)
+    colgados = TrabajoReporte.objects.filter(estado=EN_PROCESO, iniciado_en__lt=limite)
+    # Sin huella_pendiente: si mientras corría se encoló otro igual, chocaría con su clave única
+    reencolados = colgados.filter(intentos__lt=MAX_INTENTOS).update(estado=PENDIENTE, iniciado_en=None)
+    fallidos = colgados.update(
+        estado=ERROR, error='Tiempo de ejecución agotado', terminado_en=timezone.now(),
+    )
+    return reencolados + fallidos
+
+
+def purgar(dias):
+    """Borra los trabajos terminados hace más de `dias` días."""
+    limite = timezone.now() - timedelta(days=dias)
+    borrados, _ = TrabajoReporte.objects.filter(estado__in=TERMINADOS, terminado_en__lt=limite).delete()
+    return borrados
+
+
+def esperar(trabajo, segundos):
+    """Long-poll: relee `trabajo` hasta que termine o pasen `segundos` (acotado por REPORTES_ESPERA_MAXIMA)."""
+    limite = time.monotonic() + min(segundos, settings.REPORTES_ESPERA_MAXIMA)
+    intervalo = 0.1
+    while trabajo.estado not in TERMINADOS and time.monotonic() < limite:
+        time.sleep(min(intervalo, max(limite - time.monotonic(), 0)))
+        intervalo = min(intervalo * 2, 1.0)
+        trabajo.refresh_from_db()
+    return trabajo
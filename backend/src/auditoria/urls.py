@@ -7,12 +7,17 @@ from .views import (
     IngredientePlatoViewSet,
     PlatoPlantillaViewSet,
     IngredientePlantillaViewSet,
+    TrabajoReporteViewSet,
+    cambios,
     dashboard_stats,
     visitas_por_periodo,
     reporte_institucion,
     ranking_instituciones,
     comparativa_nutricional,
     instituciones_con_filtros,
+    tendencias_nutrientes,
+    reporte_region,
+    exportar,
 )
 
 router = DefaultRouter()
@@ -22,13 +27,18 @@ router.register(r'platos', PlatoObservadoViewSet)
 router.register(r'ingredientes', IngredientePlatoViewSet)
 router.register(r'platos-plantilla', PlatoPlantillaViewSet)
 router.register(r'ingredientes-plantilla', IngredientePlantillaViewSet)
+router.register(r'reportes/trabajos', TrabajoReporteViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('cambios/', cambios, name='cambios'),
     path('reportes/dashboard/', dashboard_stats, name='dashboard-stats'),
     path('reportes/visitas-periodo/', visitas_por_periodo, name='visitas-periodo'),
     path('reportes/institucion/<int:institucion_id>/', reporte_institucion, name='reporte-institucion'),
     path('reportes/ranking/', ranking_instituciones, name='ranking-instituciones'),
     path('reportes/comparativa/', comparativa_nutricional, name='comparativa-nutricional'),
     path('reportes/instituciones-filtros/', instituciones_con_filtros, name='instituciones-filtros'),
+    path('reportes/region/<str:nivel>/', reporte_region, name='reporte-region'),
+    path('reportes/tendencias/', tendencias_nutrientes, name='tendencias-nutrientes'),
+    path('exportar/<str:nivel>/', exportar, name='exportar'),
 ]
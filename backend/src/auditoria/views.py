@@ -1,12 +1,20 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from django.core.cache import cache
-from django.db.models import Count
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.db import transaction
-from .models import Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, PlatoPlantilla, IngredientePlantilla
+from core.campos import CamposDinamicosMixin
+from core.paginacion import PaginacionKeyset
+from .models import (
+    Institucion, VisitaAuditoria, PlatoObservado, IngredientePlato, PlatoPlantilla, IngredientePlantilla,
+    TrabajoReporte,
+)
 from .serializers import (
     InstitucionSerializer,
     VisitaAuditoriaSerializer,
@@ -14,9 +22,29 @@ from .serializers import (
     PlatoObservadoSerializer,
     IngredientePlatoSerializer,
     PlatoPlantillaSerializer,
-    IngredientePlantillaSerializer
+    IngredientePlantillaSerializer,
+    ClonarPlantillasSerializer,
+    VisitaCompletaSerializer,
+    TrabajoReporteCrearSerializer,
+    TrabajoReporteSerializer,
 )
+from . import argumentos, nutrientes
+from .cambios import CursorVencido, FeedCambios
+from .clonado import ClonadorPlantillas
+from .exportacion import FORMATOS, Exportacion
+from .grafo import contexto_visita_completa, crear_visita_completa
+from .lectura import LecturaRapidaMixin, proyeccion_para
+from .recalculo import aplicar_delta_totales
 from .reports import ReportService
+from .sync import InstitucionSincronizador, VisitaSincronizador, sincronizar_stream
+from .tendencias import TendenciaNutrientes
+from . import trabajos
+
+
+def _sync_stream_response(request, sincronizador):
+    # Se lee el cuerpo crudo línea por línea; no se pasa por request.data
+    lineas = sincronizar_stream(sincronizador, request._request, cursor=request.query_params.get('cursor'))
+    return StreamingHttpResponse(lineas, content_type='application/x-ndjson')
 
 
 class InstitucionViewSet(viewsets.ModelViewSet):
@@ -33,44 +61,20 @@ class InstitucionViewSet(viewsets.ModelViewSet):
         if not isinstance(data, list):
             return Response({"error": "Se esperaba una lista"}, status=status.HTTP_400_BAD_REQUEST)
 
-        results = []
         with transaction.atomic():
-            for entry in data:
-                local_id = entry.get('local_id')
-                server_id = entry.get('id')
-                
-                # Ensure codigo exists (it's mandatory in model)
-                if not entry.get('codigo'):
-                    entry['codigo'] = entry.get('nombre', 'INST').upper()[:10] + "-" + str(local_id)[:8]
-
-                try:
-                    if server_id:
-                        instance = Institucion.objects.get(id=server_id)
-                        client_updated_at = entry.get('updated_at')
-                        if client_updated_at and client_updated_at > instance.updated_at.isoformat():
-                            serializer = InstitucionSerializer(instance, data=entry, partial=True)
-                            if serializer.is_valid():
-                                instance = serializer.save()
-                                results.append({"local_id": local_id, "id": instance.id, "status": "updated"})
-                            else:
-                                results.append({"local_id": local_id, "error": serializer.errors, "status": "error"})
-                        else:
-                            results.append({"local_id": local_id, "id": instance.id, "status": "skipped_older"})
-                    else:
-                        serializer = InstitucionSerializer(data=entry)
-                        if serializer.is_valid():
-                            instance = serializer.save()
-                            results.append({"local_id": local_id, "id": instance.id, "status": "created"})
-                        else:
-                            results.append({"local_id": local_id, "error": serializer.errors, "status": "error"})
-                except Exception as e:
-                    results.append({"local_id": local_id, "error": str(e), "status": "error"})
-        
+            results = InstitucionSincronizador().sincronizar(data)
+
         return Response(results)
 
+    @action(detail=False, methods=['post'], url_path='sync-stream')
+    def sync_stream(self, request):
+        """Sincronización NDJSON en streaming con commit por lote (reanudable con ?cursor=)"""
+        return _sync_stream_response(request, InstitucionSincronizador())
+
 
-class VisitaAuditoriaViewSet(viewsets.ModelViewSet):
+class VisitaAuditoriaViewSet(LecturaRapidaMixin, CamposDinamicosMixin, viewsets.ModelViewSet):
     queryset = VisitaAuditoria.objects.select_related('institucion').all()
+    pagination_class = PaginacionKeyset
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['institucion', 'tipo_comida', 'fecha']
     ordering_fields = ['fecha']
@@ -80,10 +84,20 @@ class VisitaAuditoriaViewSet(viewsets.ModelViewSet):
         queryset = VisitaAuditoria.objects.select_related('institucion')
         
         if self.action == 'list':
+            # Subconsulta en lugar de JOIN + GROUP BY: sólo se evalúa para las
+            # filas de la página y el COUNT(*) de la paginación no la incluye
+            platos = (
+                PlatoObservado.objects.filter(visita=OuterRef('pk'))
+                .order_by().values('visita').annotate(n=Count('id')).values('n')
+            )
             return queryset.annotate(
-                cantidad_platos=Count('platos')
+                cantidad_platos=Coalesce(Subquery(platos), 0)
             )
         
+        if self.action == 'destroy':
+            # El borrado en cascada lee platos e ingredientes por su cuenta
+            return queryset
+
         return queryset.prefetch_related(
             'platos__ingredientes__alimento'
         )
@@ -97,52 +111,48 @@ class VisitaAuditoriaViewSet(viewsets.ModelViewSet):
     def sync(self, request):
         """
         Sincronización masiva Offline-First.
-        Recibe un array de visitas con local_id.
+        Recibe un array de visitas con local_id. Se procesa por lotes
+        (ver SincronizadorLote / SYNC_BATCH_SIZE).
         """
         data = request.data
         if not isinstance(data, list):
             return Response({"error": "Se esperaba una lista de registros"}, status=status.HTTP_400_BAD_REQUEST)
 
-        results = []
         with transaction.atomic():
-            for entry in data:
-                local_id = entry.get('local_id')
-                server_id = entry.get('id')
-                client_updated_at = entry.get('updated_at')
-
-                try:
-                    if server_id:
-                        # Update existing
-                        instance = VisitaAuditoria.objects.get(id=server_id)
-                        # Basic Conflict Resolution: Last Write Wins (using updated_at)
-                        # In production, you might compare ISO strings or use a version counter
-                        instance_updated_at = instance.updated_at.isoformat()
-                        
-                        if client_updated_at and client_updated_at > instance_updated_at:
-                            serializer = VisitaAuditoriaSerializer(instance, data=entry, partial=True)
-                            if serializer.is_valid():
-                                instance = serializer.save()
-                                results.append({"local_id": local_id, "id": instance.id, "status": "updated"})
-                            else:
-                                results.append({"local_id": local_id, "error": serializer.errors, "status": "error"})
-                        else:
-                            results.append({"local_id": local_id, "id": instance.id, "status": "skipped_older"})
-                    else:
-                        # Create new
-                        serializer = VisitaAuditoriaSerializer(data=entry)
-                        if serializer.is_valid():
-                            instance = serializer.save()
-                            results.append({"local_id": local_id, "id": instance.id, "status": "created"})
-                        else:
-                            results.append({"local_id": local_id, "error": serializer.errors, "status": "error"})
-                except Exception as e:
-                    results.append({"local_id": local_id, "error": str(e), "status": "error"})
+            results = VisitaSincronizador().sincronizar(data)
 
         return Response(results, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'])
+    def completa(self, request):
+        """
+        Alta de una visita con sus platos e ingredientes en una sola llamada:
+        {..., "platos": [{..., "ingredientes": [{"alimento", "cantidad", ...}]}]}.
+        Aportes y totales se calculan al guardar. Devuelve la visita completa.
+        """
+        serializer = VisitaCompletaSerializer(data=request.data, context=contexto_visita_completa(request.data))
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            visita = crear_visita_completa(serializer.validated_data)
+
+        proyeccion = proyeccion_para(VisitaAuditoriaSerializer)
+        queryset = VisitaAuditoria.objects.filter(pk=visita.pk)
+        return Response(proyeccion.representar(proyeccion.valores(queryset))[0], status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='sync-stream')
+    def sync_stream(self, request):
+        """
+        Sincronización NDJSON en streaming: una visita por línea.
+        Cada lote se confirma en su propia transacción y la respuesta emite
+        los resultados por local_id y una línea {"cursor": ...} por lote.
+        Para reanudar tras un corte, reenviar con ?cursor=<último cursor>.
+        """
+        return _sync_stream_response(request, VisitaSincronizador())
+
 
-class PlatoObservadoViewSet(viewsets.ModelViewSet):
+class PlatoObservadoViewSet(LecturaRapidaMixin, CamposDinamicosMixin, viewsets.ModelViewSet):
     queryset = PlatoObservado.objects.select_related('visita').prefetch_related('ingredientes__alimento').all()
+    pagination_class = PaginacionKeyset
     serializer_class = PlatoObservadoSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['visita']
@@ -157,43 +167,89 @@ class PlatoObservadoViewSet(viewsets.ModelViewSet):
 
 class IngredientePlatoViewSet(viewsets.ModelViewSet):
     queryset = IngredientePlato.objects.select_related('plato', 'alimento').all()
+    pagination_class = PaginacionKeyset
     serializer_class = IngredientePlatoSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['plato']
 
+    # Los totales del plato se mantienen en forma incremental: se resta el aporte
+    # anterior del ingrediente, se suma el nuevo y se aplica con un UPDATE F().
+    # `verificar_totales` detecta y repara desvíos.
+
     def perform_create(self, serializer):
         with transaction.atomic():
             ingrediente = serializer.save()
-            ingrediente.recalcular_aporte(save=False)
-            
-            plato = ingrediente.plato
-            plato.recalcular_totales(save=False)
-            
-            ingrediente.save()
-            plato.save()
-        
-        cache.delete('dashboard_stats')
+            ingrediente.recalcular_aporte(save=True)
+            self._aplicar_delta(ingrediente.plato_id, nutrientes.vector_aporte(ingrediente))
 
     def perform_update(self, serializer):
         with transaction.atomic():
+            # El aporte anterior se lee de la fila bloqueada: dos ediciones
+            # concurrentes del mismo ingrediente se serializan
+            serializer.instance = self._bloquear(serializer.instance)
+            anterior = nutrientes.vector_aporte(serializer.instance, estricto=True)
+            plato_anterior_id = serializer.instance.plato_id
             ingrediente = serializer.save()
-            ingrediente.recalcular_aporte(save=False)
-            
-            plato = ingrediente.plato
-            plato.recalcular_totales(save=False)
-            
-            ingrediente.save()
-            plato.save()
-        
-        cache.delete('dashboard_stats')
+            ingrediente.recalcular_aporte(save=True)
+            nuevo = nutrientes.vector_aporte(ingrediente)
+
+            if anterior is None:
+                # Ingrediente sin aporte almacenado: no hay delta confiable
+                self._recalcular_plato(plato_anterior_id)
+                if ingrediente.plato_id != plato_anterior_id:
+                    self._aplicar_delta(ingrediente.plato_id, nuevo)
+            elif ingrediente.plato_id == plato_anterior_id:
+                self._aplicar_delta(ingrediente.plato_id, nutrientes.restar(nuevo, anterior))
+            else:
+                self._aplicar_delta(plato_anterior_id, nutrientes.restar(nutrientes.VECTOR_CERO, anterior))
+                self._aplicar_delta(ingrediente.plato_id, nuevo)
 
     def perform_destroy(self, instance):
         with transaction.atomic():
-            plato = instance.plato
+            instance = self._bloquear(instance)
+            anterior = nutrientes.vector_aporte(instance, estricto=True)
+            plato_id = instance.plato_id
             instance.delete()
-            plato.recalcular_totales(save=True)
-        
-        cache.delete('dashboard_stats')
+            if anterior is None:
+                self._recalcular_plato(plato_id)
+            else:
+                self._aplicar_delta(plato_id, nutrientes.restar(nutrientes.VECTOR_CERO, anterior))
+
+    @staticmethod
+    def _bloquear(ingrediente):
+        """Relee el ingrediente con SELECT ... FOR UPDATE (404 si se borró entretanto)."""
+        return get_object_or_404(IngredientePlato.objects.select_for_update(), pk=ingrediente.pk)
+
+    def _aplicar_delta(self, plato_id, delta):
+        if not aplicar_delta_totales(plato_id, delta):
+            self._recalcular_plato(plato_id)
+
+    @staticmethod
+    def _recalcular_plato(plato_id):
+        PlatoObservado.objects.get(pk=plato_id).recalcular_totales(save=True)
+
+
+@api_view(['GET'])
+def cambios(request):
+    """
+    Delta-sync: instituciones, visitas, platos, ingredientes y borrados
+    modificados después de ?desde=<ISO datetime> o del ?cursor= devuelto
+    por la llamada anterior. Repetir con el cursor mientras hay_mas sea true.
+    Los cambios de los últimos CAMBIOS_MARGEN_SEGUNDOS aparecen en llamadas
+    posteriores. Si el cursor es más viejo que la retención de borrados
+    responde 410 con resincronizar=true: el cliente debe descargar todo de nuevo.
+    """
+    try:
+        data = FeedCambios.obtener(
+            desde=request.query_params.get('desde'),
+            cursor=request.query_params.get('cursor'),
+            limit=request.query_params.get('limit'),
+        )
+    except CursorVencido as e:
+        return Response({'error': str(e), 'resincronizar': True}, status=status.HTTP_410_GONE)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data)
 
 
 @api_view(['GET'])
@@ -264,7 +320,76 @@ def instituciones_con_filtros(request):
     return Response(data)
 
 
-class PlatoPlantillaViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+def reporte_region(request, nivel):
+    """
+    Cobertura, platos y promedios nutricionales por comuna, barrio o tipo de
+    institución. Filtros: fecha_inicio, fecha_fin, comuna y tipo (listas
+    separadas por comas).
+    """
+    try:
+        fechas = {
+            campo: argumentos.fecha(request.query_params[campo])
+            for campo in ('fecha_inicio', 'fecha_fin') if request.query_params.get(campo)
+        }
+        data = ReportService.get_reporte_region(
+            nivel,
+            comunas=argumentos.lista(request.query_params.get('comuna')),
+            tipos=argumentos.lista(request.query_params.get('tipo')),
+            **fechas,
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data)
+
+
+@api_view(['GET'])
+def tendencias_nutrientes(request):
+    """
+    Media, mínimo, máximo y percentiles de nutrientes por plato por período.
+    Parámetros: granularidad (dia, semana, mes, trimestre), fecha_inicio,
+    fecha_fin, agrupar (institucion, comuna, tipo_comida) y nutrientes,
+    institucion, comuna y tipo_comida (listas separadas por comas).
+    """
+    try:
+        tendencia = TendenciaNutrientes.desde_parametros(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(tendencia.resultado())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportar(request, nivel):
+    """
+    Exportación completa de visitas, platos o ingredientes con todas las
+    columnas de nutrientes: CSV en streaming o ?formato=xlsx (requiere
+    openpyxl). Filtros: fecha_desde, fecha_hasta, institucion y tipo_comida
+    (estos dos aceptan listas separadas por comas).
+    """
+    formato = request.query_params.get('formato', 'csv')
+    try:
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato inválido: {formato}. Opciones: {', '.join(FORMATOS)}")
+        exportacion = Exportacion.desde_parametros(nivel, request.query_params)
+        if formato == 'xlsx':
+            archivo = exportacion.xlsx_temporal()
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if formato == 'xlsx':
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename=f'{exportacion.nombre_archivo}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    response = StreamingHttpResponse(exportacion.csv(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{exportacion.nombre_archivo}.csv"'
+    return response
+
+
+class PlatoPlantillaViewSet(CamposDinamicosMixin, viewsets.ModelViewSet):
     queryset = PlatoPlantilla.objects.prefetch_related('ingredientes_plantilla__alimento').all()
     serializer_class = PlatoPlantillaSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
@@ -291,40 +416,51 @@ class PlatoPlantillaViewSet(viewsets.ModelViewSet):
         except VisitaAuditoria.DoesNotExist:
             return Response({'error': 'Visita no encontrada'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Crear plato observado desde plantilla
-        plato = PlatoObservado.objects.create(
-            visita=visita,
-            nombre=plantilla.nombre,
-            tipo_plato=plantilla.tipo_plato,
-            energia_kcal_total=plantilla.energia_kcal_total,
-            proteinas_g_total=plantilla.proteinas_g_total,
-            grasas_totales_g_total=plantilla.grasas_totales_g_total,
-            carbohidratos_g_total=plantilla.carbohidratos_g_total,
-            fibra_g_total=plantilla.fibra_g_total,
-            sodio_mg_total=plantilla.sodio_mg_total
-        )
-        
-        # Copiar ingredientes con bulk_create (optimizado)
-        ingredientes_bulk = [
-            IngredientePlato(
-                plato=plato,
-                alimento=ing.alimento,
-                cantidad=ing.cantidad,
-                unidad=ing.unidad,
-                orden=ing.orden
-            )
-            for ing in plantilla.ingredientes_plantilla.all()
-        ]
-        IngredientePlato.objects.bulk_create(ingredientes_bulk)
-        
-        # Recalcular aportes y totales
-        for ing in plato.ingredientes.all():
-            ing.recalcular_aporte(save=True)
-        plato.recalcular_totales(save=True)
+        with transaction.atomic():
+            plato, = ClonadorPlantillas([plantilla]).clonar([visita])
+        plato = PlatoObservado.objects.prefetch_related('ingredientes__alimento').get(pk=plato.pk)
         
         serializer = PlatoObservadoSerializer(plato)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def clonar(self, request):
+        """
+        Clona varias plantillas a varias visitas (una copia de cada plantilla por
+        visita) en una sola transacción. Body: {"plantilla_ids": [...], "visita_ids": [...]}
+        Si MySQL corre con innodb_autoinc_lock_mode 2 los platos se insertan de a
+        uno (visitas × plantillas INSERTs); el despliegue debe usar el modo 1.
+        """
+        entrada = ClonarPlantillasSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        plantilla_ids = list(dict.fromkeys(entrada.validated_data['plantilla_ids']))
+        visita_ids = list(dict.fromkeys(entrada.validated_data['visita_ids']))
+
+        plantillas = PlatoPlantilla.objects.in_bulk(plantilla_ids)
+        visitas = VisitaAuditoria.objects.in_bulk(visita_ids)
+        faltantes = {
+            'plantilla_ids': [i for i in plantilla_ids if i not in plantillas],
+            'visita_ids': [i for i in visita_ids if i not in visitas],
+        }
+        if any(faltantes.values()):
+            return Response(
+                {'error': 'Registros no encontrados', 'faltantes': faltantes},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        with transaction.atomic():
+            clonador = ClonadorPlantillas(plantillas[i] for i in plantilla_ids)
+            platos = clonador.clonar([visitas[i] for i in visita_ids])
+
+        creados = (
+            PlatoObservado.objects
+            .filter(pk__in=[plato.pk for plato in platos])
+            .prefetch_related('ingredientes__alimento')
+            .order_by('id')
+        )
+        serializer = PlatoObservadoSerializer(creados, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class IngredientePlantillaViewSet(viewsets.ModelViewSet):
     queryset = IngredientePlantilla.objects.select_related('plato_plantilla', 'alimento').all()
@@ -344,3 +480,35 @@ class IngredientePlantillaViewSet(viewsets.ModelViewSet):
         plato = instance.plato_plantilla
         instance.delete()
         plato.recalcular_totales(save=True)
+
+
+class TrabajoReporteViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Reportes pesados en segundo plano (los ejecuta el comando procesar_reportes).
+
+    POST {"tipo": ..., "parametros": {...}} encola y responde 202 con el id; si
+    ya hay uno igual pendiente o en proceso devuelve ese (202), y si hay un
+    resultado vigente para los mismos datos, ese mismo (200).
+    GET <id>/?esperar=N espera hasta N segundos a que termine (long-poll,
+    acotado por REPORTES_ESPERA_MAXIMA); para esperas largas, repetir el GET.
+    """
+    queryset = TrabajoReporte.objects.all()
+    serializer_class = TrabajoReporteSerializer
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        entrada = TrabajoReporteCrearSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        trabajo, _ = trabajos.encolar(**entrada.validated_data)
+        codigo = status.HTTP_200_OK if trabajo.estado == trabajos.COMPLETADO else status.HTTP_202_ACCEPTED
+        return Response(self.get_serializer(trabajo).data, status=codigo)
+
+    def retrieve(self, request, *args, **kwargs):
+        trabajo = self.get_object()
+        try:
+            espera = float(request.query_params.get('esperar', 0))
+        except ValueError:
+            return Response({'error': 'esperar debe ser un número de segundos'}, status=status.HTTP_400_BAD_REQUEST)
+        if espera > 0:
+            trabajo = trabajos.esperar(trabajo, espera)
+        return Response(self.get_serializer(trabajo).data)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.gzip.GZipMiddleware',
+    'core.middleware.ConsultasMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -148,13 +150,53 @@ SIMPLE_JWT = {
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# Tamaño de lote para bulk_create/bulk_update en los endpoints /sync/
+SYNC_BATCH_SIZE = int(os.getenv('SYNC_BATCH_SIZE', '200'))
+
+# Feed /cambios/ (auditoria.cambios.FeedCambios)
+# Sólo se devuelven cambios más viejos que este margen: debe superar la transacción
+# de escritura más larga (gunicorn corta las peticiones a los 120 s)
+CAMBIOS_MARGEN_SEGUNDOS = int(os.getenv('CAMBIOS_MARGEN_SEGUNDOS', '180'))
+# Días que se conservan los RegistroEliminado; un cursor más viejo obliga a resincronizar
+CAMBIOS_RETENCION_DIAS = int(os.getenv('CAMBIOS_RETENCION_DIAS', '90'))
+
+# Instrumentación de consultas por petición (core.middleware.ConsultasMiddleware).
+# Apagada por defecto fuera de DEBUG: en producción se activa con CONSULTAS_INSTRUMENTAR=1
+CONSULTAS_INSTRUMENTAR = os.getenv('CONSULTAS_INSTRUMENTAR', '1' if DEBUG else '0') == '1'
+CONSULTAS_CABECERAS = DEBUG or os.getenv('CONSULTAS_CABECERAS', '0') == '1'
+CONSULTAS_UMBRAL_REPETIDAS = int(os.getenv('CONSULTAS_UMBRAL_REPETIDAS', '5'))
+# Máximo de consultas por vista (nombre de la URL); si se excede se registra en el log
+CONSULTAS_PRESUPUESTOS = {
+    'visitaauditoria-list': 4,
+    'visitaauditoria-detail': 5,
+    'platoobservado-list': 4,
+    'alimentonutricional-list': 4,
+    'reporte-region': 1,
+}
+
+# Reportes en segundo plano (auditoria.trabajos, comando procesar_reportes)
+# Segundos de long-poll por petición: cada espera ocupa un worker sync de gunicorn
+REPORTES_ESPERA_MAXIMA = int(os.getenv('REPORTES_ESPERA_MAXIMA', '5'))
+
 # Cache Configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000
+# Compartida entre workers de gunicorn: Redis si hay REDIS_URL (paquete redis), si no archivos locales.
+# La invalidación es por etiquetas (core.cache), así que no requiere borrar por patrón.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'auditoria',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'auditoria-cache')),
+            'OPTIONS': {
+                'MAX_ENTRIES': 5000
+            }
         }
     }
-}
@@ -0,0 +1,59 @@
+"""
+Medición de latencia y consultas SQL (ver el comando benchmark).
+
+medir() ejecuta una función varias veces, después de unas corridas de
+calentamiento que no se cuentan, y devuelve p50/p95 del tiempo y las
+consultas de cada corrida (core.consultas.RegistroConsultas). Con
+revertir=True cada corrida va dentro de una transacción que se deshace: las
+escrituras se miden sin alterar los datos (los on_commit no se ejecutan).
+"""
+import statistics
+import time
+
+from django.db import transaction
+
+from .consultas import RegistroConsultas
+from .estadistica import percentil
+
+
+# Control de transacciones: depende de cómo se anidan los atomic, no de la operación
+_TRANSACCION = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT')
+
+
+def _corrida(funcion, revertir):
+    with RegistroConsultas() as registro:
+        inicio = time.perf_counter()
+        if revertir:
+            with transaction.atomic():
+                funcion()
+                transaction.set_rollback(True)
+        else:
+            funcion()
+        segundos = time.perf_counter() - inicio
+    consultas = sum(1 for sql, _ in registro.consultas if not sql.lstrip().upper().startswith(_TRANSACCION))
+    return segundos, consultas
+
+
+def medir(nombre, funcion, repeticiones=20, calentamiento=2, revertir=False, antes=None):
+    """
+    Mide `funcion` (sin argumentos). `antes` se llama antes de cada corrida,
+    fuera de la medición (por ejemplo para invalidar cachés).
+    """
+    tiempos, consultas = [], []
+    for numero in range(calentamiento + repeticiones):
+        if antes is not None:
+            antes()
+        segundos, cantidad = _corrida(funcion, revertir)
+        if numero >= calentamiento:
+            tiempos.append(segundos * 1000)
+            consultas.append(cantidad)
+    return {
+        'nombre': nombre,
+        'repeticiones': repeticiones,
+        'p50_ms': round(percentil(tiempos, 50), 2),
+        'p95_ms': round(percentil(tiempos, 95), 2),
+        'min_ms': round(min(tiempos), 2),
+        'max_ms': round(max(tiempos), 2),
+        'consultas': statistics.median_low(consultas),
+        'consultas_max': max(consultas),
+    }
@@ -0,0 +1,71 @@
+"""
+Caché con invalidación por etiquetas.
+
+Cada etiqueta (p. ej. 'inst:12' o 'mes:2025-03') tiene una versión guardada
+en la caché. La clave de cada entrada incluye las versiones de sus etiquetas,
+así que invalidar una etiqueta es cambiar su versión: las entradas viejas
+quedan inalcanzables y expiran solas. Funciona con cualquier backend
+compartido (archivos o Redis) sin necesidad de borrar por patrón.
+"""
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+PREFIJO_ETIQUETA = 'etiqueta:'
+
+
+def _nueva_version():
+    return uuid.uuid4().hex[:12]
+
+
+def versiones(etiquetas):
+    """{etiqueta: versión}; las etiquetas sin versión se inicializan."""
+    claves = {f'{PREFIJO_ETIQUETA}{etiqueta}': etiqueta for etiqueta in etiquetas}
+    actuales = cache.get_many(list(claves))
+    faltantes = [clave for clave in claves if clave not in actuales]
+    if faltantes:
+        for clave in faltantes:
+            cache.add(clave, _nueva_version(), None)
+        actuales.update(cache.get_many(faltantes))
+    return {claves[clave]: version for clave, version in actuales.items()}
+
+
+def _clave(base, etiquetas, actuales):
+    firma = '|'.join(f'{etiqueta}={actuales.get(etiqueta, "")}' for etiqueta in sorted(set(etiquetas)))
+    return f'{base}:{hashlib.md5(firma.encode()).hexdigest()}'
+
+
+def clave_etiquetada(base, etiquetas):
+    """Clave de caché de `base` que cambia cuando se invalida alguna de `etiquetas`."""
+    return _clave(base, etiquetas, versiones(set(etiquetas)))
+
+
+def claves_etiquetadas(entradas):
+    """Como clave_etiquetada() para varias entradas ({base: etiquetas}) leyendo las versiones una sola vez."""
+    actuales = versiones({etiqueta for etiquetas in entradas.values() for etiqueta in etiquetas})
+    return {base: _clave(base, etiquetas, actuales) for base, etiquetas in entradas.items()}
+
+
+def obtener_o_calcular(base, etiquetas, calcular, timeout):
+    """Devuelve la entrada cacheada de `base` o la calcula con `calcular()` y la guarda."""
+    clave = clave_etiquetada(base, etiquetas)
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        cache.set(clave, valor, timeout)
+    return valor
+
+
+def invalidar(*etiquetas):
+    """Invalida todas las entradas asociadas a alguna de `etiquetas`."""
+    if etiquetas:
+        cache.set_many({f'{PREFIJO_ETIQUETA}{etiqueta}': _nueva_version() for etiqueta in etiquetas}, None)
+
+
+def invalidar_al_confirmar(*etiquetas):
+    """Como invalidar(), pero recién cuando se confirma la transacción en curso."""
+    if etiquetas:
+        transaction.on_commit(lambda: invalidar(*etiquetas), robust=True)
@@ -0,0 +1,172 @@
+"""
+Campos dinámicos para los GET de la API: ?fields= y ?expand=.
+
+  ?fields=id,fecha,platos.nombre    sólo esos campos. Los de un anidado se
+                                    piden con la ruta punteada; nombrar el
+                                    anidado o alguno de sus campos lo incluye.
+  ?expand=platos,platos.ingredientes
+                                    anidados a incluir. Si se pasa expand, los
+                                    anidados no nombrados se omiten; sin expand
+                                    se incluyen todos, como antes.
+
+Los anidados omitidos no se consultan: adaptar_queryset arma only(),
+select_related y prefetch a partir de los campos que quedan en el serializer.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+class Seleccion:
+    """Campos y anidados pedidos en un nivel del serializer (y sus hijos)."""
+
+    def __init__(self, con_expand):
+        self.con_expand = con_expand
+        self.campos = None                          # None = todos
+        self.expandir = set() if con_expand else None  # None = todos los anidados
+        self.hijos = {}
+
+    @classmethod
+    def desde_parametros(cls, fields=None, expand=None):
+        if fields is None and expand is None:
+            return None
+        raiz = cls(con_expand=expand is not None)
+        for ruta in _rutas(fields):
+            nodo = raiz
+            for parte in ruta:
+                if nodo.campos is None:
+                    nodo.campos = set()
+                nodo.campos.add(parte)
+                nodo = nodo.hijo(parte)
+        for ruta in _rutas(expand):
+            nodo = raiz
+            for parte in ruta:
+                nodo.expandir.add(parte)
+                nodo = nodo.hijo(parte)
+        return raiz
+
+    def hijo(self, nombre):
+        if nombre not in self.hijos:
+            self.hijos[nombre] = Seleccion(self.con_expand)
+        return self.hijos[nombre]
+
+    def incluye(self, nombre, anidado):
+        if anidado and self.expandir is not None and nombre in self.expandir:
+            return True
+        if self.campos is not None:
+            return nombre in self.campos
+        return not anidado or self.expandir is None
+
+    def clave(self):
+        """Representación canónica (para cachear lo que depende de la selección)."""
+        return (
+            None if self.campos is None else tuple(sorted(self.campos)),
+            None if self.expandir is None else tuple(sorted(self.expandir)),
+            tuple((nombre, hijo.clave()) for nombre, hijo in sorted(self.hijos.items())),
+        )
+
+
+def _rutas(parametro):
+    if parametro is None:
+        return []
+    return [tuple(ruta.strip().split('.')) for ruta in parametro.split(',') if ruta.strip()]
+
+
+def recortar(serializer, seleccion, ruta=''):
+    """Quita de `serializer` (y sus anidados) los campos no pedidos. Devuelve el serializer."""
+    destino = serializer.child if isinstance(serializer, ListSerializer) else serializer
+    campos = destino.fields
+    pedidos = (seleccion.campos or set()) | (seleccion.expandir or set()) | set(seleccion.hijos)
+    desconocidos = sorted(pedidos - set(campos))
+    no_anidados = sorted(
+        nombre for nombre in (seleccion.expandir or ())
+        if nombre in campos and not isinstance(campos[nombre], BaseSerializer)
+    )
+    if desconocidos or no_anidados:
+        errores = [f'Campo desconocido: {ruta}{nombre}' for nombre in desconocidos]
+        errores += [f'No es un anidado expandible: {ruta}{nombre}' for nombre in no_anidados]
+        raise ValidationError({'fields': errores})
+
+    for nombre, campo in list(campos.items()):
+        anidado = isinstance(campo, BaseSerializer)
+        if not seleccion.incluye(nombre, anidado):
+            del campos[nombre]
+        elif anidado:
+            recortar(campo, seleccion.hijos.get(nombre) or Seleccion(seleccion.con_expand), f'{ruta}{nombre}.')
+    return serializer
+
+
+def adaptar_queryset(queryset, serializer, extra=()):
+    """
+    only() / select_related / prefetch de `queryset` para leer exactamente los
+    campos de `serializer`. Si algún campo no se puede resolver a columnas
+    (métodos, propiedades) el queryset se devuelve sin cambios.
+    """
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    modelo = queryset.model
+    solo = {modelo._meta.pk.name, *extra}
+    relacionados = set()
+    prefetch = []
+    for campo in serializer.fields.values():
+        if campo.write_only:
+            continue
+        partes = campo.source.split('.')
+        if partes[0] in queryset.query.annotations:
+            continue
+        try:
+            field = modelo._meta.get_field(partes[0])
+        except FieldDoesNotExist:
+            return queryset
+        if field.one_to_many and (isinstance(campo, ListSerializer) or partes[1:] == ['count']):
+            hijos = field.related_model._default_manager.all()
+            fk = field.field.name
+            if isinstance(campo, ListSerializer):
+                hijos = adaptar_queryset(hijos, campo.child, extra=[fk])
+            else:
+                hijos = hijos.only(field.related_model._meta.pk.name, fk)
+            prefetch.append(Prefetch(field.name, queryset=hijos))
+        elif field.many_to_one and len(partes) <= 2:
+            solo.add(field.name)
+            if len(partes) == 2:
+                relacionados.add(field.name)
+                solo.add(f'{field.name}__{partes[1]}')
+        elif field.concrete and not field.is_relation and len(partes) == 1:
+            solo.add(field.name)
+        else:
+            return queryset
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if relacionados:
+        queryset = queryset.select_related(*relacionados)
+    return queryset.prefetch_related(*prefetch).only(*solo)
+
+
+class CamposDinamicosMixin:
+    """?fields= / ?expand= en list y retrieve de un ModelViewSet."""
+
+    acciones_campos_dinamicos = ('list', 'retrieve')
+
+    def get_seleccion(self):
+        if not hasattr(self, '_seleccion'):
+            self._seleccion = None
+            if getattr(self, 'action', None) in self.acciones_campos_dinamicos:
+                self._seleccion = Seleccion.desde_parametros(
+                    self.request.query_params.get('fields'),
+                    self.request.query_params.get('expand'),
+                )
+        return self._seleccion
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        seleccion = self.get_seleccion()
+        if seleccion is not None:
+            recortar(serializer, seleccion)
+        return serializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.get_seleccion() is not None:
+            queryset = adaptar_queryset(queryset, self.get_serializer())
+        return queryset
@@ -0,0 +1,149 @@
+"""
+Registro de consultas SQL por petición y detección de N+1.
+
+RegistroConsultas se engancha con execute_wrapper en todas las conexiones
+(no depende de DEBUG) y guarda cada sentencia con su duración. La huella de
+una consulta es su SQL normalizado (literales y listas IN colapsados): la
+misma huella de SELECT repetida muchas veces en una petición es el síntoma
+típico de un N+1.
+
+Para fijar presupuestos en tests:
+
+    with presupuesto_consultas(4):
+        client.get('/api/auditoria/visitas/1/')
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+UMBRAL_REPETIDAS = 5
+
+_IN = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.IGNORECASE)
+_VALUES = re.compile(r'(VALUES \([^)]*\))(?:, \([^)]*\))+', re.IGNORECASE)
+_CADENA = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r'\b\d+\b')
+
+
+def huella(sql):
+    """SQL normalizado: consultas con la misma forma y distintos valores comparten huella."""
+    sql = _CADENA.sub('?', sql)
+    sql = _NUMERO.sub('?', sql)
+    sql = _IN.sub('IN (...)', sql)
+    return _VALUES.sub(r'\1, ...', sql)
+
+
+class RegistroConsultas:
+    """Context manager que registra (sql, segundos) de cada sentencia ejecutada."""
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases
+        self.consultas = []
+
+    def __enter__(self):
+        self._pila = ExitStack()
+        for alias in self.aliases or connections:
+            self._pila.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc):
+        self._pila.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((sql, time.perf_counter() - inicio))
+
+    @property
+    def total(self):
+        return len(self.consultas)
+
+    @property
+    def segundos(self):
+        return sum(duracion for _, duracion in self.consultas)
+
+    def repetidas(self, umbral=UMBRAL_REPETIDAS):
+        """[(veces, huella)] de los SELECT que se repiten al menos `umbral` veces."""
+        conteo = Counter(
+            huella(sql) for sql, _ in self.consultas
+            if sql.lstrip()[:6].upper() == 'SELECT'
+        )
+        return [(veces, forma) for forma, veces in conteo.most_common() if veces >= umbral]
+
+    def resumen(self, limite=20):
+        lineas = [f'{self.total} consultas, {self.segundos * 1000:.1f} ms']
+        lineas += [f'  {veces}x {forma[:300]}' for veces, forma in self.repetidas()]
+        lineas += [f'  {sql[:300]}' for sql, _ in self.consultas[:limite]]
+        if self.total > limite:
+            lineas.append(f'  ... ({self.total - limite} más)')
+        return '\n'.join(lineas)
+
+
+@contextmanager
+def presupuesto_consultas(maximo, umbral_repetidas=None, aliases=None):
+    """
+    Falla (AssertionError) si el bloque ejecuta más de `maximo` consultas o, con
+    `umbral_repetidas`, si algún SELECT se repite esa cantidad de veces o más.
+    """
+    with RegistroConsultas(aliases) as registro:
+        yield registro
+    if registro.total > maximo:
+        raise AssertionError(f'Presupuesto de {maximo} consultas excedido: {registro.resumen()}')
+    if umbral_repetidas is not None and registro.repetidas(umbral_repetidas):
+        raise AssertionError(f'Consultas repetidas (posible N+1): {registro.resumen()}')
+
+
+class MetricasConsultas:
+    """Acumulado por vista de las peticiones instrumentadas (en memoria, por proceso)."""
+
+    MAX_HUELLAS = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vistas = {}
+
+    def registrar(self, vista, registro, repetidas, excedido):
+        with self._lock:
+            datos = self._vistas.setdefault(vista, {
+                'peticiones': 0,
+                'consultas': 0,
+                'consultas_max': 0,
+                'tiempo_db_ms': 0.0,
+                'peticiones_con_repetidas': 0,
+                'presupuesto_excedido': 0,
+                'repetidas': [],
+            })
+            datos['peticiones'] += 1
+            datos['consultas'] += registro.total
+            datos['consultas_max'] = max(datos['consultas_max'], registro.total)
+            datos['tiempo_db_ms'] += registro.segundos * 1000
+            datos['presupuesto_excedido'] += int(excedido)
+            if repetidas:
+                datos['peticiones_con_repetidas'] += 1
+                for _, forma in repetidas:
+                    if forma not in datos['repetidas'] and len(datos['repetidas']) < self.MAX_HUELLAS:
+                        datos['repetidas'].append(forma)
+
+    def obtener(self):
+        with self._lock:
+            resultado = []
+            for vista, datos in self._vistas.items():
+                fila = dict(datos, vista=vista, repetidas=list(datos['repetidas']))
+                fila['consultas_promedio'] = round(datos['consultas'] / datos['peticiones'], 2)
+                fila['tiempo_db_ms_promedio'] = round(datos['tiempo_db_ms'] / datos['peticiones'], 2)
+                fila['tiempo_db_ms'] = round(datos['tiempo_db_ms'], 2)
+                resultado.append(fila)
+        return sorted(resultado, key=lambda fila: -fila['consultas_promedio'])
+
+    def reiniciar(self):
+        with self._lock:
+            self._vistas.clear()
+
+
+metricas = MetricasConsultas()
@@ -0,0 +1,12 @@
+"""Estadística descriptiva sin dependencias (benchmark, tendencias de nutrientes)."""
+import math
+
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) con interpolación lineal entre los valores ordenados."""
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior, superior = math.floor(posicion), math.ceil(posicion)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
@@ -0,0 +1,54 @@
+import logging
+
+from django.conf import settings
+
+from .consultas import UMBRAL_REPETIDAS, RegistroConsultas, metricas
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConsultasMiddleware:
+    """
+    Con CONSULTAS_INSTRUMENTAR (por defecto, sólo con DEBUG) cuenta las
+    consultas y el tiempo de base de datos de cada petición, los acumula por
+    vista (core.consultas.metricas) y avisa en el log de posibles N+1 y de
+    presupuestos excedidos (CONSULTAS_PRESUPUESTOS = {vista: máximo}).
+    Con CONSULTAS_CABECERAS agrega X-DB-Queries, X-DB-Time-Ms y X-DB-Repeated.
+    Las respuestas en streaming sólo cuentan lo ejecutado antes de empezar a emitir.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.activo = getattr(settings, 'CONSULTAS_INSTRUMENTAR', settings.DEBUG)
+        self.cabeceras = getattr(settings, 'CONSULTAS_CABECERAS', settings.DEBUG)
+        self.umbral = getattr(settings, 'CONSULTAS_UMBRAL_REPETIDAS', UMBRAL_REPETIDAS)
+        self.presupuestos = getattr(settings, 'CONSULTAS_PRESUPUESTOS', {})
+
+    def __call__(self, request):
+        if not self.activo:
+            return self.get_response(request)
+
+        with RegistroConsultas() as registro:
+            response = self.get_response(request)
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        vista = resolver_match.view_name if resolver_match else 'sin_vista'
+        repetidas = registro.repetidas(self.umbral)
+        presupuesto = self.presupuestos.get(vista)
+        excedido = presupuesto is not None and registro.total > presupuesto
+        metricas.registrar(vista, registro, repetidas, excedido)
+
+        for veces, forma in repetidas:
+            logger.warning('Posible N+1 en %s %s: %d veces %s', request.method, vista, veces, forma[:500])
+        if excedido:
+            logger.warning(
+                'Presupuesto de consultas excedido en %s %s: %d > %d',
+                request.method, vista, registro.total, presupuesto,
+            )
+
+        if self.cabeceras:
+            response['X-DB-Queries'] = str(registro.total)
+            response['X-DB-Time-Ms'] = f'{registro.segundos * 1000:.1f}'
+            response['X-DB-Repeated'] = str(sum(veces for veces, _ in repetidas))
+        return response
@@ -0,0 +1,200 @@
+"""
+Paginación de los listados grandes.
+
+PaginacionKeyset se comporta como LimitOffsetPagination salvo que se pida
+el modo cursor con ?cursor= (vacío para la primera página). En ese modo la
+página siguiente se busca a partir de los valores de orden de la última
+fila (WHERE (fecha, id) < (...)) en lugar de un OFFSET, así que cualquier
+página cuesta lo mismo que la primera. Con ?contar=0 no se ejecuta el
+COUNT(*); en modo cursor el total sólo se calcula con ?contar=1.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+VALORES_FALSOS = ('0', 'false', 'no')
+
+
+class PaginacionKeyset(LimitOffsetPagination):
+    cursor_query_param = 'cursor'
+    contar_query_param = 'contar'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.modo_cursor = self.cursor_query_param in request.query_params
+        self.contar = self._contar(request)
+        if self.modo_cursor:
+            return self._paginar_cursor(queryset, request)
+        if self.contar:
+            return super().paginate_queryset(queryset, request, view)
+        return self._paginar_sin_total(queryset, request)
+
+    def get_paginated_response(self, data):
+        if not self.modo_cursor and self.contar:
+            return super().get_paginated_response(data)
+        respuesta = {}
+        if self.contar:
+            respuesta['count'] = self.count
+        respuesta['next'] = self.get_next_link()
+        respuesta['previous'] = self.get_previous_link()
+        respuesta['results'] = data
+        return Response(respuesta)
+
+    def get_next_link(self):
+        if not self.modo_cursor and self.contar:
+            return super().get_next_link()
+        if not self.hay_mas:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.modo_cursor:
+            return replace_query_param(url, self.cursor_query_param, self.siguiente)
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_previous_link(self):
+        # El modo cursor sólo avanza (como el feed de cambios)
+        if self.modo_cursor:
+            return None
+        return super().get_previous_link()
+
+    def _contar(self, request):
+        valor = request.query_params.get(self.contar_query_param)
+        if valor is None:
+            return not self.modo_cursor
+        return valor.lower() not in VALORES_FALSOS
+
+    def _paginar_sin_total(self, queryset, request):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.count = None
+        filas = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.hay_mas = len(filas) > self.limit
+        return filas[:self.limit]
+
+    def _paginar_cursor(self, queryset, request):
+        self.limit = self.get_limit(request) or self.default_limit
+        self.offset = 0
+        orden = self._orden(queryset)
+        if self.contar:
+            self.count = self.get_count(queryset)
+
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(self._posterior(orden, self._decodificar(cursor, orden)))
+        queryset = queryset.order_by(*(
+            F(campo.attname).desc(nulls_last=True) if descendente else F(campo.attname).asc(nulls_first=True)
+            for campo, descendente in orden
+        ))
+
+        filas = list(queryset[:self.limit + 1])
+        self.hay_mas = len(filas) > self.limit
+        filas = filas[:self.limit]
+        if filas:
+            ultima = filas[-1]
+            # Instancias o filas de values()
+            obtener = ultima.get if isinstance(ultima, dict) else (lambda nombre: getattr(ultima, nombre))
+            self.siguiente = self._codificar(orden, [obtener(campo.attname) for campo, _ in orden])
+        return filas
+
+    @staticmethod
+    def _orden(queryset):
+        """[(campo del modelo, descendente)] del orden del queryset, con la PK como desempate."""
+        modelo = queryset.model
+        nombres = list(queryset.query.order_by) or list(modelo._meta.ordering)
+        orden = []
+        for nombre in nombres:
+            if not isinstance(nombre, str):
+                raise ValidationError({'cursor': 'El orden de este listado no admite paginación por cursor.'})
+            descendente = nombre.startswith('-')
+            nombre = nombre.lstrip('-')
+            try:
+                campo = modelo._meta.pk if nombre == 'pk' else modelo._meta.get_field(nombre)
+            except FieldDoesNotExist:
+                raise ValidationError({'cursor': f'No se puede paginar por cursor ordenando por "{nombre}".'})
+            if not campo.concrete or (campo.is_relation and not campo.many_to_one):
+                raise ValidationError({'cursor': f'No se puede paginar por cursor ordenando por "{nombre}".'})
+            orden.append((campo, descendente))
+            if campo.primary_key:
+                return orden
+        orden.append((modelo._meta.pk, orden[0][1] if orden else False))
+        return orden
+
+    @staticmethod
+    def _posterior(orden, valores):
+        """
+        Filas que van después de `valores` en `orden`, comparando en forma
+        lexicográfica. Los NULL van primero en orden ascendente y últimos en
+        descendente, igual que el ORDER BY del modo cursor.
+        """
+        condicion = Q(pk__in=[])
+        previos = Q()
+        for (campo, descendente), valor in zip(orden, valores):
+            nombre = campo.attname
+            if valor is None:
+                # Después de un NULL: los no nulos si es ascendente; nada si es descendente
+                despues = None if descendente else Q(**{f'{nombre}__isnull': False})
+                igual = Q(**{f'{nombre}__isnull': True})
+            else:
+                despues = Q(**{f'{nombre}__{"lt" if descendente else "gt"}': valor})
+                if descendente and campo.null:
+                    despues |= Q(**{f'{nombre}__isnull': True})
+                igual = Q(**{nombre: valor})
+            if despues is not None:
+                condicion |= previos & despues
+            previos &= igual
+        return condicion
+
+    @staticmethod
+    def _firma(orden):
+        return [('-' if descendente else '') + campo.name for campo, descendente in orden]
+
+    @classmethod
+    def _codificar(cls, orden, valores):
+        payload = {'o': cls._firma(orden), 'v': valores}
+        texto = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(texto.encode()).decode()
+
+    @classmethod
+    def _decodificar(cls, cursor, orden):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if payload['o'] != cls._firma(orden) or len(payload['v']) != len(orden):
+                raise ValueError
+            return [
+                None if valor is None else campo.target_field.to_python(valor) if campo.is_relation
+                else campo.to_python(valor)
+                for (campo, _), valor in zip(orden, payload['v'])
+            ]
+        except (TypeError, ValueError, KeyError, AttributeError, DjangoValidationError):
+            raise ValidationError({'cursor': 'Cursor inválido.'})
+
+    def get_schema_operation_parameters(self, view):
+        parametros = super().get_schema_operation_parameters(view)
+        parametros += [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Paginación por cursor: vacío para la primera página, luego el valor de "next".',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.contar_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Incluir el total ("count"). Por defecto sí con offset y no con cursor.',
+                'schema': {'type': 'boolean'},
+            },
+        ]
+        return parametros
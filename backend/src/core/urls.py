@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ItemViewSet, UserViewSet, me
+from .views import ItemViewSet, UserViewSet, me, metricas_consultas
 
 router = DefaultRouter()
 router.register(r'items', ItemViewSet)
@@ -8,5 +8,6 @@ router.register(r'users', UserViewSet)
 
 urlpatterns = [
     path('me/', me, name='me'),
+    path('metricas/consultas/', metricas_consultas, name='metricas-consultas'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
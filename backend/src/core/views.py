@@ -1,8 +1,9 @@
-from rest_framework import viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth.models import User
+from .consultas import metricas
 from .models import Item
 from .serializers import ItemSerializer, UserSerializer
 
@@ -27,4 +28,13 @@ def me(request):
         'email': request.user.email,
         'first_name': request.user.first_name,
         'last_name': request.user.last_name,
-    })
\ No newline at end of file
+    })
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def metricas_consultas(request):
+    """Consultas y tiempo de base de datos por vista (de este proceso). DELETE reinicia."""
+    if request.method == 'DELETE':
+        metricas.reiniciar()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(metricas.obtener())
@@ -0,0 +1,130 @@
+"""
+Índice de búsqueda en memoria sobre el catálogo de alimentos (typeahead).
+
+Los nombres se normalizan sin acentos ni mayúsculas y se parten en palabras.
+Cada palabra de la consulta debe coincidir con alguna palabra del alimento:
+exacta, por prefijo (búsqueda binaria sobre la lista ordenada de palabras) o,
+si no hay resultados, por similitud de trigramas para tolerar errores de
+tipeo. El índice se reconstruye cuando cambia la versión del catálogo.
+"""
+import bisect
+import re
+import unicodedata
+from collections import defaultdict
+
+from .catalogo import DerivadoCatalogo
+from .models import AlimentoNutricional
+
+
+LIMITE_DEFAULT = 10
+LIMITE_MAX = 50
+SIMILITUD_MINIMA = 0.35
+
+_NO_ALFANUMERICO = re.compile(r'[^0-9a-z]+')
+
+
+def normalizar(texto):
+    """'Pollo, PECHUGA crudá' -> 'pollo pechuga cruda'"""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return _NO_ALFANUMERICO.sub(' ', texto).strip()
+
+
+def trigramas(palabra):
+    palabra = f'  {palabra} '
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+class IndiceAlimentos(DerivadoCatalogo):
+
+    def construir(self):
+        documentos = {}
+        palabras = set()
+        por_palabra = defaultdict(set)
+        for fila in (
+            AlimentoNutricional.objects
+            .values('id', 'codigo_argenfood', 'nombre', 'categoria_id', 'categoria__nombre')
+            .order_by('nombre')
+        ):
+            normalizado = normalizar(fila['nombre'])
+            fila['normalizado'] = normalizado
+            documentos[fila['id']] = fila
+            for palabra in normalizado.split() + [str(fila['codigo_argenfood'])]:
+                palabras.add(palabra)
+                por_palabra[palabra].add(fila['id'])
+
+        por_trigrama = defaultdict(set)
+        for palabra in palabras:
+            for trigrama in trigramas(palabra):
+                por_trigrama[trigrama].add(palabra)
+
+        return {
+            'documentos': documentos,
+            'palabras': sorted(palabras),
+            'por_palabra': dict(por_palabra),
+            'por_trigrama': dict(por_trigrama),
+        }
+
+    def buscar(self, consulta, limite=LIMITE_DEFAULT):
+        indice = self.estado()
+        terminos = normalizar(consulta).split()
+        if not terminos:
+            return []
+
+        puntajes = self._coincidencias(indice, terminos, difusa=False)
+        if not puntajes:
+            puntajes = self._coincidencias(indice, terminos, difusa=True)
+
+        frase = ' '.join(terminos)
+        documentos = indice['documentos']
+        resultados = []
+        for doc_id, puntaje in puntajes.items():
+            doc = documentos[doc_id]
+            if doc['normalizado'].startswith(frase):
+                puntaje += 2
+            resultados.append((-puntaje, len(doc['normalizado']), doc['normalizado'], doc_id))
+        resultados.sort()
+        return [documentos[doc_id] for _, _, _, doc_id in resultados[:limite]]
+
+    def _coincidencias(self, indice, terminos, difusa):
+        """{doc_id: puntaje} de los documentos que coinciden con todos los términos."""
+        total = None
+        for termino in terminos:
+            puntajes = {}
+            for palabra, puntaje in self._palabras_para(indice, termino, difusa):
+                for doc_id in indice['por_palabra'][palabra]:
+                    if puntaje > puntajes.get(doc_id, 0):
+                        puntajes[doc_id] = puntaje
+            if total is None:
+                total = puntajes
+            else:
+                total = {doc_id: total[doc_id] + p for doc_id, p in puntajes.items() if doc_id in total}
+            if not total:
+                return {}
+        return total
+
+    @staticmethod
+    def _palabras_para(indice, termino, difusa):
+        """(palabra del índice, puntaje) que coinciden con un término de la consulta."""
+        if not difusa:
+            palabras = indice['palabras']
+            inicio = bisect.bisect_left(palabras, termino)
+            for palabra in palabras[inicio:]:
+                if not palabra.startswith(termino):
+                    break
+                yield palabra, (3 if palabra == termino else 2)
+            return
+        if len(termino) < 3:
+            return
+        propios = trigramas(termino)
+        comunes = defaultdict(int)
+        for trigrama in propios:
+            for palabra in indice['por_trigrama'].get(trigrama, ()):
+                comunes[palabra] += 1
+        for palabra, n in comunes.items():
+            similitud = n / len(propios | trigramas(palabra))
+            if similitud >= SIMILITUD_MINIMA:
+                yield palabra, similitud
+
+
+indice_alimentos = IndiceAlimentos()
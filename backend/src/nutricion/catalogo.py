@@ -0,0 +1,81 @@
+"""
+Versión del catálogo de alimentos.
+
+La versión es la de la etiqueta de caché 'catalogo' (core.cache): la rotan las
+señales de CategoriaAlimento / AlimentoNutricional e importar_alimentos, y
+es compartida por todos los workers. Las estructuras en memoria derivadas del
+catálogo (índice de búsqueda, matriz de nutrientes) la consultan para saber
+si deben reconstruirse.
+"""
+import threading
+import time
+import weakref
+
+from django.db import transaction
+
+from core.cache import invalidar, invalidar_al_confirmar, versiones
+
+
+ETIQUETA = 'catalogo'
+
+# Cada cuánto (segundos) una estructura en memoria vuelve a consultar la versión
+INTERVALO_VERIFICACION = 2.0
+
+
+def version():
+    return versiones([ETIQUETA])[ETIQUETA]
+
+
+def cambio():
+    """Marca el catálogo como modificado (al confirmar la transacción en curso)."""
+    invalidar_al_confirmar(ETIQUETA)
+    # Este proceso no espera INTERVALO_VERIFICACION para ver su propio cambio
+    transaction.on_commit(DerivadoCatalogo.verificar_todos, robust=True)
+
+
+def cambio_inmediato():
+    invalidar(ETIQUETA)
+    DerivadoCatalogo.verificar_todos()
+
+
+class DerivadoCatalogo:
+    """
+    Estructura en memoria construida a partir del catálogo y reconstruida
+    cuando cambia su versión. Las subclases implementan construir(), que
+    devuelve el estado nuevo; se reemplaza de una vez, así que los lectores
+    nunca ven un estado a medio armar.
+    """
+
+    _instancias = weakref.WeakSet()
+
+    def __init__(self):
+        self._estado = None
+        self._version = None
+        self._verificado = 0.0
+        self._lock = threading.Lock()
+        DerivadoCatalogo._instancias.add(self)
+
+    @classmethod
+    def verificar_todos(cls):
+        """Fuerza a todas las estructuras del proceso a consultar la versión en su próximo uso."""
+        for instancia in list(cls._instancias):
+            instancia._verificado = 0.0
+
+    def construir(self):
+        raise NotImplementedError
+
+    def estado(self):
+        ahora = time.monotonic()
+        if self._estado is not None and ahora - self._verificado < INTERVALO_VERIFICACION:
+            return self._estado
+        actual = version()
+        if self._estado is None or actual != self._version:
+            with self._lock:
+                if self._estado is None or actual != self._version:
+                    self._estado = self.construir()
+                    self._version = actual
+        self._verificado = ahora
+        return self._estado
+
+    def invalidar_local(self):
+        self._estado = None
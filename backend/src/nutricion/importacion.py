@@ -0,0 +1,240 @@
+"""
+Importación incremental del catálogo de alimentos.
+
+Los lectores recorren el archivo de a un registro (arreglo JSON, NDJSON o
+CSV) sin cargarlo entero en memoria. ImportadorAlimentos compara cada lote
+con las filas existentes por codigo_argenfood y sólo escribe las que
+cambiaron: bulk_create para las nuevas y bulk_update con los campos
+modificados para las existentes.
+"""
+import csv
+import json
+import os
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+from .models import CategoriaAlimento, AlimentoNutricional
+
+
+CATEGORIA_CODIGOS = {
+    "Cereales y derivados": "CER",
+    "Vegetales y derivados": "VEG",
+    "Frutas y derivados": "FRT",
+    "Carnes y derivados": "CAR",
+    "Pescados y mariscos": "PES",
+    "Leche y derivados": "LAC",
+    "Grasas y aceites": "GRA",
+    "Productos azucarados": "AZU",
+    "Misceláneos": "MISC",
+    "Huevo": "HUE",
+}
+
+FORMATOS = ("json", "ndjson", "csv")
+
+TAMANO_BLOQUE = 64 * 1024
+
+
+class ErrorImportacion(Exception):
+    pass
+
+
+def detectar_formato(ruta):
+    extension = os.path.splitext(ruta)[1].lower().lstrip(".")
+    if extension in ("ndjson", "jsonl"):
+        return "ndjson"
+    if extension == "csv":
+        return "csv"
+    return "json"
+
+
+def leer_json(archivo):
+    """Registros de un arreglo JSON, decodificados de a uno con raw_decode."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    posicion = 0
+    dentro = False
+    fin_archivo = False
+
+    def completar():
+        nonlocal buffer, posicion, fin_archivo
+        bloque = archivo.read(TAMANO_BLOQUE)
+        if not bloque:
+            fin_archivo = True
+        buffer = buffer[posicion:] + bloque
+        posicion = 0
+
+    while True:
+        # Saltar espacios y separadores
+        while True:
+            while posicion < len(buffer) and buffer[posicion] in " \t\r\n,":
+                posicion += 1
+            if posicion < len(buffer) or fin_archivo:
+                break
+            completar()
+
+        if posicion >= len(buffer):
+            if dentro:
+                raise ErrorImportacion("JSON truncado: falta ']'")
+            raise ErrorImportacion("El JSON debe ser una lista de objetos (alimentos).")
+
+        caracter = buffer[posicion]
+        if not dentro:
+            if caracter != "[":
+                raise ErrorImportacion("El JSON debe ser una lista de objetos (alimentos).")
+            dentro = True
+            posicion += 1
+            continue
+        if caracter == "]":
+            return
+
+        while True:
+            try:
+                item, fin = decoder.raw_decode(buffer, posicion)
+                break
+            except json.JSONDecodeError as e:
+                if fin_archivo:
+                    raise ErrorImportacion(f"Error al parsear JSON: {e}")
+                completar()
+        posicion = fin
+        yield item
+
+
+def leer_ndjson(archivo):
+    for numero, linea in enumerate(archivo, start=1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            yield json.loads(linea)
+        except json.JSONDecodeError as e:
+            raise ErrorImportacion(f"Línea {numero}: JSON inválido: {e}")
+
+
+def leer_csv(archivo):
+    for fila in csv.DictReader(archivo):
+        # Celdas vacías = sin dato
+        yield {clave: (valor if valor != "" else None) for clave, valor in fila.items()}
+
+
+LECTORES = {"json": leer_json, "ndjson": leer_ndjson, "csv": leer_csv}
+
+
+class ImportadorAlimentos:
+    """
+    Upsert por lotes de alimentos identificados por codigo_argenfood.
+
+    importar() es un generador: emite un dict de progreso por lote. Al
+    terminar, `cambiados` tiene los ids de los alimentos insertados o
+    modificados (para recalcular sólo los platos que los usan).
+    """
+
+    def __init__(self, batch_size=500, dry_run=False, log=None):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.log = log or (lambda mensaje: None)
+        self.campos = [
+            f for f in AlimentoNutricional._meta.concrete_fields
+            if not f.primary_key and f.name not in ("codigo_argenfood", "categoria")
+        ]
+        self.categorias = {c.nombre: c for c in CategoriaAlimento.objects.all()}
+        self.cambiados = set()
+        self.progreso = {"leidos": 0, "insertados": 0, "actualizados": 0, "sin_cambios": 0}
+
+    def importar(self, items):
+        lote = []
+        for item in items:
+            lote.append(item)
+            if len(lote) >= self.batch_size:
+                self._procesar(lote)
+                lote = []
+                yield dict(self.progreso)
+        if lote:
+            self._procesar(lote)
+            yield dict(self.progreso)
+
+    def _categoria(self, nombre):
+        categoria = self.categorias.get(nombre)
+        if categoria is None:
+            codigo = CATEGORIA_CODIGOS.get(nombre, nombre[:4].upper().replace(" ", "_"))
+            categoria = CategoriaAlimento(codigo=codigo, nombre=nombre)
+            if not self.dry_run:
+                categoria.save()
+            self.categorias[nombre] = categoria
+            self.log(f"  Categoría creada: {nombre} ({codigo})")
+        return categoria
+
+    def _valores(self, item):
+        """{campo: valor normalizado} de un registro del archivo."""
+        if not isinstance(item, dict):
+            raise ErrorImportacion(f"Registro inválido (se esperaba un objeto): {item!r}")
+        if not item.get("categoria"):
+            raise ErrorImportacion(f"Registro sin 'categoria': {item}")
+        try:
+            valores = {"codigo_argenfood": int(item["codigo_argenfood"])}
+        except (KeyError, TypeError, ValueError):
+            raise ErrorImportacion(f"Registro sin 'codigo_argenfood' válido: {item}")
+        for campo in self.campos:
+            valor = item.get(campo.name)
+            if campo.name == "unidad_base":
+                valor = valor or "100 g"
+            elif campo.name == "especie":
+                valor = valor or None
+            try:
+                valor = campo.to_python(valor)
+            except ValidationError as e:
+                raise ErrorImportacion(f"codigo_argenfood {valores['codigo_argenfood']}, {campo.name}: {e.messages[0]}")
+            if isinstance(campo, models.DecimalField) and valor is not None:
+                # Mismo redondeo que la columna, para comparar contra lo almacenado
+                valor = valor.quantize(Decimal(1).scaleb(-campo.decimal_places))
+            valores[campo.attname] = valor
+        valores["categoria"] = item["categoria"]
+        return valores
+
+    def _procesar(self, items):
+        nuevos = {}
+        for item in items:
+            valores = self._valores(item)
+            # Un código repetido en el archivo: gana el último
+            nuevos[valores["codigo_argenfood"]] = valores
+        self.progreso["leidos"] += len(items)
+
+        existentes = AlimentoNutricional.objects.in_bulk(list(nuevos), field_name="codigo_argenfood")
+        crear, actualizar, campos_actualizados = [], [], set()
+        for codigo, valores in nuevos.items():
+            categoria = self._categoria(valores.pop("categoria"))
+            actual = existentes.get(codigo)
+            if actual is None:
+                crear.append(AlimentoNutricional(categoria=categoria, **valores))
+                continue
+            distintos = [
+                campo for campo, valor in valores.items()
+                if getattr(actual, campo) != valor
+            ]
+            if actual.categoria_id != categoria.pk:
+                actual.categoria = categoria
+                distintos.append("categoria")
+            if not distintos:
+                self.progreso["sin_cambios"] += 1
+                continue
+            for campo in distintos:
+                if campo != "categoria":
+                    setattr(actual, campo, valores[campo])
+            actualizar.append(actual)
+            campos_actualizados.update(distintos)
+
+        if not self.dry_run:
+            if crear:
+                AlimentoNutricional.objects.bulk_create(crear, batch_size=self.batch_size)
+                creados = AlimentoNutricional.objects.filter(
+                    codigo_argenfood__in=[a.codigo_argenfood for a in crear]
+                ).values_list("id", flat=True)
+                self.cambiados.update(creados)
+            if actualizar:
+                AlimentoNutricional.objects.bulk_update(
+                    actualizar, sorted(campos_actualizados), batch_size=self.batch_size
+                )
+        self.cambiados.update(a.pk for a in actualizar)
+        self.progreso["insertados"] += len(crear)
+        self.progreso["actualizados"] += len(actualizar)
@@ -1,136 +1,104 @@
-import json
 import os
+import time
+
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from nutricion.models import CategoriaAlimento, AlimentoNutricional
 
-
-CATEGORIA_CODIGOS = {
-    "Cereales y derivados": "CER",
-    "Vegetales y derivados": "VEG",
-    "Frutas y derivados": "FRT",
-    "Carnes y derivados": "CAR",
-    "Pescados y mariscos": "PES",
-    "Leche y derivados": "LAC",
-    "Grasas y aceites": "GRA",
-    "Productos azucarados": "AZU",
-    "Misceláneos": "MISC",
-    "Huevo": "HUE",
-}
+from nutricion import catalogo
+from nutricion.importacion import FORMATOS, LECTORES, ErrorImportacion, ImportadorAlimentos, detectar_formato
+from nutricion.models import CategoriaAlimento, AlimentoNutricional
 
 
 class Command(BaseCommand):
-    help = "Importa el catálogo de alimentos nutricionales desde un archivo JSON"
+    help = (
+        "Importa el catálogo de alimentos nutricionales desde un archivo JSON, NDJSON o CSV. "
+        "Lee el archivo en streaming y hace upsert por codigo_argenfood: sólo se escriben "
+        "los alimentos nuevos o modificados"
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
             "--file",
             type=str,
             default="data/alimentos_argenfood_ejemplo.json",
-            help="Ruta al archivo JSON de alimentos",
+            help="Ruta al archivo de alimentos",
+        )
+        parser.add_argument(
+            "--formato",
+            choices=FORMATOS,
+            help="Formato del archivo (por defecto según la extensión)",
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="Registros por lote")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="No escribe nada; informa cuántos alimentos cambiarían",
+        )
+        parser.add_argument(
+            "--ids-cambiados",
+            type=str,
+            help="Archivo donde escribir los IDs de alimentos insertados/modificados "
+                 "(uno por línea; sirve para recalcular_totales --alimentos-archivo)",
         )
         parser.add_argument(
             "--truncate",
             action="store_true",
-            help="Borra los alimentos existentes antes de importar",
+            help="Borra los alimentos existentes antes de importar (falla si hay ingredientes que los usan)",
         )
 
     def handle(self, *args, **options):
         file_path = options["file"]
-        truncate = options["truncate"]
+        formato = options["formato"] or detectar_formato(file_path)
 
         if not os.path.exists(file_path):
-            raise CommandError(f"Archivo JSON no encontrado: {file_path}")
-
-        self.stdout.write(self.style.NOTICE(f"Usando archivo: {file_path}"))
-
-        with open(file_path, encoding="utf-8") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError as e:
-                raise CommandError(f"Error al parsear JSON: {e}")
-
-        if not isinstance(data, list):
-            raise CommandError("El JSON debe ser una lista de objetos (alimentos).")
-
-        with transaction.atomic():
-            if truncate:
-                self.stdout.write("Borrando alimentos existentes...")
-                AlimentoNutricional.objects.all().delete()
-                CategoriaAlimento.objects.all().delete()
-
-            categorias_map = {c.nombre: c for c in CategoriaAlimento.objects.all()}
-
-            def get_or_create_categoria(nombre_cat: str) -> CategoriaAlimento:
-                cat = categorias_map.get(nombre_cat)
-                if cat:
-                    return cat
-
-                codigo = CATEGORIA_CODIGOS.get(
-                    nombre_cat,
-                    nombre_cat[:4].upper().replace(" ", "_"),
-                )
-                cat = CategoriaAlimento.objects.create(
-                    codigo=codigo,
-                    nombre=nombre_cat,
+            raise CommandError(f"Archivo no encontrado: {file_path}")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size debe ser mayor a 0")
+
+        self.stdout.write(self.style.NOTICE(f"Usando archivo: {file_path} ({formato})"))
+        if options["dry_run"]:
+            self.stdout.write(self.style.NOTICE("Modo dry-run: no se guardarán cambios"))
+
+        inicio = time.monotonic()
+        try:
+            with transaction.atomic():
+                if options["truncate"] and not options["dry_run"]:
+                    self.stdout.write("Borrando alimentos existentes...")
+                    AlimentoNutricional.objects.all().delete()
+                    CategoriaAlimento.objects.all().delete()
+
+                importador = ImportadorAlimentos(
+                    batch_size=options["batch_size"],
+                    dry_run=options["dry_run"],
+                    log=self.stdout.write,
                 )
-                categorias_map[nombre_cat] = cat
-                self.stdout.write(f"  Categoría creada: {nombre_cat} ({codigo})")
-                return cat
-
-            objetos = []
-            for item in data:
-                nombre_cat = item.get("categoria")
-                if not nombre_cat:
-                    raise CommandError(f"Registro sin 'categoria': {item}")
-
-                categoria = get_or_create_categoria(nombre_cat)
-
-                objetos.append(
-                    AlimentoNutricional(
-                        codigo_argenfood=item["codigo_argenfood"],
-                        nombre=item["nombre"],
-                        especie=item.get("especie") or None,
-                        unidad_base=item.get("unidad_base") or "100 g",
-                        categoria=categoria,
-                        energia_kj=item.get("energia_kj"),
-                        energia_kcal=item.get("energia_kcal"),
-                        agua_g=item.get("agua_g"),
-                        proteinas_g=item.get("proteinas_g"),
-                        grasas_totales_g=item.get("grasas_totales_g"),
-                        carbohidratos_totales_g=item.get("carbohidratos_totales_g"),
-                        carbohidratos_disponibles_g=item.get("carbohidratos_disponibles_g"),
-                        fibra_g=item.get("fibra_g"),
-                        cenizas_g=item.get("cenizas_g"),
-                        sodio_mg=item.get("sodio_mg"),
-                        potasio_mg=item.get("potasio_mg"),
-                        calcio_mg=item.get("calcio_mg"),
-                        fosforo_mg=item.get("fosforo_mg"),
-                        hierro_mg=item.get("hierro_mg"),
-                        zinc_mg=item.get("zinc_mg"),
-                        tiamina_mg=item.get("tiamina_mg"),
-                        riboflavina_mg=item.get("riboflavina_mg"),
-                        niacina_mg=item.get("niacina_mg"),
-                        vitamina_c_mg=item.get("vitamina_c_mg"),
-                        grasas_saturadas_g=item.get("grasas_saturadas_g"),
-                        grasas_monoinsat_g=item.get("grasas_monoinsat_g"),
-                        grasas_poliinsat_g=item.get("grasas_poliinsat_g"),
-                        colesterol_mg=item.get("colesterol_mg"),
-                        ag_c14_0_g=item.get("ag_c14_0_g"),
-                        ag_c16_0_g=item.get("ag_c16_0_g"),
-                        ag_c18_0_g=item.get("ag_c18_0_g"),
-                        ag_c18_1w9_g=item.get("ag_c18_1w9_g"),
-                        ag_c18_2w6_g=item.get("ag_c18_2w6_g"),
-                        ag_c18_3w3_g=item.get("ag_c18_3w3_g"),
-                        ag_epa_g=item.get("ag_epa_g"),
-                        ag_dha_g=item.get("ag_dha_g"),
-                        fuente=item.get("fuente"),
-                    )
-                )
-
-            self.stdout.write(f"Importando {len(objetos)} alimentos...")
-            AlimentoNutricional.objects.bulk_create(objetos, batch_size=500)
-
-        self.stdout.write(self.style.SUCCESS("✓ Importación completada con éxito."))
+                with open(file_path, encoding="utf-8", newline="") as f:
+                    for progreso in importador.importar(LECTORES[formato](f)):
+                        self.stdout.write(
+                            f"  Leídos: {progreso['leidos']} "
+                            f"(nuevos: {progreso['insertados']}, modificados: {progreso['actualizados']})"
+                        )
+
+                if importador.cambiados and not options["dry_run"]:
+                    # bulk_create/bulk_update no emiten señales
+                    catalogo.cambio()
+        except ErrorImportacion as e:
+            raise CommandError(str(e))
+
+        if options["ids_cambiados"] and not options["dry_run"]:
+            with open(options["ids_cambiados"], "w", encoding="utf-8") as f:
+                f.writelines(f"{alimento_id}\n" for alimento_id in sorted(importador.cambiados))
+
+        progreso = importador.progreso
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Importación completada en {time.monotonic() - inicio:.1f}s: "
+            f"{progreso['insertados']} insertados, {progreso['actualizados']} actualizados, "
+            f"{progreso['sin_cambios']} sin cambios"
+        ))
+        if importador.cambiados and not options["dry_run"]:
+            self.stdout.write(
+                "  Para actualizar los platos que usan estos alimentos: "
+                "python manage.py recalcular_totales --alimentos-archivo <ids-cambiados>"
+            )
         self.stdout.write(f"  Categorías: {CategoriaAlimento.objects.count()}")
         self.stdout.write(f"  Alimentos: {AlimentoNutricional.objects.count()}")
@@ -0,0 +1,139 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auditoria import argumentos
+from auditoria.models import PlatoObservado, PlatoPlantilla, IngredientePlato, IngredientePlantilla
+from auditoria.recalculo import RecalculoTotales
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula aportes de ingredientes y totales de platos observados / plantilla "
+        "por lotes (p. ej. después de actualizar el catálogo con importar_alimentos)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--modelo",
+            choices=["todos", "platos", "plantillas"],
+            help="Qué platos recalcular (por defecto todos, o sólo platos con --institucion/--fecha-*)",
+        )
+        parser.add_argument(
+            "--alimentos",
+            type=str,
+            help="IDs de alimentos separados por coma: sólo platos que los usan",
+        )
+        parser.add_argument(
+            "--alimentos-archivo",
+            type=str,
+            help="Archivo con IDs de alimentos (uno por línea), p. ej. la salida de importar_alimentos",
+        )
+        parser.add_argument("--institucion", type=int, help="Sólo platos de visitas de esta institución")
+        parser.add_argument("--fecha-desde", type=str, help="Sólo platos de visitas desde esta fecha (YYYY-MM-DD)")
+        parser.add_argument("--fecha-hasta", type=str, help="Sólo platos de visitas hasta esta fecha (YYYY-MM-DD)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Platos por lote")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="No escribe nada; informa qué platos cambiarían",
+        )
+        parser.add_argument(
+            "--mostrar",
+            type=int,
+            default=20,
+            help="Cantidad máxima de diferencias a detallar",
+        )
+
+    def handle(self, *args, **options):
+        alimento_ids = self._alimento_ids(options)
+        fecha_desde, fecha_hasta = self._fechas(options)
+        modelo = self._modelo(options, fecha_desde or fecha_hasta)
+        recalculo = RecalculoTotales(
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            max_diferencias=options["mostrar"],
+        )
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.NOTICE("Modo dry-run: no se guardarán cambios"))
+
+        inicio = time.monotonic()
+        if modelo in ("todos", "platos"):
+            platos = PlatoObservado.objects.all()
+            if alimento_ids is not None:
+                platos = platos.filter(
+                    id__in=IngredientePlato.objects.filter(alimento_id__in=alimento_ids).values("plato_id")
+                )
+            if options["institucion"]:
+                platos = platos.filter(visita__institucion_id=options["institucion"])
+            if fecha_desde:
+                platos = platos.filter(visita__fecha__gte=fecha_desde)
+            if fecha_hasta:
+                platos = platos.filter(visita__fecha__lte=fecha_hasta)
+            self._ejecutar(recalculo.recalcular_platos(platos), inicio)
+
+        if modelo in ("todos", "plantillas"):
+            plantillas = PlatoPlantilla.objects.all()
+            if alimento_ids is not None:
+                plantillas = plantillas.filter(
+                    id__in=IngredientePlantilla.objects.filter(alimento_id__in=alimento_ids).values("plato_plantilla_id")
+                )
+            self._ejecutar(recalculo.recalcular_plantillas(plantillas), inicio)
+
+        for modelo, pk, nombre, cambios in recalculo.diferencias:
+            self.stdout.write(f"  {modelo} #{pk} {nombre}")
+            for campo, (antes, despues) in cambios.items():
+                self.stdout.write(f"      {campo}: {antes} -> {despues}")
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Recálculo completado en {time.monotonic() - inicio:.1f}s"))
+
+    def _ejecutar(self, lotes, inicio):
+        progreso = None
+        for progreso in lotes:
+            detalle = f"  {progreso['modelo']}: {progreso['procesados']}/{progreso['total']}"
+            detalle += f" (cambiados: {progreso['cambiados']}"
+            if "ingredientes_cambiados" in progreso:
+                detalle += f", ingredientes cambiados: {progreso['ingredientes_cambiados']}"
+            detalle += f") {time.monotonic() - inicio:.1f}s"
+            self.stdout.write(detalle)
+        if progreso is None:
+            self.stdout.write("  Nada para recalcular")
+
+    def _modelo(self, options, hay_fechas):
+        # Institución y fechas son de la visita: las plantillas no tienen y se recalcularían todas
+        if not (options["institucion"] or hay_fechas):
+            return options["modelo"] or "todos"
+        if options["modelo"] in ("todos", "plantillas"):
+            raise CommandError(
+                "--institucion, --fecha-desde y --fecha-hasta sólo filtran platos observados: "
+                "usar --modelo platos"
+            )
+        return "platos"
+
+    def _fechas(self, options):
+        try:
+            fechas = [argumentos.fecha(options[opcion]) if options[opcion] else None
+                      for opcion in ("fecha_desde", "fecha_hasta")]
+        except ValueError as e:
+            raise CommandError(str(e))
+        if all(fechas) and fechas[0] > fechas[1]:
+            raise CommandError("--fecha-desde no puede ser posterior a --fecha-hasta")
+        return fechas
+
+    def _alimento_ids(self, options):
+        valores = []
+        if options["alimentos"]:
+            valores += options["alimentos"].split(",")
+        if options["alimentos_archivo"]:
+            try:
+                with open(options["alimentos_archivo"], encoding="utf-8") as f:
+                    valores += f.read().split()
+            except OSError as e:
+                raise CommandError(f"No se pudo leer {options['alimentos_archivo']}: {e}")
+        if not options["alimentos"] and not options["alimentos_archivo"]:
+            return None
+        try:
+            return {int(v) for v in valores if v.strip()}
+        except ValueError:
+            raise CommandError("Los IDs de alimentos deben ser enteros")
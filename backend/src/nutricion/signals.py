@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+
+from . import catalogo
+from .models import CategoriaAlimento, AlimentoNutricional
+
+
+def invalidar_catalogo(sender, **kwargs):
+    """Cualquier cambio en el catálogo rota su versión (búsquedas cacheadas, índice en memoria)."""
+    catalogo.cambio()
+
+
+for _modelo in (CategoriaAlimento, AlimentoNutricional):
+    post_save.connect(invalidar_catalogo, sender=_modelo, dispatch_uid=f'catalogo_{_modelo.__name__}')
+    post_delete.connect(invalidar_catalogo, sender=_modelo, dispatch_uid=f'catalogo_borrado_{_modelo.__name__}')
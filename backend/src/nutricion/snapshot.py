@@ -0,0 +1,85 @@
+"""
+Snapshot completo del catálogo para clientes offline.
+
+Se arma una vez por versión del catálogo (ver catalogo.py): JSON columnar
+({"campos": [...], "alimentos": [[...], ...]}) con los mismos valores que
+AlimentoNutricionalSerializer, más sus versiones gzip y brotli (si el paquete
+`brotli` está instalado). El ETag es el hash del JSON, así que no cambia
+mientras el contenido no cambie.
+"""
+import gzip
+import hashlib
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .catalogo import DerivadoCatalogo
+from .models import CategoriaAlimento, AlimentoNutricional
+from .serializers import AlimentoNutricionalSerializer, CategoriaAlimentoSerializer
+
+try:
+    import brotli
+except ImportError:  # opcional
+    brotli = None
+
+
+class SnapshotCatalogo(DerivadoCatalogo):
+
+    def construir(self):
+        alimentos = AlimentoNutricionalSerializer(
+            AlimentoNutricional.objects.select_related('categoria').order_by('id'), many=True
+        ).data
+        campos = list(AlimentoNutricionalSerializer().fields)
+        contenido = {
+            'campos': campos,
+            'alimentos': [[fila[campo] for campo in campos] for fila in alimentos],
+            'categorias': CategoriaAlimentoSerializer(CategoriaAlimento.objects.order_by('id'), many=True).data,
+        }
+        cuerpo = json.dumps(contenido, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        huella = hashlib.sha256(cuerpo).hexdigest()[:32]
+        codificaciones = {'identity': cuerpo, 'gzip': gzip.compress(cuerpo, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            codificaciones['br'] = brotli.compress(cuerpo)
+        return {'huella': huella, 'codificaciones': codificaciones}
+
+    @staticmethod
+    def etag(huella, codificacion):
+        # Cada codificación es una representación distinta: ETag fuerte propio
+        return f'"{huella}"' if codificacion == 'identity' else f'"{huella}-{codificacion}"'
+
+    @staticmethod
+    def elegir_codificacion(accept_encoding, disponibles):
+        """Mejor codificación disponible según Accept-Encoding (br > gzip > identity)."""
+        aceptadas = {}
+        for parte in (accept_encoding or '').split(','):
+            nombre, _, parametros = parte.strip().partition(';')
+            calidad = 1.0
+            if parametros.strip().startswith('q='):
+                try:
+                    calidad = float(parametros.strip()[2:])
+                except ValueError:
+                    calidad = 0.0
+            if nombre:
+                aceptadas[nombre.lower()] = calidad
+        for codificacion in ('br', 'gzip'):
+            if codificacion in disponibles and aceptadas.get(codificacion, aceptadas.get('*', 0)) > 0:
+                return codificacion
+        return 'identity'
+
+    @staticmethod
+    def coincide(if_none_match, huella):
+        """If-None-Match contra cualquier representación del mismo contenido."""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        for etiqueta in if_none_match.split(','):
+            etiqueta = etiqueta.strip()
+            if etiqueta.startswith('W/'):
+                etiqueta = etiqueta[2:]
+            if etiqueta.strip('"').split('-')[0] == huella:
+                return True
+        return False
+
+
+snapshot_catalogo = SnapshotCatalogo()
@@ -1,7 +1,16 @@
 from rest_framework import viewsets, filters
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import urlencode
+from core.cache import clave_etiquetada
+from core.paginacion import PaginacionKeyset
+from . import catalogo
+from .busqueda import LIMITE_DEFAULT, LIMITE_MAX, indice_alimentos
+from .snapshot import snapshot_catalogo
 from .models import CategoriaAlimento, AlimentoNutricional
 from .serializers import (
     CategoriaAlimentoSerializer,
@@ -17,6 +26,7 @@ class CategoriaAlimentoViewSet(viewsets.ModelViewSet):
 
 class AlimentoNutricionalViewSet(viewsets.ModelViewSet):
     queryset = AlimentoNutricional.objects.select_related('categoria').all()
+    pagination_class = PaginacionKeyset
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['categoria']
     search_fields = ['nombre', 'codigo_argenfood']
@@ -27,7 +37,11 @@ class AlimentoNutricionalViewSet(viewsets.ModelViewSet):
         search = request.query_params.get('search', '')
         
         if search and len(search) > 2:
-            cache_key = f'alimentos_search_{search[:50]}'
+            # Misma clave para "pollo", "Pollo " y "pollo,": SearchFilter los trata igual
+            terminos = ' '.join(filters.SearchFilter().get_search_terms(request)).lower()
+            # Cada página (limit/offset/cursor) y filtro es una entrada distinta
+            resto = urlencode(sorted((k, v) for k, v in request.query_params.items() if k != 'search'))
+            cache_key = clave_etiquetada(f'alimentos_search_{terminos[:50]}_{resto}', [catalogo.ETIQUETA])
             cached = cache.get(cache_key)
             
             if cached:
@@ -39,6 +53,51 @@ class AlimentoNutricionalViewSet(viewsets.ModelViewSet):
         
         return super().list(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'])
+    def buscar(self, request):
+        """
+        Typeahead: búsqueda sin acentos ni mayúsculas, por prefijo de palabra y
+        tolerante a errores de tipeo, sobre un índice en memoria. ?q=...&limit=10
+        """
+        try:
+            limite = min(int(request.query_params.get('limit', LIMITE_DEFAULT)), LIMITE_MAX)
+        except ValueError:
+            limite = LIMITE_DEFAULT
+        resultados = indice_alimentos.buscar(request.query_params.get('q', ''), max(limite, 1))
+        return Response([
+            {
+                'id': doc['id'],
+                'codigo_argenfood': doc['codigo_argenfood'],
+                'nombre': doc['nombre'],
+                'categoria': doc['categoria_id'],
+                'categoria_nombre': doc['categoria__nombre'],
+            }
+            for doc in resultados
+        ])
+
+    @action(detail=False, methods=['get'])
+    def snapshot(self, request):
+        """
+        Catálogo completo en un solo artefacto precomprimido, versionado por
+        ETag. Con If-None-Match de la versión vigente responde 304 sin cuerpo.
+        """
+        artefacto = snapshot_catalogo.estado()
+        huella = artefacto['huella']
+        codificacion = snapshot_catalogo.elegir_codificacion(
+            request.META.get('HTTP_ACCEPT_ENCODING'), artefacto['codificaciones']
+        )
+
+        if snapshot_catalogo.coincide(request.META.get('HTTP_IF_NONE_MATCH'), huella):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(artefacto['codificaciones'][codificacion], content_type='application/json')
+            if codificacion != 'identity':
+                response['Content-Encoding'] = codificacion
+        response['ETag'] = snapshot_catalogo.etag(huella, codificacion)
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
     def get_serializer_class(self):
         if self.action == 'list':
             return AlimentoNutricionalListSerializer